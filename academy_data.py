@@ -1,8 +1,14 @@
 # --- CSS STYLING ---
-APP_STYLE = """
+# Web fonts are opt-in (FONT_STYLE, OPSTRUCT_WEB_FONTS=1): the stacks below fall back to
+# local system fonts, so a render never waits on fonts.googleapis.com.
+FONT_STYLE = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;600&family=JetBrains+Mono:wght@400;700&display=swap');
-    html, body, [class*="css"] { font-family: 'Inter', sans-serif; }
+</style>
+"""
+APP_STYLE = """
+<style>
+    html, body, [class*="css"] { font-family: 'Inter', system-ui, -apple-system, 'Segoe UI', Roboto, sans-serif; }
     .stApp { background-color: #0B0E11; color: #E0E0E0; }
     h1, h2, h3 { font-weight: 600; letter-spacing: -0.5px; }
 
@@ -15,7 +21,7 @@ APP_STYLE = """
         margin-bottom: 0;
         line-height: 1.1;
     }
-    .mono { font-family: 'JetBrains Mono', monospace; }
+    .mono { font-family: 'JetBrains Mono', ui-monospace, SFMono-Regular, Menlo, Consolas, monospace; }
     .concept-card {
         background: rgba(30, 35, 45, 0.6);
         border: 1px solid rgba(255, 255, 255, 0.1);
@@ -60,7 +66,7 @@ APP_STYLE = """
     }
     .leg-row {
         display: flex; justify-content: space-between; padding: 12px 0; 
-        border-bottom: 1px solid #2a2e35; font-family: 'JetBrains Mono', monospace; font-size: 0.95rem;
+        border-bottom: 1px solid #2a2e35; font-family: 'JetBrains Mono', ui-monospace, SFMono-Regular, Menlo, Consolas, monospace; font-size: 0.95rem;
     }
     .leg-buy { color: #00FF88; background: rgba(0, 255, 136, 0.1); padding: 2px 6px; border-radius: 4px; }
     .leg-sell { color: #FF4B4B; background: rgba(255, 75, 75, 0.1); padding: 2px 6px; border-radius: 4px; }
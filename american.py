@@ -0,0 +1,200 @@
+import os
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from pricing_kernels import bsm
+from iv_solver import IVResult, IV_UPPER, MIN_VEGA
+import telemetry
+
+# --- CONFIGURATION ---
+# Lattice steps: accuracy/speed knob. At 100 steps prices are within ~0.1% of a
+# converged tree; time is linear in contracts and quadratic in steps
+# (~65 ms for 800 contracts at 100 steps, ~270 ms at 200).
+DEFAULT_STEPS = int(os.environ.get("OPSTRUCT_AMERICAN_STEPS", 100))
+DIV_HORIZON = 2.5    # Years of projected dividends kept (longest LEAPS)
+IV_TOL = 1e-4        # Absolute price error (per share) for the lattice inversion
+IV_MAX_ITER = 30
+IV_FLOOR = 0.01      # Lowest vol searched: the CRR tree is unstable below ~r*sqrt(dt)
+
+
+def _dividend_pv(div_t, div_a, t, T, r):
+    """
+    PV at times t (n, m) of dividends paid in (t, T] per contract; div_t/div_a are
+    the shared schedule (years from now, cash amounts).
+    """
+    if div_t is None or not len(div_t):
+        return np.zeros_like(t)
+    ti = div_t[None, None, :]
+    live = (ti > t[..., None]) & (ti <= T[:, None, None])
+    return np.sum(np.where(live, div_a * np.exp(-r[:, None, None] * (ti - t[..., None])), 0.0), axis=-1)
+
+
+def _lattice(S0, K, T, r, sigma, sign, rem, steps):
+    """
+    CRR tree on the escrowed spot S0, vectorized across contracts (rows).
+    Exercise compares against S0 node + PV of the dividends still to come (rem).
+    Runs the European tree alongside for the control variate.
+    Returns (american, european) for [price, delta, gamma, theta/day].
+    """
+    dt = T / steps
+    u = np.exp(sigma * np.sqrt(dt))
+    p = (np.exp(r * dt) - 1 / u) / (u - 1 / u)
+    disc = np.exp(-r * dt)
+    p, q, disc, uc = p[:, None], (1 - p)[:, None], disc[:, None], u[:, None]
+
+    nodes = S0[:, None] * uc ** (2 * np.arange(steps + 1) - steps)
+    am = eu = np.maximum(sign[:, None] * (nodes - K[:, None]), 0.0)
+    keep = {}
+    for m in range(steps - 1, -1, -1):
+        nodes = nodes[:, :m + 1] * uc
+        eu = disc * (p * eu[:, 1:] + q * eu[:, :-1])
+        am = np.maximum(disc * (p * am[:, 1:] + q * am[:, :-1]),
+                        sign[:, None] * (nodes + rem[:, m:m + 1] - K[:, None]))
+        if m <= 2:
+            keep[m] = (am, eu, nodes + rem[:, m:m + 1])
+
+    out = []
+    for k in (0, 1):
+        v0, v1, v2 = keep[0][k][:, 0], keep[1][k], keep[2][k]
+        s1, s2 = keep[1][2], keep[2][2]
+        delta = (v1[:, 1] - v1[:, 0]) / (s1[:, 1] - s1[:, 0])
+        up = (v2[:, 2] - v2[:, 1]) / (s2[:, 2] - s2[:, 1])
+        dn = (v2[:, 1] - v2[:, 0]) / (s2[:, 1] - s2[:, 0])
+        gamma = (up - dn) / ((s2[:, 2] - s2[:, 0]) / 2)
+        theta = (v2[:, 1] - v0) / (2 * dt) / 365
+        out.append((v0, delta, gamma, theta))
+    return out
+
+
+@telemetry.traced("american.price")
+def price(S, K, T, r, sigma, is_call=True, dividends=None, steps=DEFAULT_STEPS):
+    """
+    American option values for whole chains: a CRR lattice vectorized across
+    contracts with discrete cash dividends (escrowed model) and a European
+    control variate, so few steps already price accurately.
+
+    dividends: (times in years from now, amounts), shared by all contracts.
+    Only contracts where early exercise can matter (puts, calls with a
+    dividend before expiry) go through the lattice; the rest are BSM.
+    Returns {price, delta, gamma, theta, vega, rho, early_premium} (vega/rho
+    are the European sensitivities on the escrowed spot).
+    """
+    S, K, T, r, sigma, is_call = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (S, K, T, r, sigma)),
+                                                      np.asarray(is_call, dtype=bool))
+    shape = S.shape
+    S, K, T, r, sigma, is_call = (a.ravel() for a in (S, K, T, r, sigma, is_call))
+    T = np.maximum(T, 0.001)
+    steps = max(int(steps), 3)
+    div_t, div_a = (np.asarray(dividends[0], float), np.asarray(dividends[1], float)) if dividends is not None else (None, None)
+
+    pv0 = _dividend_pv(div_t, div_a, np.zeros((len(S), 1)), T, r)[:, 0]
+    S0 = S - pv0
+    euro = bsm(S0, K, T, r, sigma, is_call)
+    out = {k: euro[k].copy() for k in ('price', 'delta', 'gamma', 'theta', 'vega', 'rho')}
+    out['early_premium'] = np.zeros(len(S))
+
+    lattice = np.isfinite(sigma) & ((~is_call & (r > 0)) | (is_call & (pv0 > 0)))
+    if lattice.any():
+        i = np.nonzero(lattice)[0]
+        with telemetry.span("american.lattice", contracts=len(i), steps=steps):
+            t = T[i, None] / steps * np.arange(steps + 1)
+            rem = _dividend_pv(div_t, div_a, t, T[i], r[i])
+            sign = np.where(is_call[i], 1.0, -1.0)
+            am, eu = _lattice(S0[i], K[i], T[i], r[i], sigma[i], sign, rem, steps)
+        for f, a, e in zip(('price', 'delta', 'gamma', 'theta'), am, eu):
+            out[f][i] = a - e + euro[f][i]
+        out['early_premium'][i] = am[0] - eu[0]
+    return {k: v.reshape(shape) for k, v in out.items()}
+
+
+price_fn = price
+
+
+@telemetry.traced("american.implied_vol")
+def implied_vol(price, S, K, T, r, is_call=True, dividends=None, steps=DEFAULT_STEPS, seed=None,
+                tol=IV_TOL, max_iter=IV_MAX_ITER):
+    """
+    Vol that makes price() match an American market price, batched like
+    iv_solver.implied_vol: Newton on the (escrowed European) vega inside a
+    per-contract bracket, bisecting whenever a step leaves it. seed: start
+    vols, e.g. the European IVs (the early-exercise premium moves the root
+    only a little). Inverting American prices with the European solver
+    instead would count the premium twice once the lattice reprices.
+    Prices no vol above IV_FLOOR reproduces (at or below intrinsic, or
+    under the floor-vol value) carry no vol information and stay
+    unconverged. Returns IVResult.
+    """
+    price, S, K, T, r, is_call = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (price, S, K, T, r)),
+                                                      np.asarray(is_call, dtype=bool))
+    shape = price.shape
+    price, S, K, T, r, is_call = (a.ravel() for a in (price, S, K, T, r, is_call))
+    T = np.maximum(T, 0.001)
+    seed = np.broadcast_to(np.asarray(seed if seed is not None else np.nan, dtype=float), shape).ravel()
+
+    intrinsic = np.maximum(np.where(is_call, S - K, K - S), 0.0)
+    valid = np.isfinite(price) & (price > intrinsic + tol) & (price < np.where(is_call, S, K))
+    i = np.flatnonzero(valid)
+    if i.size:
+        floor = price_fn(S[i], K[i], T[i], r[i], np.full(i.size, IV_FLOOR), is_call[i], dividends, steps)['price']
+        valid[i] = price[i] > floor + tol
+    iv = np.full(price.shape, np.nan)
+    converged = np.zeros(price.shape, dtype=bool)
+    sig = np.clip(np.where(np.isfinite(seed), seed, 0.3), 2 * IV_FLOOR, 3.0)
+    lo = np.full(price.shape, IV_FLOOR)
+    hi = np.full(price.shape, IV_UPPER)
+
+    active = np.flatnonzero(valid)
+    it = 0
+    while active.size and it < max_iter:
+        it += 1
+        res = price_fn(S[active], K[active], T[active], r[active], sig[active], is_call[active], dividends, steps)
+        diff = res['price'] - price[active]
+        vega = res['vega'] * 100   # kernel vega is per vol point
+
+        done = np.abs(diff) < tol
+        iv[active[done]] = sig[active[done]]
+        converged[active[done]] = True
+
+        over = diff > 0
+        hi[active] = np.where(over, sig[active], hi[active])
+        lo[active] = np.where(over, lo[active], sig[active])
+        with np.errstate(all='ignore'):
+            step = sig[active] - diff / vega
+        bad = (vega < MIN_VEGA) | ~np.isfinite(step) | (step <= lo[active]) | (step >= hi[active])
+        sig[active] = np.where(bad, 0.5 * (lo[active] + hi[active]), step)
+        # A bracket narrower than the lattice's own noise is as converged as it gets
+        narrow = ~done & (hi[active] - lo[active] < 1e-6)
+        iv[active[narrow]] = sig[active[narrow]]
+        converged[active[narrow]] = True
+        active = active[~(done | narrow)]
+
+    return IVResult(iv.reshape(shape), converged.reshape(shape), it)
+
+
+def project_dividends(history, now=None, horizon=DIV_HORIZON):
+    """
+    Forward cash-dividend schedule (times in years from now, amounts) from
+    past ex-dates: last amount repeated at the recent median cadence.
+    history: Series of amounts indexed by ex-date (yfinance Ticker.dividends).
+    """
+    empty = (np.empty(0), np.empty(0))
+    if history is None or len(history) == 0:
+        return empty
+    now = pd.Timestamp(now or datetime.now())
+    idx = pd.DatetimeIndex(history.index)
+    idx = idx.tz_localize(None) if idx.tz is not None else idx
+    recent = pd.Series(history.to_numpy(dtype=float), index=idx).sort_index().iloc[-5:]
+    if len(recent) < 2 or (now - recent.index[-1]).days > 400:
+        return empty   # One-off or discontinued payer
+    gap = float(np.median(np.diff(recent.index.to_numpy()).astype('timedelta64[D]').astype(float)))
+    nxt, amount = recent.index[-1], float(recent.iloc[-1])
+    times = []
+    while True:
+        nxt = nxt + pd.Timedelta(days=gap)
+        t = (nxt - now).days / 365.0
+        if t > horizon:
+            break
+        if t > 0:
+            times.append(t)
+    return np.array(times), np.full(len(times), amount)
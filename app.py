@@ -1,16 +1,15 @@
+import os
 import streamlit as st
-import yfinance as yf
-import numpy as np
-import plotly.graph_objects as go
-import requests
 from datetime import datetime
-from scipy.stats import norm
 import time
 
 # --- MVC IMPORTS ---
-from quant_engine import VectorizedQuantEngine
-from academy_data import APP_STYLE, ACADEMY_PHASES, QUIZ_BANK
-import market_utils 
+# Only what every page needs loads with the script. The analytics stack (pandas, scipy,
+# numba, plotly, yfinance) is imported inside the pages that use it, so Home/Academy
+# render without it and warmup.start() preloads it in the background.
+from academy_data import APP_STYLE, FONT_STYLE, ACADEMY_PHASES, QUIZ_BANK
+import telemetry
+import warmup
 
 # --- CONFIGURATION ---
 st.set_page_config(
@@ -20,8 +19,13 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# INJECT GLOBAL CSS
+# INJECT GLOBAL CSS (system font stacks; web fonts only on request)
 st.markdown(APP_STYLE, unsafe_allow_html=True)
+if os.environ.get("OPSTRUCT_WEB_FONTS") == "1": st.markdown(FONT_STYLE, unsafe_allow_html=True)
+
+# Once per process: imports, JIT kernels and shared caches on a daemon thread, then the
+# prefetch scheduler that keeps the watchlist and recently viewed symbols warm
+warmup.start(prefetch=True)
 
 # --- SESSION STATE ---
 if 'page' not in st.session_state: st.session_state.page = 'home'
@@ -30,36 +34,27 @@ if 'user_level' not in st.session_state: st.session_state.user_level = 'Rookie'
 def set_page(page_name):
     st.session_state.page = page_name
 
+def get_book():
+    if 'book' not in st.session_state:
+        import portfolio
+        st.session_state.book = portfolio.Book()
+    return st.session_state.book
+
 # --- CACHED UTILITIES ---
-@st.cache_data(ttl=86400, show_spinner=False)
+@telemetry.traced("terminal.lookup_ticker")
 def lookup_ticker(query):
-    query = query.strip().upper()
-    try:
-        t = yf.Ticker(query)
-        if not t.history(period="1d").empty: return query
-    except: pass
-    try:
-        url = f"https://query2.finance.yahoo.com/v1/finance/search?q={query}"
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, timeout=5)
-        data = response.json()
-        if 'quotes' in data and len(data['quotes']) > 0:
-            return data['quotes'][0]['symbol']
-    except: pass
-    return query
-
-@st.cache_data(ttl=300, show_spinner=False)
-def fetch_market_data(ticker, expiry, current_price):
-    engine = VectorizedQuantEngine()
-    stock = yf.Ticker(ticker)
-    try:
-        opt = stock.option_chain(expiry)
-        calls, puts = opt.calls, opt.puts
-    except: return None, None, None
-    T = (datetime.strptime(expiry, "%Y-%m-%d") - datetime.now()).days / 365.0
-    calls = engine.calculate_greeks_vectorized(calls, current_price, T, type='call')
-    puts = engine.calculate_greeks_vectorized(puts, current_price, T, type='put')
-    return calls, puts, engine.r
+    import symbol_index
+    # Offline symbol master: no network on the keystroke path; refreshes itself in the background
+    symbol_index.refresh_async()
+    return symbol_index.resolve(query)
+
+# Shared across sessions and replicas; a stale chain is served while one process refreshes it,
+# and prefetch.py refreshes the hot ones before anyone asks.
+def fetch_market_data(ticker, expiry):
+    import service
+    import prefetch
+    prefetch.touch(ticker, expiry)
+    return service.terminal_chain(ticker, expiry)
 
 # ==================================================
 #                  VIEW: HOMEPAGE
@@ -143,14 +138,19 @@ def page_home():
 #                  VIEW: WAR ROOM (CLEANED)
 # ==================================================
 def page_war_room():
+    import market_utils
+    import fetch_orchestrator
     st.markdown("## ⚔️ The War Room")
     st.caption("Institutional Dashboard. Know the terrain before you engage.")
     
     # --- ROW 1: THE HUD (REGIME) ---
     st.markdown("#### 📡 Market Regime HUD")
     with st.spinner("Analyzing Market Structure..."):
-        regime = market_utils.get_market_regime()
-        pulse = market_utils.get_macro_pulse()
+        # One concurrent, de-duplicated download per symbol for the whole page
+        fetch_orchestrator.prefetch(market_utils.war_room_requests())
+        regime, pulse, vol_df = fetch_orchestrator.run_parallel(
+            market_utils.get_market_regime, market_utils.get_macro_pulse, market_utils.scan_volatility_opportunities
+        )
         
         if regime and pulse:
             c1, c2, c3, c4 = st.columns(4)
@@ -182,8 +182,7 @@ def page_war_room():
     st.caption("Liquid tickers where Options are 'Expensive' (High IV Rank). These are prime candidates for Credit Spreads or Iron Condors.")
     
     with st.spinner("Scanning Liquid Watchlist..."):
-        vol_df = market_utils.scan_volatility_opportunities()
-        if not vol_df.empty:
+        if vol_df is not None and not vol_df.empty:
             st.dataframe(
                 vol_df, 
                 column_config={
@@ -264,15 +263,31 @@ def page_academy():
 #                  VIEW: TERMINAL
 # ==================================================
 def page_terminal():
+    import numpy as np
+    import plotly.graph_objects as go
+    import data_provider
+    import monte_carlo
+    import strategy_optimizer
+    import service
+    import chain_store
+    import vol_surface
+    import symbol_index
+    import prefetch
+    from quant_engine import VectorizedQuantEngine
+    from scenario_engine import ScenarioCube
     st.markdown("## 📐 OpStruct Pro Terminal")
     c1, c2, c3 = st.columns([1, 1, 2])
     with c1:
         raw = st.text_input("Ticker", "SPY").strip()
         ticker = lookup_ticker(raw)
+        if raw and symbol_index.lookup(ticker) is None:
+            # Unlisted input goes upstream as typed; lookalikes are only offered
+            tips = [h["symbol"] for h in symbol_index.search(raw, 4)]
+            if tips: st.caption(f"Did you mean: {', '.join(tips)}?")
     
-    stock = yf.Ticker(ticker)
     try: 
-        exps = stock.options
+        prefetch.touch(ticker)
+        exps = service.list_expiries(ticker)
         if not exps: raise ValueError
     except: 
         st.warning("No options found."); return
@@ -282,41 +297,25 @@ def page_terminal():
 
     if st.button("Initialize Analysis", type="primary", use_container_width=True):
         with st.spinner("Crunching..."):
-            hist = stock.history(period="5d")
-            if hist.empty: return
-            curr_price = hist['Close'].iloc[-1]
+            h = data_provider.get_bars(ticker, period="1y")
+            if h.empty: return
+            curr_price = h['Close'].iloc[-1]
             try:
-                h = stock.history(period="1y")
                 vol = np.log(h['Close']/h['Close'].shift(1)).rolling(30).std()*np.sqrt(252)*100
                 curr_vol, iv_rank = vol.iloc[-1], (vol.iloc[-1]-vol.min())/(vol.max()-vol.min())*100
             except: curr_vol, iv_rank = 0, 0
+            # Recorded chain history (chain_store recorder) gives a true ATM IV rank
+            _, hist_rank = chain_store.get_store().iv_rank(ticker)
+            if hist_rank is not None: iv_rank = hist_rank
 
-            calls, puts, r = fetch_market_data(ticker, expiry, curr_price)
-            if calls is None: st.error("Math Error"); return
-
-            eng = VectorizedQuantEngine()
-            trade = {}
-            if "Bullish" in view:
-                b = eng.find_closest_strike(calls, 0.50)
-                valid = calls[calls['strike'] > b['strike']]
-                s = eng.find_closest_strike(valid, 0.30) if not valid.empty else b
-                b['side'], s['side'], b['type'], s['type'] = "BUY", "SELL", "call", "call"
-                trade = {"Legs": [b, s], "Type": "Call Debit Spread"}
-            elif "Bearish" in view:
-                b = eng.find_closest_strike(puts, -0.50)
-                valid = puts[puts['strike'] < b['strike']]
-                s = eng.find_closest_strike(valid, -0.30) if not valid.empty else b
-                b['side'], s['side'], b['type'], s['type'] = "BUY", "SELL", "put", "put"
-                trade = {"Legs": [b, s], "Type": "Put Debit Spread"}
-            elif "Neutral" in view:
-                c = eng.find_closest_strike(calls, 0.20)
-                p = eng.find_closest_strike(puts, -0.20)
-                c['side'], p['side'], c['type'], p['type'] = "SELL", "SELL", "call", "put"
-                trade = {"Legs": [c, p], "Type": "Short Strangle"}
+            chain, r = fetch_market_data(ticker, expiry)
+            if chain is None: st.error("Math Error"); return
+
+            trade = service.pick_trade(chain.calls(), chain.puts(), view)
 
             st.session_state['data'] = {
                 "ticker": ticker, "price": curr_price, "rank": iv_rank, "vol": curr_vol, "r": r,
-                "calls": calls, "puts": puts, "trade": trade, "dte": (datetime.strptime(expiry, '%Y-%m-%d')-datetime.now()).days
+                "chain": chain, "trade": trade, "expiry": expiry, "dte": (datetime.strptime(expiry, '%Y-%m-%d')-datetime.now()).days
             }
 
     if 'data' in st.session_state:
@@ -340,49 +339,124 @@ def page_terminal():
                 css = "leg-buy" if l['side']=="BUY" else "leg-sell"
                 rows += f'<div class="leg-row"><span class="mono"><b class="{css}">{l["side"]}</b> {l["strike"]} {l["type"].upper()}</span><span class="mono" style="color:#888;">Δ {l["delta"]:.2f} | ${p:.2f}</span></div>'
             
-            pop = 50.0
-            if "Debit" in t['Type']:
-                l1 = t['Legs'][0]
-                move = d['price'] * (d['vol']/100) * np.sqrt(d['dte']/365.0)
-                if move > 0:
-                    be = l1['strike'] + cost if "Call" in t['Type'] else l1['strike'] - cost
-                    z = abs(d['price'] - be) / move
-                    pop = norm.sf(z) * 100
+            # Monte Carlo POP over the full multi-leg payoff, computed once per trade
+            if 'mc' not in d:
+                sim_vol = d['vol']/100 if d['vol'] > 0 else float(np.mean([l['iv'] for l in t['Legs']]))
+                d['mc'] = monte_carlo.simulate_trade(t['Legs'], d['price'], d['dte'], cost, sim_vol, d['r'])
+            mc = d['mc']
+            pop = mc['pop']['val']
 
             st.markdown(f"""
             <div class="trade-ticket">
                 <div class="ticket-header"><span>{t['Type']}</span></div>{rows}
                 <div class="ticket-footer"><div class="cost-display"><div class="cost-val">{'Debit' if cost>0 else 'Credit'}: ${abs(cost)*100:.0f}</div></div></div>
                 <div style="margin-top:15px;padding:8px;background:rgba(255,255,255,0.05);border-radius:4px;display:flex;justify-content:space-between;">
-                    <span style="color:#888;">POP</span><span style="color:#00FF88;font-weight:bold;">{pop:.1f}%</span>
+                    <span style="color:#888;">POP</span><span style="color:#00FF88;font-weight:bold;">{pop:.1f}% ±{mc['pop']['ci']:.1f}</span>
+                </div>
+                <div style="margin-top:6px;padding:8px;background:rgba(255,255,255,0.05);border-radius:4px;display:flex;justify-content:space-between;">
+                    <span style="color:#888;">E[P&L] / Touch</span><span class="mono">${mc['expected_pnl']['val']:.0f} / {mc['touch_prob']['val']:.0f}%</span>
                 </div>
             </div>""", unsafe_allow_html=True)
 
+            b1, b2 = st.columns([1, 2])
+            lots = b1.number_input("Lots", 1, 1000, 1, label_visibility="collapsed")
+            if b2.button("➕ Add to Book", use_container_width=True):
+                get_book().add_trade(d['ticker'], d['expiry'], t['Legs'], lots)
+                st.toast(f"{t['Type']} x{lots} booked ({len(get_book())} legs)")
+
         with c_r:
             l1, l2 = st.columns(2)
             day = l1.slider("Days Fwd", 0, max(1, d['dte']), 0)
             shock = l2.slider("Vol Shock", -50, 50, 0)
             
-            eng = VectorizedQuantEngine()
-            eng.r = d['r']
-            x = np.linspace(d['price']*0.8, d['price']*1.2, 100)
-            y = np.zeros_like(x) - (cost*100)
-            T_sim = max(0.001, (d['dte']-day)/365.0)
-            
-            for l in t['Legs']:
-                sig = max(0.01, l['impliedVolatility']*(1+shock/100))
-                lp = eng.black_scholes_single(x, l['strike'], T_sim, sig, l['type'])
-                y += (lp*100) if l['side']=="BUY" else -(lp*100)
+            # Priced once per trade over spot x day x vol; sliders only slice the cube.
+            # Leg vols ride the ticker's fitted smile (skew + term structure) when one is cached.
+            if 'cube' not in d:
+                d['cube'] = ScenarioCube(t['Legs'], d['price'], d['dte'], cost,
+                                         surface=vol_surface.get_surface(d['ticker']))
+            x, y = d['cube'].curve(day, shock)
                 
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(x=x[y>=0], y=y[y>=0], fill='tozeroy', fillcolor='rgba(0,255,136,0.2)', line=dict(color='#00FF88', width=0)))
-            fig.add_trace(go.Scatter(x=x[y<0], y=y[y<0], fill='tozeroy', fillcolor='rgba(255,75,75,0.2)', line=dict(color='#FF4B4B', width=0)))
-            fig.add_trace(go.Scatter(x=x, y=y, line=dict(color='white', width=2)))
-            fig.add_vline(x=d['price'], line_dash="dash", line_color="#F4D03F")
-            fig.update_layout(template="plotly_dark", height=350, margin=dict(l=10,r=10,t=10,b=10), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', showlegend=False)
-            st.plotly_chart(fig, use_container_width=True)
+            with telemetry.span("render.terminal.pnl_chart"):
+                fig = go.Figure()
+                fig.add_trace(go.Scatter(x=x[y>=0], y=y[y>=0], fill='tozeroy', fillcolor='rgba(0,255,136,0.2)', line=dict(color='#00FF88', width=0)))
+                fig.add_trace(go.Scatter(x=x[y<0], y=y[y<0], fill='tozeroy', fillcolor='rgba(255,75,75,0.2)', line=dict(color='#FF4B4B', width=0)))
+                fig.add_trace(go.Scatter(x=x, y=y, line=dict(color='white', width=2)))
+                fig.add_vline(x=d['price'], line_dash="dash", line_color="#F4D03F")
+                fig.update_layout(template="plotly_dark", height=350, margin=dict(l=10,r=10,t=10,b=10), paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)', showlegend=False)
+                st.plotly_chart(fig, use_container_width=True)
             with st.expander("📊 Chart Guide", expanded=False):
                 st.markdown("* **White Curve:** Value at T+Days.\n* **Green/Red:** Profit vs Loss.")
+            with st.expander("🗺️ P&L Heatmap (Spot × Date)", expanded=False):
+                with telemetry.span("render.terminal.heatmap"):
+                    cube = d['cube']
+                    hm = go.Figure(go.Heatmap(z=cube.spot_by_day(shock), x=cube.days, y=cube.spot, colorscale="RdYlGn", zmid=0))
+                    hm.update_layout(template="plotly_dark", height=350, margin=dict(l=10,r=10,t=10,b=10), xaxis_title="Days Fwd", yaxis_title="Spot", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+                    st.plotly_chart(hm, use_container_width=True)
+
+        with st.expander("🧮 Strategy Optimizer", expanded=False):
+            o1, o2, o3, o4 = st.columns(4)
+            objective = o1.selectbox("Rank By", ["ev_per_risk", "ev", "pop"], format_func={"ev_per_risk": "EV / Max Loss", "ev": "Expected Value", "pop": "POP"}.get)
+            max_loss = o2.number_input("Max Loss ($)", 0, 100000, 1000, step=100)
+            min_pop = o3.slider("Min POP %", 0, 100, 0)
+            all_exp = o4.checkbox("All Expiries", help="Scans every listed expiry (one chain fetch each).")
+            if st.button("Scan Structures", use_container_width=True):
+                with st.spinner("Scoring every spread..."):
+                    chains = d['chain'].surface()
+                    if all_exp:
+                        for e in exps[:12]:
+                            if e in chains: continue
+                            c_, _ = fetch_market_data(d['ticker'], e)
+                            if c_ is not None: chains.update(c_.surface())
+                    d['opt'] = strategy_optimizer.optimize(chains, d['price'], VectorizedQuantEngine().rate_for,
+                                                           objective=objective, max_loss=max_loss or None, min_pop=min_pop or None)
+            if d.get('opt') is not None:
+                st.dataframe(d['opt'].round(2), use_container_width=True, hide_index=True)
+
+# ==================================================
+#                  VIEW: BOOK
+# ==================================================
+def page_book():
+    import pandas as pd
+    import plotly.graph_objects as go
+    import portfolio
+    st.markdown("## 💼 Portfolio Book")
+    book = get_book()
+    up = st.file_uploader("Import positions (CSV: underlying,type,strike,expiry,qty,iv[,price,mult])", type="csv")
+    if up is not None and st.button("Load CSV"):
+        st.session_state.book = book = portfolio.Book.from_frame(pd.read_csv(up))
+    if not len(book):
+        st.info("Book is empty. Add trades from the Terminal or import a CSV."); return
+
+    with st.spinner("Repricing book..."):
+        spots, betas = portfolio.market_inputs(book.symbols)
+        net = book.net_greeks(spots, betas, spots.get(portfolio.BENCHMARK))
+
+    m1, m2, m3, m4, m5 = st.columns(5)
+    m1.metric("Legs", f"{len(book):,}")
+    m2.metric("Open P&L", f"${net['pnl'].sum():,.0f}")
+    m3.metric(f"β-Δ ({portfolio.BENCHMARK} sh)", f"{net['bw_delta'].sum():,.0f}" if 'bw_delta' in net else "n/a",
+              help="Beta-weighted delta in benchmark shares.")
+    m4.metric("Vega / pt", f"${net['vega'].sum():,.0f}")
+    m5.metric("Theta / day", f"${net['theta'].sum():,.0f}")
+    st.dataframe(net.round(2), use_container_width=True, hide_index=True)
+
+    st.markdown("#### Stress (Spot × Vol)")
+    s1, s2 = st.columns(2)
+    days = s1.slider("Days Fwd", 0, 60, 0, key="book_days")
+    beta_scaled = s2.toggle(f"Beta-scaled ({portfolio.BENCHMARK} moves)", value=True)
+    grid = book.stress(spots, betas=betas if beta_scaled else None, days=days)
+    with telemetry.span("render.book.stress"):
+        hm = go.Figure(go.Heatmap(z=grid.to_numpy(), x=grid.columns, y=grid.index, colorscale="RdYlGn", zmid=0))
+        hm.update_layout(template="plotly_dark", height=420, margin=dict(l=10,r=10,t=10,b=10), xaxis_title="Vol Shock %", yaxis_title="Spot Shock %", paper_bgcolor='rgba(0,0,0,0)', plot_bgcolor='rgba(0,0,0,0)')
+        st.plotly_chart(hm, use_container_width=True)
+
+    with st.expander("📋 Positions", expanded=False):
+        frame = book.to_frame()
+        st.dataframe(frame, use_container_width=True, hide_index=True)
+        c1, c2 = st.columns(2)
+        c1.download_button("book.csv", frame.to_csv(index=False), file_name="book.csv", use_container_width=True)
+        if c2.button("Clear Book", use_container_width=True):
+            st.session_state.book = portfolio.Book(); st.rerun()
 
 # --- ROUTER ---
 with st.sidebar:
@@ -393,8 +467,17 @@ with st.sidebar:
     if st.button("⚔️ War Room", use_container_width=True): set_page('war_room')
     if st.button("🎓 Academy", use_container_width=True): set_page('academy')
     if st.button("📐 Terminal", use_container_width=True): set_page('terminal')
+    if st.button("💼 Book", use_container_width=True): set_page('book')
+    st.markdown("---")
+    show_debug = st.toggle("🛠️ Debug Panel", value=False, help="Span timings and cache hit rates for this process.")
+
+with telemetry.span(f"page.{st.session_state.page}"):
+    if st.session_state.page == 'home': page_home()
+    elif st.session_state.page == 'war_room': page_war_room()
+    elif st.session_state.page == 'academy': page_academy()
+    elif st.session_state.page == 'terminal': page_terminal()
+    elif st.session_state.page == 'book': page_book()
 
-if st.session_state.page == 'home': page_home()
-elif st.session_state.page == 'war_room': page_war_room()
-elif st.session_state.page == 'academy': page_academy()
-elif st.session_state.page == 'terminal': page_terminal()
+if show_debug:
+    st.divider()
+    telemetry.render_debug_panel(st)
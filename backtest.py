@@ -0,0 +1,264 @@
+"""
+Vectorized backtests of delta-targeted option templates over daily bars.
+
+    python backtest.py --tickers SPY,QQQ,IWM --period 10y
+    python backtest.py --universe universe.csv --templates neutral --dte 30,45 \\
+        --take-profit 0,0.5 --stop-loss 0,2 --vol chain --out bt/
+
+Every entry date of every ticker is one row of a single array problem:
+strikes come from inverting BSM delta at the entry vol, and the whole
+holding path [entry, day, leg] is priced in one VectorizedQuantEngine
+call. Exits (expiry, max hold, take-profit, stop-loss) are first-crossing
+lookups on that path. Parameter combinations run on a process pool.
+
+Vol is a proxy: 30-day realized vol (the War Room scanner's measure)
+times IV_PREMIUM, or the recorded ATM IV history from chain_store where
+it exists. Rates are flat at the current short rate.
+"""
+import os
+import sys
+import argparse
+import itertools
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.special import ndtri
+
+import data_provider
+import market_utils
+import telemetry
+from rate_curve import RateCurve, get_rate_curve
+from quant_engine import VectorizedQuantEngine
+
+# --- CONFIGURATION ---
+# (type, side, target delta[, contracts]); the first three are the Terminal's views
+TEMPLATES = {
+    "bullish": (("call", "BUY", 0.50), ("call", "SELL", 0.30)),
+    "bearish": (("put", "BUY", -0.50), ("put", "SELL", -0.30)),
+    "neutral": (("call", "SELL", 0.20), ("put", "SELL", -0.20)),
+    "iron_condor": (("call", "SELL", 0.20), ("call", "BUY", 0.10), ("put", "SELL", -0.20), ("put", "BUY", -0.10)),
+}
+DEFAULT_GRID = {"dte": (30, 45), "hold": (None,), "take_profit": (None, 0.5), "stop_loss": (None, 2.0)}
+VOL_WINDOW = 30          # Realized-vol window (days), as in scan_volatility_opportunities
+IV_PREMIUM = 1.10        # Implied ~ realized x premium when no chain history exists
+ENTRY_EVERY = 5          # Trading days between entries per ticker
+SLIPPAGE = 0.02          # Fraction of each leg's premium lost on entry and on exit
+COMMISSION = 0.65        # $ per contract per side
+MULTIPLIER = 100
+
+
+def strike_step(S):
+    """ Listed strike spacing by price level """
+    return np.select([S < 25, S < 200], [0.5, 1.0], 5.0)
+
+
+def strike_for_delta(S, delta, T, r, sigma, is_call):
+    """ Inverse BSM delta, rounded to the strike grid """
+    d1 = np.where(is_call, ndtri(np.clip(delta, 1e-6, 1 - 1e-6)), ndtri(np.clip(1 + delta, 1e-6, 1 - 1e-6)))
+    K = S * np.exp(-d1 * sigma * np.sqrt(T) + (r + 0.5 * sigma * sigma) * T)
+    step = strike_step(S)
+    return np.maximum(np.round(K / step) * step, step)
+
+
+def vol_panel(closes, source="realized", window=VOL_WINDOW, premium=IV_PREMIUM):
+    """
+    Annualized vol (decimal) per date x ticker: realized x premium, overlaid
+    with chain_store ATM IV (daily last) where recorded when source='chain'.
+    """
+    vol = market_utils.realized_vol_panel(closes.to_numpy(dtype=float), window) / 100 * premium
+    if source == "chain":
+        import chain_store
+        store = chain_store.get_store()
+        for j, t in enumerate(closes.columns):
+            iv = store.atm_iv(t, closes.index[0], closes.index[-1] + pd.Timedelta(days=1))
+            if iv.empty: continue
+            daily = iv.groupby(iv.index.normalize()).last().reindex(closes.index)
+            vol[:, j] = np.where(daily.notna(), daily.to_numpy(dtype=float), vol[:, j])
+    return vol
+
+
+# ==================================================
+#                  CORE
+# ==================================================
+def simulate(dates, px, vol, legs, dte=30, hold=None, take_profit=None, stop_loss=None,
+             every=ENTRY_EVERY, r=0.04, slippage=SLIPPAGE, commission=COMMISSION, engine=None):
+    """
+    One template over a dates x tickers panel, vectorized across every
+    (entry date, ticker). legs: template tuple. hold: max trading days;
+    take_profit / stop_loss: fractions of the entry premium (|debit| or credit).
+    Returns one row per closed trade (P&L per 1 lot, after costs).
+    """
+    engine = engine or VectorizedQuantEngine(curve=RateCurve.flat(r))
+    dates = np.asarray(dates, dtype='datetime64[D]')
+    n_d, n_t = px.shape
+    kinds = np.array([l[0] == 'call' for l in legs])
+    qty = np.array([(1.0 if l[1] == "BUY" else -1.0) * (l[3] if len(l) > 3 else 1) for l in legs])
+    target = np.array([l[2] for l in legs])
+
+    # ENTRIES: every `every` bars per ticker with a price and a vol
+    di, ti = np.meshgrid(np.arange(0, n_d, every), np.arange(n_t), indexing='ij')
+    di, ti = di.ravel(), ti.ravel()
+    ok = np.isfinite(px[di, ti]) & np.isfinite(vol[di, ti])
+    expiry = dates[di] + np.timedelta64(dte, 'D')
+    last = np.searchsorted(dates, expiry, side='right') - 1          # last bar on/before expiry
+    ok &= expiry <= dates[-1]                                         # trade must have closed
+    di, ti, expiry, last = di[ok], ti[ok], expiry[ok], last[ok]
+    n_bars = last - di
+    if hold is not None:
+        n_bars = np.minimum(n_bars, hold)
+    if not len(di):
+        return pd.DataFrame()
+
+    # PATHS: [entry, day]
+    H = int(n_bars.max())
+    k = np.arange(H + 1)
+    idx = np.minimum(di[:, None] + k, n_d - 1)
+    live = k[None, :] <= n_bars[:, None]
+    S = px[idx, ti[:, None]]
+    S = np.where(np.isfinite(S), S, px[di, ti][:, None])
+    sig = vol[idx, ti[:, None]]
+    sig = np.where(np.isfinite(sig), sig, vol[di, ti][:, None])
+    left = (expiry[:, None] - dates[idx]).astype(float)
+    T = np.where(dates[idx] >= expiry[:, None], 0.0, np.maximum(left, 0) / 365.0)
+
+    S0, v0 = px[di, ti], vol[di, ti]
+    K = strike_for_delta(S0[:, None], target[None, :], dte / 365.0, r, v0[:, None], kinds[None, :])
+
+    # ONE KERNEL CALL FOR EVERY ENTRY x DAY x LEG
+    price = engine.price_legs(S[:, :, None], K[:, None, :], T[:, :, None], sig[:, :, None],
+                              kinds[None, None, :], greeks=False)['price']
+    price = np.where(T[:, :, None] > 0, price, np.maximum(np.where(kinds, 1, -1) * (S[:, :, None] - K[:, None, :]), 0))
+    value = (price * qty).sum(-1) * MULTIPLIER                      # [entry, day]
+    entry = value[:, 0]
+    cost = (np.abs(qty) * (slippage * price[:, 0, :] * MULTIPLIER + commission)).sum(-1)
+    pnl = value - entry[:, None]
+
+    # EXITS: first crossing of take-profit / stop-loss, else the last live bar
+    basis = np.abs(entry)
+    hit = np.zeros_like(live)
+    if take_profit:
+        hit |= pnl >= take_profit * basis[:, None]
+    if stop_loss:
+        hit |= pnl <= -stop_loss * basis[:, None]
+    hit &= live & (k[None, :] > 0)
+    first = np.where(hit.any(1), hit.argmax(1), n_bars)
+    rows = np.arange(len(di))
+    exit_price = price[rows, first]
+    exit_cost = (np.abs(qty) * (slippage * exit_price * MULTIPLIER + commission)).sum(-1)
+    reason = np.where(~hit.any(1), np.where(first == last - di, "expiry", "hold"),
+                      np.where(pnl[rows, first] > 0, "take_profit", "stop_loss"))
+
+    out = pd.DataFrame({
+        'ticker_idx': ti, 'entry_date': dates[di], 'exit_date': dates[idx[rows, first]],
+        'days': (dates[idx[rows, first]] - dates[di]).astype(int), 'spot': S0, 'vol': v0,
+        'entry_value': entry, 'pnl': pnl[rows, first] - cost - exit_cost, 'reason': reason,
+    })
+    for j in range(len(legs)):
+        out[f'K{j + 1}'] = K[:, j]
+    return out
+
+
+def summarize(trades, by=('template', 'dte', 'hold', 'take_profit', 'stop_loss')):
+    """ Per parameter set: trades, win rate, mean/total P&L, Sharpe (per trade, annualized by frequency), max drawdown """
+    by = [c for c in by if c in trades]
+    rows = []
+    for key, g in trades.groupby(by, dropna=False, sort=False):
+        g = g.sort_values('exit_date')
+        pnl = g['pnl'].to_numpy()
+        eq = np.cumsum(pnl)
+        years = max((g['exit_date'].max() - g['entry_date'].min()).days / 365.25, 1 / 365.25)
+        sd = pnl.std(ddof=1) if len(pnl) > 1 else np.nan
+        rows.append({**dict(zip(by, key if isinstance(key, tuple) else (key,))),
+                     'trades': len(g), 'win_rate': float((pnl > 0).mean() * 100), 'avg_pnl': float(pnl.mean()),
+                     'total_pnl': float(eq[-1]), 'sharpe': float(pnl.mean() / sd * np.sqrt(len(g) / years)) if sd > 0 else np.nan,
+                     'max_drawdown': float((np.maximum.accumulate(np.r_[0, eq]) - np.r_[0, eq]).max()),
+                     'avg_days': float(g['days'].mean())})
+    return pd.DataFrame(rows).sort_values('total_pnl', ascending=False).reset_index(drop=True)
+
+
+# ==================================================
+#                  SWEEPS
+# ==================================================
+def _grid(grid):
+    keys = list(grid)
+    return [dict(zip(keys, combo)) for combo in itertools.product(*(grid[k] for k in keys))]
+
+
+def _run_combo(args):
+    """ Worker task: one (template, parameter set) over the whole panel. """
+    dates, px, vol, name, legs, params, r = args
+    res = simulate(dates, px, vol, legs, r=r, **params)
+    return res.assign(template=name, **{k: (np.nan if v is None else v) for k, v in params.items()})
+
+
+@telemetry.traced("backtest.run")
+def run(tickers, templates=("bullish", "bearish", "neutral"), grid=None, period="10y",
+        vol_source="realized", workers=None, every=ENTRY_EVERY):
+    """
+    (trades, summary) for every template x parameter combination over the
+    tickers' daily closes. templates: names in TEMPLATES or {name: legs}.
+    workers: process count (1 runs inline; default all cores).
+    """
+    closes = data_provider.get_closes(tickers, period)
+    if closes.empty:
+        return pd.DataFrame(), pd.DataFrame()
+    px = market_utils._ffill_2d(closes.to_numpy(dtype=float))
+    vol = vol_panel(closes, vol_source)
+    dates = closes.index.values.astype('datetime64[D]')
+    r = get_rate_curve().short_rate
+    templates = templates if isinstance(templates, dict) else {t: TEMPLATES[t] for t in templates}
+    tasks = [(dates, px, vol, name, legs, {**p, "every": every}, r)
+             for name, legs in templates.items() for p in _grid(grid or DEFAULT_GRID)]
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:
+        parts = [_run_combo(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as pool:
+            parts = list(pool.map(_run_combo, tasks))
+    trades = pd.concat([p for p in parts if len(p)], ignore_index=True) if any(len(p) for p in parts) else pd.DataFrame()
+    if trades.empty:
+        return trades, pd.DataFrame()
+    trades.insert(0, 'ticker', np.asarray(closes.columns)[trades.pop('ticker_idx')])
+    return trades, summarize(trades)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="OpStruct template backtester")
+    ap.add_argument("--tickers", help="comma-separated symbols")
+    ap.add_argument("--universe", help="CSV/text universe file (see market_utils.load_universe)")
+    ap.add_argument("--period", default="10y")
+    ap.add_argument("--templates", default="bullish,bearish,neutral", help=f"any of {','.join(TEMPLATES)}")
+    ap.add_argument("--dte", default="30,45")
+    ap.add_argument("--hold", default="0", help="max trading days held (0 = to expiry)")
+    ap.add_argument("--take-profit", default="0,0.5", help="fractions of entry premium (0 = off)")
+    ap.add_argument("--stop-loss", default="0,2", help="fractions of entry premium (0 = off)")
+    ap.add_argument("--every", type=int, default=ENTRY_EVERY)
+    ap.add_argument("--vol", choices=("realized", "chain"), default="realized")
+    ap.add_argument("--workers", type=int)
+    ap.add_argument("--out", help="directory for trades.parquet and summary.csv")
+    args = ap.parse_args(argv)
+
+    tickers = market_utils.load_universe(args.universe) if args.universe else \
+        [t.strip().upper() for t in (args.tickers or "").split(",") if t.strip()]
+    if not tickers:
+        ap.error("--tickers or --universe is required")
+    nums = lambda s, cast: tuple(cast(x) or None for x in s.split(","))
+    grid = {"dte": nums(args.dte, int), "hold": nums(args.hold, int),
+            "take_profit": nums(args.take_profit, float), "stop_loss": nums(args.stop_loss, float)}
+    t0 = datetime.now()
+    trades, summary = run(tickers, args.templates.split(","), grid, args.period, args.vol, args.workers, args.every)
+    print(f"{len(trades):,} trades in {(datetime.now() - t0).total_seconds():.1f}s")
+    if not summary.empty:
+        print(summary.round(2).to_string(index=False))
+    if args.out and not trades.empty:
+        os.makedirs(args.out, exist_ok=True)
+        trades.to_parquet(os.path.join(args.out, "trades.parquet"), index=False)
+        summary.to_csv(os.path.join(args.out, "summary.csv"), index=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
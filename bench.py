@@ -0,0 +1,445 @@
+"""
+Offline benchmark suite for the quant engine and data pipeline.
+
+    python bench.py                 # run, compare with bench_baseline.json (exit 1 on regression)
+    python bench.py --save          # run and store the results as the new baseline
+    python bench.py --quick         # smallest sizes only
+    python bench.py --only scanner  # cases whose name contains 'scanner'
+
+Everything runs on synthetic fixtures: option chains are priced from a
+smile, and bar fixtures are seeded GBM histories recorded once to
+.bench_fixtures/ as CSV and served through LocalFileProvider, so no
+network is touched. Each case reports median/min wall time, tracemalloc
+peak memory and, across its sizes, a log-log scaling exponent.
+Baselines are machine specific: re-run with --save on new hardware.
+"""
+import os
+import sys
+import json
+import time
+import zlib
+import shutil
+import argparse
+import platform
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+# Point every on-disk cache at a scratch dir before the app modules read their env
+_SCRATCH = tempfile.mkdtemp(prefix="opstruct_bench_")
+os.environ["OPSTRUCT_INDICATOR_STATE"] = os.path.join(_SCRATCH, "indicators")
+os.environ["OPSTRUCT_BAR_STORE"] = os.path.join(_SCRATCH, "bars")
+os.environ["OPSTRUCT_SYMBOL_DIR"] = os.path.join(_SCRATCH, "symbols")
+os.environ["OPSTRUCT_CACHE"] = "memory"
+os.environ["OPSTRUCT_CHAIN_STORE"] = os.path.join(_SCRATCH, "chains")
+
+import numpy as np
+import pandas as pd
+
+import rate_curve
+import data_provider
+import indicators
+import market_utils
+from quant_engine import VectorizedQuantEngine
+from scenario_engine import ScenarioCube
+from portfolio import Book
+from option_chain import OptionChain
+from chain_store import ChainStore
+from pricing_kernels import bsm_price
+from vol_surface import SVISurface
+import backtest
+
+# --- CONFIGURATION ---
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(HERE, "bench_baseline.json")
+FIXTURE_DIR = os.path.join(HERE, ".bench_fixtures")
+TIME_TOLERANCE = 0.50   # Fail when the median is >50% slower than baseline...
+TIME_SLACK_MS = 1.0     # ...and by more than this (timer noise on sub-ms cases)
+MEM_TOLERANCE = 0.50    # Same for tracemalloc peaks
+SPOT, RATE = 450.0, 0.045
+EXPIRY_DAYS = (7, 14, 21, 30, 45, 60, 90, 120, 180, 270, 365, 540)
+
+
+# ==================================================
+#                  SYNTHETIC FIXTURES
+# ==================================================
+def synthetic_chain(n_strikes, dte=30, is_call=True, spot=SPOT, seed=0):
+    """ yfinance-shaped chain: strikes around spot, smile IVs, bid/ask/last around BSM value. """
+    rng = np.random.default_rng(seed)
+    K = np.round(np.linspace(spot * 0.5, spot * 1.5, n_strikes), 2)
+    iv = 0.18 + 0.35 * ((K - spot) / spot) ** 2 + rng.normal(0, 0.005, n_strikes)
+    px = bsm_price(spot, K, max(dte, 1) / 365.0, RATE, iv, is_call)
+    half = np.maximum(0.01, px * 0.02)
+    return pd.DataFrame({
+        "contractSymbol": [f"SYN{'C' if is_call else 'P'}{int(k * 1000):08d}" for k in K],
+        "strike": K, "lastPrice": px, "bid": np.maximum(px - half, 0), "ask": px + half,
+        "volume": rng.integers(0, 5000, n_strikes), "openInterest": rng.integers(0, 20000, n_strikes),
+        "impliedVolatility": iv,
+    })
+
+
+def synthetic_surface(n_strikes, expiry_days=EXPIRY_DAYS, now=None):
+    now = now or datetime.now()
+    return {(now + timedelta(days=d)).strftime("%Y-%m-%d"): (synthetic_chain(n_strikes, d, True, seed=d),
+                                                             synthetic_chain(n_strikes, d, False, seed=1000 + d))
+            for d in expiry_days}
+
+
+def _bar_fixture(symbol, dates, seed):
+    rng = np.random.default_rng(seed)
+    vol = rng.uniform(0.15, 0.8)
+    close = 20 + 480 * rng.random() * np.exp(np.cumsum(rng.normal(0, vol / np.sqrt(252), len(dates))))
+    return pd.DataFrame({"Open": close, "High": close * 1.01, "Low": close * 0.99,
+                         "Close": close, "Volume": rng.integers(1e5, 1e7, len(dates))}, index=dates)
+
+
+def bar_fixtures(symbols, days=400):
+    """
+    Recorded daily bars for `symbols` under FIXTURE_DIR (ending today, so the
+    intraday path is exercised). Generated once per trading day, then reused.
+    """
+    dates = pd.bdate_range(end=pd.Timestamp(datetime.now().date()), periods=days)
+    stamp = os.path.join(FIXTURE_DIR, ".stamp")
+    if not os.path.exists(stamp) or open(stamp).read() != str(dates[-1].date()):
+        shutil.rmtree(FIXTURE_DIR, ignore_errors=True)
+        os.makedirs(FIXTURE_DIR)
+        with open(stamp, "w") as f:
+            f.write(str(dates[-1].date()))
+    for s in symbols:
+        path = os.path.join(FIXTURE_DIR, data_provider._safe_name(s) + ".csv")
+        if not os.path.exists(path):
+            _bar_fixture(s, dates, seed=zlib.crc32(s.encode())).to_csv(path, index_label="Date")
+    return symbols
+
+
+def universe(n):
+    return [f"SYN{i:04d}" for i in range(n)]
+
+
+def _fresh_store():
+    data_provider.set_store(data_provider.BarStore(data_provider.LocalFileProvider(FIXTURE_DIR),
+                                                   root=os.path.join(_SCRATCH, "bars")))
+
+
+def _reset_indicators():
+    shutil.rmtree(os.environ["OPSTRUCT_INDICATOR_STATE"], ignore_errors=True)
+    indicators._engines.clear()
+
+
+def _trade(kind="vertical"):
+    legs = [{"strike": 450.0, "type": "call", "side": "BUY", "iv": 0.22},
+            {"strike": 470.0, "type": "call", "side": "SELL", "iv": 0.21}]
+    if kind == "condor":
+        legs += [{"strike": 430.0, "type": "put", "side": "SELL", "iv": 0.24},
+                 {"strike": 410.0, "type": "put", "side": "BUY", "iv": 0.26}]
+    return legs
+
+
+def synthetic_book(n_legs, n_underlyings=50, seed=0):
+    """ Random multi-underlying book: strikes around 100, 5-400 DTE, mixed long/short. """
+    rng = np.random.default_rng(seed)
+    syms = [f"U{i:03d}" for i in range(n_underlyings)]
+    expiry = np.datetime64(datetime.now().date()) + rng.integers(5, 400, n_legs)
+    df = pd.DataFrame({"underlying": rng.choice(syms, n_legs), "type": rng.choice(["call", "put"], n_legs),
+                       "strike": rng.uniform(80, 120, n_legs).round(), "expiry": expiry.astype(str),
+                       "qty": rng.choice([-3.0, -1.0, 1.0, 2.0], n_legs), "iv": rng.uniform(0.15, 0.6, n_legs)})
+    spots = {s: 100.0 for s in syms}
+    betas = {s: float(b) for s, b in zip(syms, rng.uniform(0.5, 1.8, n_underlyings))}
+    return Book.from_frame(df), spots, betas
+
+
+# ==================================================
+#                  CASES
+# ==================================================
+# Each case maps a size to a zero-arg callable (built outside the timer).
+CASES = {}
+
+
+def case(name, sizes, quick=None, repeat=7):
+    def deco(setup):
+        CASES[name] = {"setup": setup, "sizes": sizes, "quick": quick or sizes[:1], "repeat": repeat}
+        return setup
+    return deco
+
+
+@case("greeks_vectorized", sizes=(50, 200, 1000, 5000))
+def _(n):
+    eng, df = VectorizedQuantEngine(), synthetic_chain(n)
+    return lambda: eng.calculate_greeks_vectorized(df, SPOT, 30 / 365.0, "impliedVolatility", "call")
+
+
+@case("surface_greeks", sizes=(50, 200, 500))
+def _(n):
+    eng, chains = VectorizedQuantEngine(), synthetic_surface(n)
+    return lambda: eng.calculate_surface_greeks(chains, SPOT)
+
+
+@case("american_chain", sizes=(50, 200, 1000), quick=(200,), repeat=3)
+def _(n):
+    eng, df = VectorizedQuantEngine(), synthetic_chain(n, is_call=False)
+    divs = ([0.05], [1.6])
+    return lambda: eng.calculate_greeks_vectorized(df, SPOT, 30 / 365.0, "impliedVolatility", "put",
+                                                   exercise="american", dividends=divs)
+
+
+@case("svi_fit", sizes=(50, 200, 500))
+def _(n):
+    eng = VectorizedQuantEngine()
+    g = eng.calculate_surface_greeks(synthetic_surface(n), SPOT, fit_surface=False)
+    iv = np.where(g.iv_result.converged, g.sigma, np.nan)
+    return lambda: SVISurface.from_quotes(g.strikes, g.T, RATE, iv, SPOT, g.expiries)
+
+
+@case("svi_eval", sizes=(1000, 1_000_000), quick=(1000,))
+def _(n):
+    surf = VectorizedQuantEngine().calculate_surface_greeks(synthetic_surface(200), SPOT).vol_surface
+    rng = np.random.default_rng(0)
+    K, T = rng.uniform(300, 600, n), rng.uniform(0.01, 2.0, n)
+    return lambda: surf.iv(K, T)
+
+
+@case("black_scholes_single_x1000", sizes=(1000,))
+def _(n):
+    eng = VectorizedQuantEngine()
+    K = np.linspace(400, 500, n)
+    return lambda: [eng.black_scholes_single(SPOT, k, 30 / 365.0, 0.2, "call") for k in K]
+
+
+@case("black_scholes_array", sizes=(1000, 100_000, 1_000_000))
+def _(n):
+    eng = VectorizedQuantEngine()
+    K = np.linspace(200, 700, n)
+    return lambda: eng.black_scholes_single(SPOT, K, 30 / 365.0, 0.2, "call")
+
+
+@case("find_closest_strike_x3", sizes=(50, 200, 1000))
+def _(n):
+    eng = VectorizedQuantEngine()
+    df = eng.calculate_greeks_vectorized(synthetic_chain(n), SPOT, 30 / 365.0)
+    return lambda: [eng.find_closest_strike(df, t) for t in (0.5, 0.3, 0.2)]
+
+
+@case("pnl_grid_build", sizes=(7, 45, 365))
+def _(dte):
+    legs = _trade("condor")
+    return lambda: ScenarioCube(legs, SPOT, dte, 1.5)
+
+
+@case("pnl_grid_build_smile", sizes=(7, 45, 365))
+def _(dte):
+    surf = VectorizedQuantEngine().calculate_surface_greeks(synthetic_surface(200), SPOT).vol_surface
+    legs = _trade("condor")
+    return lambda: ScenarioCube(legs, SPOT, dte, 1.5, surface=surf)
+
+
+@case("pnl_grid_slice", sizes=(45,), repeat=50)
+def _(dte):
+    cube = ScenarioCube(_trade("condor"), SPOT, dte, 1.5)
+    return lambda: cube.curve(dte // 2, 12.5)
+
+
+@case("scanner_cold", sizes=(15, 250, 1000, 4000), quick=(15, 250), repeat=3)
+def _(n):
+    syms = bar_fixtures(universe(n))
+    _fresh_store()
+    data_provider.get_closes(syms, "1y")   # fixture I/O is its own case
+
+    def run():
+        _reset_indicators()
+        return market_utils.scan_volatility_opportunities(syms)
+    return run
+
+
+@case("scanner_warm", sizes=(15, 250, 1000, 4000), quick=(15, 250))
+def _(n):
+    syms = bar_fixtures(universe(n))
+    _fresh_store()
+    _reset_indicators()
+    market_utils.scan_volatility_opportunities(syms)
+    return lambda: market_utils.scan_volatility_opportunities(syms)
+
+
+@case("bar_store_cold_load", sizes=(15, 250, 1000), quick=(15,), repeat=3)
+def _(n):
+    syms = bar_fixtures(universe(n))
+
+    def run():
+        shutil.rmtree(os.path.join(_SCRATCH, "bars"), ignore_errors=True)
+        _fresh_store()
+        return data_provider.get_closes(syms, "1y")
+    return run
+
+
+@case("regime_cold", sizes=(1,), repeat=5)
+def _(n):
+    bar_fixtures(market_utils.REGIME_TICKERS)
+    _fresh_store()
+    data_provider.get_closes(market_utils.REGIME_TICKERS, "1y")
+
+    def run():
+        _reset_indicators()
+        return market_utils.get_market_regime()
+    return run
+
+
+@case("regime_warm", sizes=(1,))
+def _(n):
+    bar_fixtures(market_utils.REGIME_TICKERS)
+    _fresh_store()
+    _reset_indicators()
+    market_utils.get_market_regime()
+    return market_utils.get_market_regime
+
+
+@case("book_net_greeks", sizes=(100, 1000, 10_000))
+def _(n):
+    book, spots, betas = synthetic_book(n)
+    return lambda: book.net_greeks(spots, betas, 450.0)
+
+
+@case("book_stress_20x20", sizes=(100, 1000, 10_000), quick=(1000,), repeat=3)
+def _(n):
+    book, spots, betas = synthetic_book(n)
+    shocks, vols = np.linspace(-20, 20, 20), np.linspace(-50, 50, 20)
+    return lambda: book.stress(spots, shocks, vols, betas=betas)
+
+
+def _recorded_store(n_snapshots, n_strikes=150):
+    """ A chain store holding n_snapshots 5-minute snapshots of a 6-expiry synthetic surface. """
+    store = ChainStore(os.path.join(_SCRATCH, "chains", str(n_snapshots)))
+    start = datetime.now().replace(hour=9, minute=30, second=0, microsecond=0) - timedelta(days=1)
+    chain = OptionChain.from_frames("SPY", synthetic_surface(n_strikes, EXPIRY_DAYS[:6], now=start))
+    VectorizedQuantEngine().calculate_surface_greeks(chain.surface(), SPOT, now=start, solve_iv=False)
+    for k in range(n_snapshots):
+        store.append(chain, SPOT, start + timedelta(minutes=5 * k))
+    return store, start
+
+
+@case("chain_replay_at", sizes=(10, 1000), quick=(10,), repeat=50)
+def _(n):
+    store, start = _recorded_store(n)
+    at = start + timedelta(minutes=5 * (n // 2) + 1)
+    return lambda: store.at("SPY", at)
+
+
+@case("chain_replay_atm_iv", sizes=(10, 100), quick=(10,), repeat=5)
+def _(n):
+    store, start = _recorded_store(n)
+    return lambda: store.atm_iv("SPY", start, start + timedelta(days=2))
+
+
+@case("backtest_template_10y", sizes=(15, 100), quick=(15,), repeat=3)
+def _(n):
+    # One template x parameter set over 10y of daily closes (the unit of a sweep's process pool)
+    rng = np.random.default_rng(n)
+    dates = pd.bdate_range(end=pd.Timestamp(datetime.now().date()), periods=2520)
+    px = 100 * np.exp(np.cumsum(rng.normal(0, 0.015, (len(dates), n)), axis=0))
+    closes = pd.DataFrame(px, index=dates)
+    vol = backtest.vol_panel(closes)
+    d = dates.values.astype("datetime64[D]")
+    return lambda: backtest.simulate(d, px, vol, backtest.TEMPLATES["neutral"], dte=45, take_profit=0.5,
+                                     stop_loss=2.0, r=RATE)
+
+
+# ==================================================
+#                  RUNNER
+# ==================================================
+def measure(fn, repeat):
+    fn()   # warm-up: JIT compile, lazy imports, first-touch caches
+    times = []
+    for _ in range(repeat):
+        t = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - t) * 1000)
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"median_ms": float(np.median(times)), "min_ms": float(np.min(times)), "peak_mb": peak / 2 ** 20}
+
+
+def scaling_exponent(rows):
+    """ Slope of log(time) vs log(size): ~1 linear, <1 overhead-bound, >1 superlinear. """
+    pts = [(r["size"], r["median_ms"]) for r in rows if r["size"] > 1 and r["median_ms"] > 0]
+    if len(pts) < 2:
+        return None
+    x, y = np.log([p[0] for p in pts]), np.log([p[1] for p in pts])
+    return float(np.polyfit(x, y, 1)[0])
+
+
+def run(names, quick=False):
+    rate_curve.set_rate_curve(rate_curve.RateCurve.flat(RATE))
+    results = {}
+    for name in names:
+        spec = CASES[name]
+        rows = []
+        for size in (spec["quick"] if quick else spec["sizes"]):
+            res = measure(spec["setup"](size), spec["repeat"])
+            rows.append({"size": size, **res})
+            print(f"  {name:<28} {size:>9,}  {res['median_ms']:>10.3f} ms  (min {res['min_ms']:.3f})  peak {res['peak_mb']:8.2f} MB", flush=True)
+        exp = scaling_exponent(rows)
+        if exp is not None:
+            print(f"  {name:<28} {'scaling':>9}  ~ n^{exp:.2f}")
+        results[name] = {"rows": rows, "scaling": exp}
+    return results
+
+
+def compare(results, baseline):
+    """ Regressions vs baseline as readable strings (empty = pass). """
+    failures = []
+    for name, res in results.items():
+        base = {r["size"]: r for r in baseline.get("cases", {}).get(name, {}).get("rows", [])}
+        for r in res["rows"]:
+            b = base.get(r["size"])
+            if b is None:
+                continue
+            if r["median_ms"] > b["median_ms"] * (1 + TIME_TOLERANCE) and r["median_ms"] - b["median_ms"] > TIME_SLACK_MS:
+                failures.append(f"{name}[{r['size']}]: {r['median_ms']:.2f} ms vs baseline {b['median_ms']:.2f} ms")
+            if r["peak_mb"] > b["peak_mb"] * (1 + MEM_TOLERANCE) and r["peak_mb"] - b["peak_mb"] > 1.0:
+                failures.append(f"{name}[{r['size']}]: peak {r['peak_mb']:.1f} MB vs baseline {b['peak_mb']:.1f} MB")
+    return failures
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="OpStruct offline benchmarks")
+    ap.add_argument("--save", action="store_true", help="store results as the new baseline")
+    ap.add_argument("--quick", action="store_true", help="smallest sizes only")
+    ap.add_argument("--only", default="", help="substring filter on case names")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--json", help="also write results to this path")
+    args = ap.parse_args(argv)
+
+    names = [n for n in CASES if args.only in n]
+    print(f"OpStruct bench | {platform.python_version()} | numpy {np.__version__} | {platform.machine()}")
+    try:
+        results = run(names, quick=args.quick)
+    finally:
+        shutil.rmtree(_SCRATCH, ignore_errors=True)
+
+    doc = {"created": datetime.now().isoformat(timespec="seconds"), "machine": platform.platform(),
+           "python": platform.python_version(), "cases": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(doc, f, indent=1)
+    if args.save:
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                old = json.load(f)
+            doc["cases"] = {**old.get("cases", {}), **results}   # --only/--quick keep the other cases
+        with open(args.baseline, "w") as f:
+            json.dump(doc, f, indent=1)
+        print(f"Baseline written: {args.baseline}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print("No baseline found; run with --save first.")
+        return 0
+    with open(args.baseline) as f:
+        failures = compare(results, json.load(f))
+    for line in failures:
+        print(f"REGRESSION  {line}")
+    print("FAIL" if failures else "OK")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
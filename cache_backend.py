@@ -0,0 +1,445 @@
+import os
+import sys
+import time
+import pickle
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import telemetry
+
+# --- CONFIGURATION ---
+CACHE_KIND = os.environ.get("OPSTRUCT_CACHE", "sqlite")     # memory | sqlite | redis
+CACHE_PATH = os.environ.get(
+    "OPSTRUCT_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "opstruct.sqlite")
+)
+CACHE_URL = os.environ.get("OPSTRUCT_CACHE_URL", "redis://localhost:6379/0")
+LOCAL_MB = float(os.environ.get("OPSTRUCT_CACHE_MB", 256))      # In-process LRU budget
+SHARED_MB = float(os.environ.get("OPSTRUCT_SHARED_CACHE_MB", 2048))
+LEASE_SECONDS = 30     # Max time one process may hold a key's refresh lease
+WAIT_POLL = 0.05       # Seconds between shared-cache polls while another process loads
+
+
+def sizeof(value):
+    """ Approximate resident bytes, used for LRU eviction. """
+    if hasattr(value, 'memory_usage'):
+        # pandas DataFrame (per-column Series) or Series (int); duck-typed so pandas loads lazily
+        return int(np.sum(value.memory_usage(index=True, deep=False)))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)   # OptionChain and other array containers
+    return sys.getsizeof(value)
+
+
+# ==================================================
+#                  BACKENDS
+# ==================================================
+# Entries are (value, stored_at). Backends only store; freshness policy
+# (TTL, stale window, single-flight) lives in Cache.
+class CacheBackend:
+    name = "base"
+
+    def get(self, key): raise NotImplementedError
+    def set(self, key, value, stored_at, expire): raise NotImplementedError
+    def delete(self, key): raise NotImplementedError
+    def clear(self): raise NotImplementedError
+
+    def lease(self, key, seconds):
+        """ Cross-process refresh lock; True if this process now owns the key's refresh. """
+        return True
+
+    def release(self, key):
+        pass
+
+
+class LRUBackend(CacheBackend):
+    """
+    In-process LRU bounded by approximate bytes. Values are held by reference
+    (no copy), so callers must treat cached frames as read-only.
+    """
+    name = "memory"
+
+    def __init__(self, max_bytes=LOCAL_MB * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.data = OrderedDict()   # key -> (value, stored_at, size)
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            hit = self.data.get(key)
+            if hit is None:
+                return None
+            self.data.move_to_end(key)
+            return hit[0], hit[1]
+
+    def set(self, key, value, stored_at, expire=None):
+        size = sizeof(value)
+        with self.lock:
+            old = self.data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            if size > self.max_bytes:
+                return
+            self.data[key] = (value, stored_at, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, _, sz) = self.data.popitem(last=False)
+                self.bytes -= sz
+                telemetry.count("cache_evictions", cache=self.name)
+
+    def delete(self, key):
+        with self.lock:
+            old = self.data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self.data)
+
+
+class SQLiteBackend(CacheBackend):
+    """
+    Shared cache in one SQLite file (WAL), visible to every process on the
+    host. Values are pickled. Eviction drops the oldest entries once the
+    file's payload passes max_bytes; leases live in a side table.
+    """
+    name = "sqlite"
+
+    def __init__(self, path=CACHE_PATH, max_bytes=SHARED_MB * 2 ** 20):
+        self.path, self.max_bytes = path, max_bytes
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        db = self._db()
+        db.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, stored_at REAL, expire REAL, size INTEGER)")
+        db.execute("CREATE INDEX IF NOT EXISTS cache_age ON cache(stored_at)")
+        db.execute("CREATE TABLE IF NOT EXISTS lease (key TEXT PRIMARY KEY, until REAL, owner TEXT)")
+        self._writes = 0
+
+    def _db(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key):
+        row = self._db().execute("SELECT value, stored_at, expire FROM cache WHERE key=?", (key,)).fetchone()
+        if row is None or (row[2] is not None and row[2] < time.time()):
+            return None
+        try:
+            return pickle.loads(row[0]), row[1]
+        except Exception:
+            return None
+
+    def set(self, key, value, stored_at, expire=None):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        db = self._db()
+        db.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", (key, blob, stored_at, expire, len(blob)))
+        self._writes += 1
+        if self._writes % 50 == 0:
+            self._evict(db)
+
+    def _evict(self, db):
+        db.execute("DELETE FROM cache WHERE expire IS NOT NULL AND expire < ?", (time.time(),))
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        excess, dropped = total - self.max_bytes, 0
+        for key, size in db.execute("SELECT key, size FROM cache ORDER BY stored_at").fetchall():
+            db.execute("DELETE FROM cache WHERE key=?", (key,))
+            telemetry.count("cache_evictions", cache=self.name)
+            dropped += size
+            if dropped >= excess:
+                break
+
+    def delete(self, key):
+        self._db().execute("DELETE FROM cache WHERE key=?", (key,))
+
+    def clear(self):
+        self._db().execute("DELETE FROM cache")
+
+    def lease(self, key, seconds):
+        now, owner = time.time(), f"{os.getpid()}:{threading.get_ident()}"
+        db = self._db()
+        # Take the lease only if absent or expired; one atomic statement
+        cur = db.execute(
+            "INSERT INTO lease VALUES (?, ?, ?) ON CONFLICT(key) DO UPDATE SET until=excluded.until, owner=excluded.owner "
+            "WHERE lease.until < ?", (key, now + seconds, owner, now))
+        return cur.rowcount == 1
+
+    def release(self, key):
+        self._db().execute("DELETE FROM lease WHERE key=?", (key,))
+
+
+class RedisBackend(CacheBackend):
+    """ Redis (or any RESP-compatible server) for replicas on different hosts. Needs `pip install redis`. """
+    name = "redis"
+
+    def __init__(self, url=CACHE_URL):
+        import redis
+        self.r = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self.r.get(key)
+        if raw is None:
+            return None
+        try:
+            return pickle.loads(raw)
+        except Exception:
+            return None
+
+    def set(self, key, value, stored_at, expire=None):
+        ex = max(1, int(expire - time.time())) if expire is not None else None
+        self.r.set(key, pickle.dumps((value, stored_at), protocol=pickle.HIGHEST_PROTOCOL), ex=ex)
+
+    def delete(self, key):
+        self.r.delete(key)
+
+    def clear(self):
+        for k in self.r.scan_iter("opstruct:*"):
+            self.r.delete(k)
+
+    def lease(self, key, seconds):
+        return bool(self.r.set(f"lease:{key}", os.getpid(), nx=True, ex=int(seconds)))
+
+    def release(self, key):
+        self.r.delete(f"lease:{key}")
+
+
+# ==================================================
+#                  CACHE (policy)
+# ==================================================
+class Cache:
+    """
+    TTL cache over an in-process LRU (L1) and an optional shared backend (L2).
+
+    get_or_load(key, loader, ttl, stale):
+      fresh (age < ttl)          -> cached value
+      stale (age < ttl + stale)  -> cached value now, one background reload
+      missing / expired          -> one loader call per key; concurrent callers
+                                    in this process wait on it, other processes
+                                    wait on the shared lease and read its result
+    A local copy past ttl is first checked against the shared tier, so a
+    value another process already refreshed is adopted, not re-fetched.
+    Loader errors are not cached.
+    """
+
+    def __init__(self, shared=None, local=None):
+        self.local = local if local is not None else LRUBackend()
+        self.shared = shared
+        self._inflight = {}   # key -> Event
+        self._lock = threading.Lock()
+
+    def _lookup(self, key, ttl=None):
+        """
+        L1 hit, else L2. An L1 copy at least `ttl` old is also checked against
+        L2, so a value another process refreshed is adopted, not re-fetched.
+        """
+        hit = self.local.get(key)
+        if self.shared is not None and (hit is None or (ttl is not None and time.time() - hit[1] >= ttl)):
+            try:
+                newer = self.shared.get(key)
+            except Exception:
+                newer = None
+            if newer is not None and (hit is None or newer[1] > hit[1]):
+                self.local.set(key, newer[0], newer[1])
+                hit = newer
+        return hit
+
+    def peek(self, key):
+        """ (value, stored_at) or None, without loading; always the newest copy across processes. """
+        return self._lookup(key, ttl=0)
+
+    def put(self, key, value, ttl=None, stale=0):
+        now = time.time()
+        self.local.set(key, value, now)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, value, now, now + ttl + stale if ttl is not None else None)
+            except Exception:
+                pass   # Shared tier is best-effort; L1 still serves this process
+
+    def invalidate(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            try: self.shared.delete(key)
+            except Exception: pass
+
+    def get_or_load(self, key, loader, ttl, stale=0, cache="default"):
+        hit = self._lookup(key, ttl)
+        if hit is not None:
+            age = time.time() - hit[1]
+            if age < ttl:
+                telemetry.count("cache_hits", cache=cache)
+                return hit[0]
+            if age < ttl + stale:
+                telemetry.count("cache_stale", cache=cache)
+                self._revalidate(key, loader, ttl, stale, cache)
+                return hit[0]
+        telemetry.count("cache_misses", cache=cache)
+        return self._load(key, loader, ttl, stale, cache)
+
+    def _load(self, key, loader, ttl, stale, cache):
+        with self._lock:
+            ev = self._inflight.get(key)
+            owner = ev is None
+            if owner:
+                ev = self._inflight[key] = threading.Event()
+        if not owner:
+            ev.wait()
+            hit = self._lookup(key)
+            if hit is not None:
+                return hit[0]
+            return loader()   # The owner's load failed; try ourselves
+        try:
+            return self._load_shared(key, loader, ttl, stale, cache)
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            ev.set()
+
+    def _load_shared(self, key, loader, ttl, stale, cache):
+        """ Cross-process single flight: lease holder loads, others poll for its result. """
+        leased = self.shared is None or self._try_lease(key)
+        if leased and self.shared is not None:
+            hit = self.shared.get(key)   # Another process may have finished while we queued
+            if hit is not None and time.time() - hit[1] < ttl:
+                self.shared.release(key)
+                self.local.set(key, hit[0], hit[1])
+                return hit[0]
+        if not leased:
+            telemetry.count("cache_lease_waits", cache=cache)
+            deadline = time.time() + LEASE_SECONDS
+            while time.time() < deadline:
+                time.sleep(WAIT_POLL)
+                hit = self.shared.get(key) if self.shared is not None else None
+                if hit is not None and time.time() - hit[1] < ttl:
+                    self.local.set(key, hit[0], hit[1])
+                    return hit[0]
+                if self._try_lease(key):
+                    leased = True
+                    break
+        try:
+            with telemetry.span(f"cache_fill.{cache}"):
+                value = loader()
+            self.put(key, value, ttl, stale)
+            return value
+        finally:
+            if leased and self.shared is not None:
+                try: self.shared.release(key)
+                except Exception: pass
+
+    def _try_lease(self, key):
+        try:
+            return self.shared.lease(key, LEASE_SECONDS)
+        except Exception:
+            return True   # Shared tier unavailable: behave like a local cache
+
+    def _revalidate(self, key, loader, ttl, stale, cache):
+        with self._lock:
+            if key in self._inflight:
+                return
+            self._inflight[key] = ev = threading.Event()
+
+        def run():
+            try:
+                if self.shared is None or self._try_lease(key):
+                    try:
+                        # Another process may have revalidated while our copy went stale
+                        hit = self.shared.get(key) if self.shared is not None else None
+                        if hit is not None and time.time() - hit[1] < ttl:
+                            self.local.set(key, hit[0], hit[1])
+                            return
+                        with telemetry.span(f"cache_revalidate.{cache}"):
+                            self.put(key, loader(), ttl, stale)
+                    finally:
+                        if self.shared is not None:
+                            try: self.shared.release(key)
+                            except Exception: pass
+            except Exception:
+                pass   # Keep serving the stale value; the next caller retries
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+                ev.set()
+
+        threading.Thread(target=run, daemon=True, name=f"revalidate:{key[:40]}").start()
+
+
+def _make_key(namespace, args, kwargs):
+    parts = [repr(a) for a in args] + [f"{k}={v!r}" for k, v in sorted(kwargs.items())]
+    return f"opstruct:{namespace}:" + "|".join(parts)
+
+
+def cached(namespace, ttl, stale=0):
+    """
+    Decorator: memoizes fn(*args) through the process-wide Cache.
+    Arguments must have a stable repr (symbols, dates, floats).
+    """
+    import functools
+
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            return get_cache().get_or_load(_make_key(namespace, args, kwargs),
+                                           lambda: fn(*args, **kwargs), ttl, stale, cache=namespace)
+        wrapper.uncached = fn
+        # For writers that fill the entry ahead of readers (prefetch.py)
+        wrapper.key = lambda *args, **kwargs: _make_key(namespace, args, kwargs)
+        wrapper.namespace, wrapper.ttl, wrapper.stale = namespace, ttl, stale
+        return wrapper
+    return deco
+
+
+# --- PROCESS-WIDE CACHE ---
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _shared_backend(kind):
+    if kind == "sqlite":
+        return SQLiteBackend()
+    if kind == "redis":
+        return RedisBackend()
+    return None
+
+
+def get_cache():
+    """
+    OPSTRUCT_CACHE picks the shared tier: sqlite (default, one file per
+    host), redis (OPSTRUCT_CACHE_URL) or memory (no sharing). A shared tier
+    that cannot be opened degrades to memory only.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            try:
+                shared = _shared_backend(CACHE_KIND)
+            except Exception:
+                shared = None
+            _cache = Cache(shared)
+            telemetry.gauge("cache_local_bytes", lambda: _cache.local.bytes)
+            telemetry.gauge("cache_local_entries", lambda: len(_cache.local))
+        return _cache
+
+
+def set_cache(cache):
+    global _cache
+    with _cache_lock:
+        _cache = cache
@@ -0,0 +1,368 @@
+"""
+Append-only option chain history: snapshots of a watchlist's chains,
+stored column-wise and replayed through memory maps.
+
+    python chain_store.py record --tickers SPY,QQQ,NVDA --interval 300 --expiries 6
+    python chain_store.py info --ticker SPY
+
+Layout: <root>/<TICKER>/<YYYY-MM-DD>/ holds one raw little-endian file per
+column (<col>.bin), an index of snapshots (ts, first row, rows, spot) and
+an append-only expiry dictionary (expiries.txt). Rows carry a uint16 expiry
+code instead of contract symbols, which are rebuilt from (ticker, expiry,
+type, strike). Strikes are delta-encoded: int32 1/1000 $ ticks relative to
+the previous row of the same expiry/side block (rows are sorted by strike,
+the first row of a block holds the absolute strike), decoded with one
+cumulative sum per read.
+The index row is written last, so a torn append is invisible and trimmed
+by the next one. One recorder per store; any number of readers.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from option_chain import OptionChain
+import telemetry
+
+# --- CONFIGURATION ---
+STORE_DIR = os.environ.get("OPSTRUCT_CHAIN_STORE", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".chain_store"))
+RECORD_INTERVAL = 300     # Seconds between snapshots
+RECORD_EXPIRIES = 6       # Nearest listed expiries captured per ticker
+STRIKE_TICK = 1000        # Strikes stored as integer 1/1000 $
+ATM_TARGET_DAYS = 30      # Expiry used for the ATM IV history
+MIN_RANK_DAYS = 20        # Recorded days before IV rank replaces the realized-vol proxy
+
+INDEX_DTYPE = np.dtype([('ts', '<i8'), ('start', '<i8'), ('count', '<i8'), ('spot', '<f8')])
+COLUMNS = {
+    'expiry_code': '<u2', 'strike_delta': '<i4', 'is_call': 'u1',
+    'bid': '<f4', 'ask': '<f4', 'lastPrice': '<f4', 'impliedVolatility': '<f4', 'iv': '<f4',
+    'theo_price': '<f4', 'delta': '<f4', 'gamma': '<f4', 'theta': '<f4', 'vega': '<f4',
+    'volume': '<i4', 'openInterest': '<i4',
+}
+CODE_COLS = ('expiry_code', 'strike_delta', 'is_call')
+
+
+def _ns(ts):
+    return pd.Timestamp(ts).value
+
+
+def _block_starts(expiry_code, is_call, snap_starts=(0,)):
+    """ Rows that open an expiry/side block: delta chains restart there. """
+    first = np.ones(len(expiry_code), dtype=bool)
+    first[1:] = (expiry_code[1:] != expiry_code[:-1]) | (is_call[1:] != is_call[:-1])
+    snap = np.asarray(snap_starts, dtype=np.int64)
+    first[snap[snap < len(first)]] = True
+    return first
+
+
+def _strikes(delta, first):
+    """ Decodes strike_delta rows to strikes ($): a cumulative sum restarted at each block. """
+    c = np.cumsum(delta, dtype=np.int64)
+    starts = np.flatnonzero(first)
+    base = np.r_[0, c][starts]
+    return (c - np.repeat(base, np.diff(np.append(starts, len(c))))) / STRIKE_TICK
+
+
+class _Partition:
+    """ One ticker-day directory. Dictionaries are cached and re-read when their files grow. """
+
+    def __init__(self, path):
+        self.path = path
+        self._exp = (0, [])        # (file size, names)
+
+    def _file(self, name):
+        return os.path.join(self.path, f"{name}.bin")
+
+    def index(self):
+        path = self._file("index")
+        if not os.path.exists(path) or os.path.getsize(path) < INDEX_DTYPE.itemsize:
+            return np.empty(0, INDEX_DTYPE)
+        n = os.path.getsize(path) // INDEX_DTYPE.itemsize
+        return np.memmap(path, INDEX_DTYPE, mode='r', shape=(n,))
+
+    def expiries(self):
+        path = os.path.join(self.path, "expiries.txt")
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size != self._exp[0]:
+            with open(path) as f:
+                self._exp = (size, [sys.intern(l.strip()) for l in f if l.strip()])
+        return self._exp[1]
+
+    def column(self, name, start, count):
+        """ Zero-copy read-only view of rows [start, start + count) """
+        if count == 0:
+            return np.empty(0, COLUMNS[name])
+        dtype = np.dtype(COLUMNS[name])
+        return np.memmap(self._file(name), dtype, mode='r', offset=start * dtype.itemsize, shape=(count,))
+
+    # ==================================================
+    #                  WRITE
+    # ==================================================
+    def append(self, chain, spot, ts_ns):
+        os.makedirs(self.path, exist_ok=True)
+        idx = self.index()
+        start = int(idx['start'][-1] + idx['count'][-1]) if len(idx) else 0
+        del idx
+        n = chain.n
+        for name, dt in COLUMNS.items():   # Trim rows a torn append left behind
+            path = self._file(name)
+            if os.path.exists(path) and os.path.getsize(path) > start * np.dtype(dt).itemsize:
+                os.truncate(path, start * np.dtype(dt).itemsize)
+
+        # EXPIRY DICTIONARY (append-only; codes never change)
+        names = self.expiries()
+        new = [e for e in chain.expiries if e not in names]
+        if new:
+            with open(os.path.join(self.path, "expiries.txt"), "a") as f:
+                f.write("".join(e + "\n" for e in new))
+            names = self.expiries()
+        exp_code = np.array([names.index(e) for e in chain.expiries], dtype=np.uint16)
+        counts = np.diff(np.append(chain.bounds[:, 0], n))
+
+        # STRIKES: tick deltas within each expiry/side block
+        expiry_code, is_call = np.repeat(exp_code, counts), chain.cols['is_call'].astype(np.uint8)
+        ticks = np.round(np.asarray(chain.cols['strike'], dtype=float) * STRIKE_TICK).astype(np.int64)
+        delta = np.diff(ticks, prepend=0)
+        first = _block_starts(expiry_code, is_call)
+        delta[first] = ticks[first]
+
+        data = {'expiry_code': expiry_code, 'strike_delta': delta.astype(np.int32), 'is_call': is_call}
+        for name, dt in COLUMNS.items():
+            if name in CODE_COLS: continue
+            src = chain.cols.get(name)
+            data[name] = src if src is not None else np.full(n, 0 if dt == '<i4' else np.nan)
+        for name, dt in COLUMNS.items():
+            with open(self._file(name), "ab") as f:
+                f.write(np.ascontiguousarray(data[name], dtype=dt).tobytes())
+        rec = np.array([(ts_ns, start, n, float(spot) if spot is not None else np.nan)], dtype=INDEX_DTYPE)
+        with open(self._file("index"), "ab") as f:
+            f.write(rec.tobytes())
+
+
+class ChainStore:
+    """
+    Snapshot writer and replay reader. Replayed chains are OptionChain
+    objects over read-only memory maps (only strikes are decoded into a
+    new array), so the engine, optimizer and Leg records read them
+    like a live chain; engine writes copy a column on first touch.
+    """
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self._parts = {}
+        self._lock = threading.Lock()
+
+    def _part(self, ticker, day):
+        key = (ticker.upper(), str(day))
+        with self._lock:
+            if key not in self._parts:
+                self._parts[key] = _Partition(os.path.join(self.root, key[0], key[1]))
+            return self._parts[key]
+
+    def days(self, ticker):
+        d = os.path.join(self.root, ticker.upper())
+        return sorted(os.listdir(d)) if os.path.isdir(d) else []
+
+    @telemetry.traced("chain_store.append")
+    def append(self, chain, spot=None, ts=None):
+        """ Records one snapshot (an OptionChain, any number of expiries). """
+        ts = pd.Timestamp(ts or datetime.now())
+        part = self._part(chain.ticker, ts.date())
+        with self._lock:
+            part.append(chain, spot, ts.value)
+        telemetry.count("chain_snapshots", ticker=chain.ticker)
+
+    def snapshots(self, ticker, start=None, end=None):
+        """ DataFrame of (ts, spot, rows) for snapshots in [start, end] """
+        rows = []
+        for day in self._day_range(ticker, start, end):
+            idx = self._part(ticker, day).index()
+            rows.append(pd.DataFrame({'ts': pd.to_datetime(np.asarray(idx['ts'])), 'spot': np.asarray(idx['spot']),
+                                      'rows': np.asarray(idx['count'])}))
+        out = pd.concat(rows, ignore_index=True) if rows else pd.DataFrame(columns=['ts', 'spot', 'rows'])
+        if start is not None: out = out[out['ts'] >= pd.Timestamp(start)]
+        if end is not None: out = out[out['ts'] <= pd.Timestamp(end)]
+        return out.reset_index(drop=True)
+
+    def _day_range(self, ticker, start, end):
+        lo = str(pd.Timestamp(start).date()) if start is not None else ""
+        hi = str(pd.Timestamp(end).date()) if end is not None else "9999"
+        return [d for d in self.days(ticker) if lo <= d <= hi]
+
+    # ==================================================
+    #                  REPLAY
+    # ==================================================
+    @telemetry.traced("chain_store.at")
+    def at(self, ticker, ts=None):
+        """
+        (OptionChain, spot, snapshot time) for the latest snapshot at or
+        before ts (default: latest), or (None, None, None).
+        """
+        target = _ns(ts or datetime.now())
+        for day in reversed(self._day_range(ticker, None, pd.Timestamp(target))):
+            part = self._part(ticker, day)
+            idx = part.index()
+            i = int(np.searchsorted(idx['ts'], target, side='right')) - 1
+            if i >= 0:
+                rec = idx[i]
+                return self._chain(ticker, part, int(rec['start']), int(rec['count'])), float(rec['spot']), pd.Timestamp(int(rec['ts']))
+        return None, None, None
+
+    def _chain(self, ticker, part, start, count):
+        cols = {name: part.column(name, start, count) for name in COLUMNS if name not in CODE_COLS}
+        cols['is_call'] = part.column('is_call', start, count).view(bool)
+        ec = part.column('expiry_code', start, count)
+        cols['strike'] = _strikes(part.column('strike_delta', start, count),
+                                  _block_starts(ec, cols['is_call'])).astype(np.float32)
+        # Rows were written in OptionChain order: expiry blocks, calls then puts
+        first = np.flatnonzero(np.r_[True, ec[1:] != ec[:-1]]) if count else np.empty(0, int)
+        ends = np.append(first[1:], count)
+        n_calls = np.add.reduceat(cols['is_call'].astype(np.int32), first) if count else np.empty(0, int)
+        bounds = np.stack([first, first + n_calls, ends], 1).astype(np.int32) if count else np.empty((0, 3), np.int32)
+        names = part.expiries()
+        return OptionChain(ticker, [names[c] for c in ec[first]], bounds, cols)
+
+    @telemetry.traced("chain_store.range")
+    def range(self, ticker, start, end, columns=('iv', 'delta', 'bid', 'ask')):
+        """
+        Every row of every snapshot in [start, end] as flat arrays: ts, spot,
+        expiry (datetime64[D]), is_call, strike plus the requested columns.
+        Value columns are memory-map views when the range sits in one day.
+        """
+        t0, t1 = _ns(start), _ns(end)
+        chunks = []
+        for day in self._day_range(ticker, start, end):
+            part = self._part(ticker, day)
+            idx = part.index()
+            lo, hi = np.searchsorted(idx['ts'], t0, 'left'), np.searchsorted(idx['ts'], t1, 'right')
+            if hi <= lo: continue
+            sel = np.asarray(idx[lo:hi])
+            a, n = int(sel['start'][0]), int(sel['start'][-1] + sel['count'][-1] - sel['start'][0])
+            exp = np.array(part.expiries(), dtype='datetime64[D]')
+            ec, is_call = part.column('expiry_code', a, n), part.column('is_call', a, n).view(bool)
+            chunk = {'ts': np.repeat(sel['ts'].astype('datetime64[ns]'), sel['count']),
+                     'spot': np.repeat(sel['spot'], sel['count']),
+                     'expiry': exp[ec],
+                     'is_call': is_call,
+                     'strike': _strikes(part.column('strike_delta', a, n),
+                                        _block_starts(ec, is_call, sel['start'] - a))}
+            chunk.update({c: part.column(c, a, n) for c in columns})
+            chunks.append(chunk)
+        if not chunks:
+            return {}
+        if len(chunks) == 1:
+            return chunks[0]
+        return {k: np.concatenate([c[k] for c in chunks]) for k in chunks[0]}
+
+    def atm_iv(self, ticker, start, end, target_days=ATM_TARGET_DAYS):
+        """
+        ATM implied vol per snapshot: the call nearest spot on the expiry
+        nearest target_days out. Series indexed by snapshot time.
+        """
+        r = self.range(ticker, start, end, columns=('iv',))
+        if not r:
+            return pd.Series(dtype=float)
+        df = pd.DataFrame({'ts': r['ts'], 'iv': np.asarray(r['iv'], dtype=float),
+                           'dte_gap': np.abs((r['expiry'] - r['ts'].astype('datetime64[D]')).astype(int) - target_days),
+                           'moneyness': np.abs(r['strike'] / r['spot'] - 1)})
+        df = df[r['is_call'] & np.isfinite(df['iv'].to_numpy())]
+        best = df.sort_values(['ts', 'dte_gap', 'moneyness']).drop_duplicates('ts')
+        return best.set_index('ts')['iv']
+
+    def iv_rank(self, ticker, lookback_days=365, now=None, min_days=MIN_RANK_DAYS):
+        """
+        (current ATM IV, IV rank 0-100 over daily closes of the lookback), or
+        (None, None) with fewer than min_days of history.
+        """
+        now = pd.Timestamp(now or datetime.now())
+        if len(self._day_range(ticker, now - timedelta(days=lookback_days), now)) < min_days:
+            return None, None
+        iv = self.atm_iv(ticker, now - timedelta(days=lookback_days), now)
+        if iv.empty:
+            return None, None
+        daily = iv.groupby(iv.index.date).last()
+        lo, hi, cur = daily.min(), daily.max(), float(iv.iloc[-1])
+        return cur, float((cur - lo) / (hi - lo) * 100) if hi > lo else 50.0
+
+
+_store = None
+
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = ChainStore()
+    return _store
+
+
+# ==================================================
+#                  RECORDER
+# ==================================================
+class Recorder:
+    """ Snapshots each watchlist ticker's nearest expiries every `interval` seconds. """
+
+    def __init__(self, tickers, interval=RECORD_INTERVAL, n_expiries=RECORD_EXPIRIES, store=None):
+        self.tickers = [t.upper() for t in tickers]
+        self.interval, self.n_expiries = interval, n_expiries
+        self.store = store or get_store()
+        self.stop = threading.Event()
+
+    def snapshot(self, ticker):
+        import service
+        spot = service.spot_price(ticker)
+        expiries = service.list_expiries(ticker)[:self.n_expiries]
+        chain, _ = service.compact_surface(ticker, expiries, spot)
+        if chain is not None:
+            self.store.append(chain, spot)
+        return chain
+
+    def run_once(self):
+        for t in self.tickers:
+            try:
+                self.snapshot(t)
+            except Exception:
+                telemetry.count("chain_snapshot_errors", ticker=t)
+
+    def run(self):
+        """ Blocks; snapshots are aligned to interval boundaries. """
+        while not self.stop.is_set():
+            self.run_once()
+            self.stop.wait(self.interval - time.time() % self.interval)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True, name="chain-recorder").start()
+        return self
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="OpStruct option chain recorder")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    r = sub.add_parser("record", help="snapshot a watchlist on a fixed interval")
+    r.add_argument("--tickers", required=True, help="comma separated")
+    r.add_argument("--interval", type=int, default=RECORD_INTERVAL)
+    r.add_argument("--expiries", type=int, default=RECORD_EXPIRIES)
+    r.add_argument("--once", action="store_true", help="one snapshot per ticker, then exit")
+    i = sub.add_parser("info", help="snapshot counts and ATM IV history for a ticker")
+    i.add_argument("--ticker", required=True)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "record":
+        rec = Recorder(args.tickers.split(","), args.interval, args.expiries)
+        rec.run_once() if args.once else rec.run()
+        return 0
+    store = get_store()
+    snaps = store.snapshots(args.ticker)
+    print(f"{args.ticker.upper()}: {len(snaps)} snapshots over {len(store.days(args.ticker))} days")
+    if len(snaps):
+        cur, rank = store.iv_rank(args.ticker)
+        print(f"  latest {snaps['ts'].iloc[-1]}  ATM IV {cur if cur is None else f'{cur:.1%}'}  IV rank {rank if rank is None else f'{rank:.0f}'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,426 @@
+import os
+import re
+import threading
+import time
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+import telemetry
+import cache_backend
+import upstream
+
+# --- CONFIGURATION ---
+BAR_STORE_DIR = os.environ.get(
+    "OPSTRUCT_BAR_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".bar_store")
+)
+REFRESH_TTL = 300       # Seconds before a symbol is re-checked upstream for new bars
+MIN_DEPTH_DAYS = 400    # Cold symbols are always backfilled at least this far
+ADJ_TOL = 1e-4          # Relative close drift on an overlapping closed bar that means history was re-adjusted
+BAR_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Calendar days covered by the yfinance-style period strings we use
+PERIOD_DAYS = {
+    "1mo": 31, "3mo": 92, "6mo": 183, "1y": 366,
+    "2y": 731, "5y": 1827, "10y": 3653, "max": 365 * 30
+}
+
+
+def _normalize_bars(df):
+    """Coerces a raw download into a tz-naive, date-indexed OHLCV frame."""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS)
+    df = df.copy()
+    df.index = pd.to_datetime(df.index)
+    if df.index.tz is not None:
+        df.index = df.index.tz_localize(None)
+    df.index = df.index.normalize()
+    df.index.name = 'Date'
+    cols = [c for c in BAR_COLUMNS if c in df.columns]
+    df = df[cols].dropna(how='all')
+    return df[~df.index.duplicated(keep='last')].sort_index()
+
+
+def _rebased(old, new):
+    """
+    True when a closed bar held by both frames has a different close, i.e.
+    upstream re-adjusted its history (dividend or split) since `old` was
+    stored. The stored last bar is excluded: it may be an intraday partial.
+    """
+    if 'Close' not in old or 'Close' not in new:
+        return False
+    common = old.index[:-1].intersection(new.index)
+    if common.empty:
+        return False
+    a = old.loc[common, 'Close'].to_numpy(dtype=float)
+    b = new.loc[common, 'Close'].to_numpy(dtype=float)
+    return not np.allclose(a, b, rtol=ADJ_TOL, atol=0, equal_nan=True)
+
+
+def _split_download(data, symbols):
+    """Splits a (possibly MultiIndex) yf.download frame into {symbol: bars}."""
+    frames = {}
+    if data is None or data.empty:
+        return frames
+    if isinstance(data.columns, pd.MultiIndex):
+        lvl0 = set(data.columns.get_level_values(0))
+        lvl1 = set(data.columns.get_level_values(1))
+        for s in symbols:
+            if s in lvl0:
+                frames[s] = _normalize_bars(data[s])
+            elif s in lvl1:
+                frames[s] = _normalize_bars(data.xs(s, axis=1, level=1))
+    elif len(symbols) == 1:
+        frames[symbols[0]] = _normalize_bars(data)
+    return frames
+
+
+def period_start(period):
+    """Earliest calendar date a period string can reach back to."""
+    today = pd.Timestamp(datetime.now().date())
+    if period.endswith('d') and period[:-1].isdigit():
+        # Trading-day periods: pad for weekends and holidays
+        return today - pd.Timedelta(days=int(period[:-1]) * 2 + 7)
+    return today - pd.Timedelta(days=PERIOD_DAYS.get(period, 366))
+
+
+def _window(df, period):
+    """Slices stored bars down to a yfinance-style period."""
+    if df.empty:
+        return df
+    if period.endswith('d') and period[:-1].isdigit():
+        return df.tail(int(period[:-1]))
+    today = pd.Timestamp(datetime.now().date())
+    return df[df.index >= today - pd.Timedelta(days=PERIOD_DAYS.get(period, 366))]
+
+
+# ==================================================
+#                  PROVIDERS
+# ==================================================
+class MarketDataProvider:
+    """
+    Interface for daily bar sources.
+    fetch_bars() returns {symbol: OHLCV DataFrame} for bars dated >= start.
+    """
+    name = "base"
+
+    def fetch_bars(self, symbols, start, end=None):
+        raise NotImplementedError
+
+
+class YFinanceProvider(MarketDataProvider):
+    name = "yfinance"
+
+    def fetch_bars(self, symbols, start, end=None):
+        import yfinance as yf
+        symbols = list(symbols)
+        # Every call goes through the Yahoo gateway (rate limit, retries, breaker)
+        if len(symbols) == 1:
+            # Ticker.history keeps no shared module state, so it is safe to run
+            # from several threads at once (yf.download is not)
+            data = upstream.yahoo(
+                upstream.yf_ticker(symbols[0]).history,
+                start=start.strftime('%Y-%m-%d'),
+                end=end.strftime('%Y-%m-%d') if end is not None else None
+            )
+            return {symbols[0]: _normalize_bars(data)} if not data.empty else {}
+        data = upstream.yahoo(
+            yf.download, symbols, start=start.strftime('%Y-%m-%d'),
+            end=end.strftime('%Y-%m-%d') if end is not None else None,
+            group_by='ticker', progress=False, session=upstream.session()
+        )
+        return _split_download(data, symbols)
+
+
+class LocalFileProvider(MarketDataProvider):
+    """
+    Offline backend. Reads <root>/<SYMBOL>.parquet or <root>/<SYMBOL>.csv
+    with a Date column (or index) and OHLCV columns.
+    """
+    name = "local"
+
+    def __init__(self, root):
+        self.root = root
+
+    def fetch_bars(self, symbols, start, end=None):
+        frames = {}
+        for s in symbols:
+            base = os.path.join(self.root, _safe_name(s))
+            if os.path.exists(base + ".parquet"):
+                df = pd.read_parquet(base + ".parquet")
+            elif os.path.exists(base + ".csv"):
+                df = pd.read_csv(base + ".csv", index_col=0, parse_dates=True)
+            else:
+                continue
+            df = _normalize_bars(df)
+            df = df[df.index >= pd.Timestamp(start)]
+            if end is not None:
+                df = df[df.index < pd.Timestamp(end)]
+            frames[s] = df
+        return frames
+
+
+def _safe_name(symbol):
+    return re.sub(r'[^A-Za-z0-9.\-]', '_', symbol)
+
+
+# ==================================================
+#                  BAR STORE
+# ==================================================
+class BarStore:
+    """
+    Persistent Parquet-backed daily bar cache sitting in front of a provider.
+
+    - Each symbol lives in one file; it is read from disk once per process and
+      kept in memory, so overlapping windows (5d, 1y, ...) share a single read.
+    - Upstream is only asked for bars from the second-to-last stored date
+      onward: the last bar is re-fetched because it may be an intraday
+      partial, and the closed bar before it must match what is stored.
+      Yahoo closes are dividend/split adjusted, so a mismatch means history
+      was re-adjusted and the symbol is re-fetched in full rather than
+      spliced across two adjustment bases.
+    - With a `shared` cache_backend.Cache, every refresh is published there and
+      a symbol another replica refreshed within the TTL is adopted instead of
+      re-fetched.
+    """
+
+    def __init__(self, provider=None, root=BAR_STORE_DIR, refresh_ttl=REFRESH_TTL, shared=None):
+        self.provider = provider or YFinanceProvider()
+        self.root = root
+        self.refresh_ttl = refresh_ttl
+        self.shared = shared
+        self._frames = {}
+        self._closes = {}   # symbol -> (dates, closes) arrays of the stored frame
+        self._checked = {}
+        self._backfilled = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, symbol):
+        return os.path.join(self.root, _safe_name(symbol) + ".parquet")
+
+    def _load(self, symbol):
+        if symbol not in self._frames:
+            path = self._path(symbol)
+            try:
+                self._frames[symbol] = _normalize_bars(pd.read_parquet(path)) if os.path.exists(path) else _normalize_bars(None)
+            except Exception:
+                self._frames[symbol] = _normalize_bars(None)
+        return self._frames[symbol]
+
+    def _save(self, symbol, df):
+        self._frames[symbol] = df
+        self._closes.pop(symbol, None)
+        try:
+            df.to_parquet(self._path(symbol))
+        except Exception:
+            pass  # Disk cache is best-effort; the in-memory copy still serves
+
+    def _close_arrays(self, symbol):
+        """ (dates, closes) ndarrays of the stored bars, cached until the next save. """
+        if symbol not in self._closes:
+            df = self._load(symbol)
+            closes = df['Close'].to_numpy(dtype=float) if 'Close' in df else np.full(len(df), np.nan)
+            self._closes[symbol] = (df.index.values.astype('datetime64[ns]'), closes)
+        return self._closes[symbol]
+
+    def _adopt_shared(self, symbol):
+        """Takes a newer copy of the symbol's bars from the shared tier, if one exists."""
+        try:
+            hit = self.shared.peek(f"opstruct:bars:{symbol}")
+        except Exception:
+            return
+        if hit is None or hit[1] <= self._checked.get(symbol, 0):
+            return
+        (frame, backfilled), stamp = hit
+        self._checked[symbol] = stamp
+        self._backfilled[symbol] = min(backfilled, self._backfilled.get(symbol, backfilled))
+        self._save(symbol, frame)
+
+    def _plan(self, symbols, period, ttl=None):
+        """Groups symbols by the date upstream needs to be queried from."""
+        ttl = self.refresh_ttl if ttl is None else ttl
+        need_start = period_start(period)
+        cold_start = min(need_start, pd.Timestamp(datetime.now().date()) - pd.Timedelta(days=MIN_DEPTH_DAYS))
+        now = time.time()
+        plan = {}
+        for s in symbols:
+            if self.shared is not None and now - self._checked.get(s, 0) > ttl:
+                self._adopt_shared(s)
+            df = self._load(s)
+            shallow = df.empty or (df.index[0] > need_start + pd.Timedelta(days=7)
+                                   and self._backfilled.get(s, pd.Timestamp.max) > need_start)
+            if shallow:
+                start = cold_start
+            elif now - self._checked.get(s, 0) > ttl:
+                start = df.index[-2] if len(df) > 1 else df.index[-1]
+            else:
+                continue
+            plan.setdefault(start, []).append(s)
+        return plan
+
+    def pending(self, symbols, period="1y", ttl=None):
+        """ {start: [symbols]} refresh() would fetch now: one upstream call per group. """
+        with self._lock:
+            return self._plan(symbols, period, ttl)
+
+    def refresh(self, symbols, period="1y", ttl=None):
+        """
+        Pulls only the missing bars for each symbol and persists them.
+        Symbols another thread is already fetching are waited on, not re-fetched.
+        ttl overrides refresh_ttl (a prefetcher refreshing ahead of readers).
+        """
+        waits = []
+        with self._lock:
+            plan = self._plan(symbols, period, ttl)
+            stale = sum(len(g) for g in plan.values())
+        telemetry.count("cache_hits", len(symbols) - stale, cache="bar_store")
+        telemetry.count("cache_misses", stale, cache="bar_store")
+        with self._lock:
+            for start in list(plan):
+                mine = []
+                for s in plan[start]:
+                    if s in self._inflight:
+                        waits.append(self._inflight[s])
+                    else:
+                        self._inflight[s] = threading.Event()
+                        mine.append(s)
+                if mine: plan[start] = mine
+                else: del plan[start]
+        published = []
+        rebase = {}
+        try:
+            for start, group in plan.items():
+                try:
+                    with telemetry.span(f"upstream.{self.provider.name}", symbols=len(group)):
+                        fetched = self.provider.fetch_bars(group, start)
+                except Exception:
+                    telemetry.count("upstream_errors", provider=self.provider.name)
+                    continue
+                with self._lock:
+                    now = time.time()
+                    for s in group:
+                        self._checked[s] = now
+                        self._backfilled[s] = min(start, self._backfilled.get(s, start))
+                        new = fetched.get(s)
+                        if new is None or new.empty:
+                            continue
+                        old = self._load(s)
+                        if not old.empty and _rebased(old, new):
+                            rebase.setdefault(min(old.index[0], self._backfilled[s]), []).append(s)
+                            continue
+                        merged = pd.concat([old[old.index < new.index[0]], new]) if not old.empty else new
+                        self._save(s, merged)
+                        published.append((s, merged, self._backfilled[s]))
+            # Re-adjusted upstream: replace the whole history, never splice it
+            for start, group in rebase.items():
+                telemetry.count("bar_rebases", len(group), provider=self.provider.name)
+                try:
+                    with telemetry.span(f"upstream.{self.provider.name}", symbols=len(group)):
+                        fetched = self.provider.fetch_bars(group, start)
+                except Exception:
+                    telemetry.count("upstream_errors", provider=self.provider.name)
+                    with self._lock:
+                        for s in group:
+                            self._checked.pop(s, None)   # retry on the next read
+                    continue
+                with self._lock:
+                    for s in group:
+                        new = fetched.get(s)
+                        if new is None or new.empty:
+                            continue
+                        self._backfilled[s] = min(start, self._backfilled[s])
+                        self._save(s, new)
+                        published.append((s, new, self._backfilled[s]))
+        finally:
+            with self._lock:
+                for group in plan.values():
+                    for s in group:
+                        self._inflight.pop(s).set()
+        if self.shared is not None:
+            for s, frame, backfilled in published:
+                self.shared.put(f"opstruct:bars:{s}", (frame, backfilled), ttl=self.refresh_ttl, stale=MIN_DEPTH_DAYS * 86400)
+        for ev in waits:
+            ev.wait()
+
+    @telemetry.traced("bar_store.get_bars")
+    def get_bars(self, symbol, period="1y"):
+        """OHLCV bars for one symbol over a yfinance-style period."""
+        self.refresh([symbol], period)
+        with self._lock:
+            return _window(self._load(symbol), period).copy()
+
+    @telemetry.traced("bar_store.get_closes")
+    def get_closes(self, symbols, period="1y"):
+        """Wide dates x symbols Close panel, the shape yf.download(...)['Close'] gives."""
+        symbols = list(symbols)
+        self.refresh(symbols, period)
+        with self._lock:
+            cols = {s: _window(self._load(s), period)['Close'] for s in symbols if not self._load(s).empty}
+        if not cols:
+            return pd.DataFrame()
+        return pd.DataFrame(cols).sort_index()
+
+    @telemetry.traced("bar_store.tail_closes")
+    def tail_closes(self, symbols, n):
+        """
+        Last n stored closes per symbol as (dates, symbols, closes): the same
+        panel get_closes(symbols, f"{n}d") gives, built straight from cached
+        arrays. Symbols with no bars are dropped; gaps are NaN.
+        """
+        symbols = list(symbols)
+        self.refresh(symbols, f"{n}d")
+        with self._lock:
+            tails = [(s, self._close_arrays(s)) for s in symbols]
+        tails = [(s, d[-n:], c[-n:]) for s, (d, c) in tails if len(d)]
+        if not tails:
+            return np.array([], dtype='datetime64[ns]'), [], np.empty((0, 0))
+        all_d = np.concatenate([d for _, d, _ in tails])
+        dates = np.unique(all_d)
+        cols = np.repeat(np.arange(len(tails)), [len(d) for _, d, _ in tails])
+        out = np.full((len(dates), len(tails)), np.nan)
+        out[np.searchsorted(dates, all_d), cols] = np.concatenate([c for _, _, c in tails])
+        return dates, [s for s, _, _ in tails], out
+
+
+# --- DEFAULT STORE ---
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_store():
+    """
+    Process-wide BarStore. OPSTRUCT_DATA_PROVIDER=local with
+    OPSTRUCT_LOCAL_DATA_DIR=<dir> switches to the offline file backend.
+    """
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            if os.environ.get("OPSTRUCT_DATA_PROVIDER", "yfinance") == "local":
+                provider = LocalFileProvider(os.environ.get("OPSTRUCT_LOCAL_DATA_DIR", "data"))
+            else:
+                provider = YFinanceProvider()
+            _default_store = BarStore(provider, shared=cache_backend.get_cache())
+            telemetry.gauge("bar_store_symbols", lambda: len(get_store()._frames))
+        return _default_store
+
+
+def set_store(store):
+    """Swap the process-wide store (e.g. a LocalFileProvider store for offline runs)."""
+    global _default_store
+    with _default_lock:
+        _default_store = store
+
+
+def get_closes(symbols, period="1y"):
+    return get_store().get_closes(symbols, period)
+
+
+def get_bars(symbol, period="1y"):
+    return get_store().get_bars(symbol, period)
+
+
+def tail_closes(symbols, n):
+    return get_store().tail_closes(symbols, n)
@@ -0,0 +1,60 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import data_provider
+import telemetry
+
+# --- CONFIGURATION ---
+MAX_WORKERS = 8   # Bounded fan-out so a page never opens dozens of upstream sockets
+
+
+class FetchPlan:
+    """
+    Collects every (symbols, period) a page needs, merges overlapping requests
+    into one fetch per symbol (the longest period wins) and runs those fetches
+    concurrently against the shared BarStore. Consumers then read their slices
+    from the warm store with no further network I/O.
+
+        plan = FetchPlan()
+        plan.need(market_utils.REGIME_TICKERS, "1y")
+        plan.need(market_utils.PULSE_TICKERS, "5d")
+        plan.execute()
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self.needs = {}   # symbol -> period
+
+    def need(self, symbols, period):
+        for s in symbols:
+            cur = self.needs.get(s)
+            if cur is None or data_provider.period_start(period) < data_provider.period_start(cur):
+                self.needs[s] = period
+        return self
+
+    @telemetry.traced("fetch.prefetch")
+    def execute(self, max_workers=MAX_WORKERS):
+        """ One refresh per symbol on a bounded thread pool; returns once all have landed. """
+        store = self.store or data_provider.get_store()
+        if not self.needs:
+            return self
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(self.needs))) as pool:
+            list(pool.map(lambda item: store.refresh([item[0]], item[1]), self.needs.items()))
+        return self
+
+    def closes(self, symbols, period):
+        """ A consumer's slice (served from the store the plan just warmed). """
+        return (self.store or data_provider.get_store()).get_closes(symbols, period)
+
+
+def prefetch(requests, max_workers=MAX_WORKERS, store=None):
+    """ requests: iterable of (symbols, period). """
+    plan = FetchPlan(store)
+    for symbols, period in requests:
+        plan.need(symbols, period)
+    return plan.execute(max_workers)
+
+
+def run_parallel(*funcs, max_workers=MAX_WORKERS):
+    """ Runs independent zero-arg callables concurrently, results in call order. """
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(funcs))) as pool:
+        return [f.result() for f in [pool.submit(fn) for fn in funcs]]
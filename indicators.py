@@ -0,0 +1,291 @@
+import os
+import copy
+import math
+import pickle
+import tempfile
+import threading
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURATION ---
+STATE_DIR = os.environ.get(
+    "OPSTRUCT_INDICATOR_STATE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".indicator_state")
+)
+
+
+# ==================================================
+#                  O(1) ROLLING PRIMITIVES
+# ==================================================
+class RollingMeanStd:
+    """
+    Fixed-window mean/std with O(1) updates (Welford add + remove).
+    std uses ddof=1 to match pandas rolling().std().
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.buf = deque()
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def update(self, x):
+        if x is None or not math.isfinite(x):
+            return
+        self.buf.append(x)
+        n = len(self.buf)
+        delta = x - self.mean
+        self.mean += delta / n
+        self.m2 += delta * (x - self.mean)
+        if n > self.window:
+            old = self.buf.popleft()
+            n -= 1
+            delta = old - self.mean
+            self.mean -= delta / n
+            self.m2 -= delta * (old - self.mean)
+
+    @property
+    def ready(self):
+        return len(self.buf) == self.window
+
+    @property
+    def std(self):
+        n = len(self.buf)
+        return math.sqrt(max(self.m2, 0.0) / (n - 1)) if n > 1 else float('nan')
+
+    @property
+    def value(self):
+        return self.mean if self.ready else float('nan')
+
+
+class RollingMinMax:
+    """ Fixed-window min and max via monotonic deques (amortized O(1)). """
+
+    def __init__(self, window):
+        self.window = window
+        self.t = 0
+        self.mins = deque()   # (t, x) increasing x
+        self.maxs = deque()   # (t, x) decreasing x
+
+    def update(self, x):
+        if x is None or not math.isfinite(x):
+            return
+        while self.mins and self.mins[-1][1] >= x: self.mins.pop()
+        while self.maxs and self.maxs[-1][1] <= x: self.maxs.pop()
+        self.mins.append((self.t, x))
+        self.maxs.append((self.t, x))
+        expired = self.t - self.window
+        while self.mins[0][0] <= expired: self.mins.popleft()
+        while self.maxs[0][0] <= expired: self.maxs.popleft()
+        self.t += 1
+
+    @property
+    def min(self):
+        return self.mins[0][1] if self.mins else float('nan')
+
+    @property
+    def max(self):
+        return self.maxs[0][1] if self.maxs else float('nan')
+
+
+class Ratio:
+    """ Latest a/b plus the ratio `lag` updates ago (e.g. XLY/XLP vs 1 week ago). """
+
+    def __init__(self, lag=0):
+        self.hist = deque(maxlen=lag + 1)
+
+    def update(self, a, b):
+        if a is None or b is None or not (math.isfinite(a) and math.isfinite(b)) or b == 0:
+            return
+        self.hist.append(a / b)
+
+    @property
+    def value(self):
+        return self.hist[-1] if self.hist else float('nan')
+
+    @property
+    def lagged(self):
+        return self.hist[0] if len(self.hist) == self.hist.maxlen else float('nan')
+
+
+class RealizedVol:
+    """
+    Rolling annualized close-to-close vol (%), its 52-week range and IV rank.
+    The range covers the vol readings a 252-bar year produces (252 - window).
+    """
+
+    def __init__(self, window=30, lookback=None):
+        self.stats = RollingMeanStd(window)
+        self.range = RollingMinMax(lookback or 252 - window)
+        self.last_close = None
+        self.vol = float('nan')
+
+    def seed(self, last_close, returns, vols):
+        """
+        Bulk-initializes from vectorized history (e.g. realized_vol_panel output)
+        instead of replaying it bar by bar: the last `window` log returns and
+        the vol series over the lookback.
+        """
+        returns = np.asarray(returns, dtype=float)
+        returns = returns[np.isfinite(returns)][-self.stats.window:]
+        self.stats.buf = deque(returns.tolist())
+        self.stats.mean = float(returns.mean()) if returns.size else 0.0
+        self.stats.m2 = float(((returns - self.stats.mean) ** 2).sum()) if returns.size else 0.0
+        vols = np.asarray(vols, dtype=float)
+        for v in vols[np.isfinite(vols)][-self.range.window:]:
+            self.range.update(float(v))
+        self.vol = float(vols[np.isfinite(vols)][-1]) if np.isfinite(vols).any() else float('nan')
+        self.last_close = float(last_close)
+
+    def update(self, close):
+        if close is None or not math.isfinite(close) or close <= 0:
+            return
+        if self.last_close is not None:
+            self.stats.update(math.log(close / self.last_close))
+            if self.stats.ready:
+                self.vol = self.stats.std * math.sqrt(252) * 100
+                self.range.update(self.vol)
+        self.last_close = close
+
+    @property
+    def iv_rank(self):
+        return self._rank(self.vol, self.range.min, self.range.max)
+
+    @staticmethod
+    def _rank(vol, lo, hi):
+        return (vol - lo) / (hi - lo) * 100 if hi > lo else 0.0
+
+    def peek(self, close):
+        """
+        (vol, iv_rank) as if `close` were appended, without mutating state.
+        O(window); used for the provisional intraday bar.
+        """
+        if self.last_close is None or close is None or not math.isfinite(close) or close <= 0:
+            return self.vol, self.iv_rank
+        rets = list(self.stats.buf)[1:] + [math.log(close / self.last_close)]
+        if len(rets) < self.stats.window:
+            return self.vol, self.iv_rank
+        vol = float(np.std(rets, ddof=1)) * math.sqrt(252) * 100
+        return vol, self._rank(vol, min(self.range.min, vol), max(self.range.max, vol))
+
+
+# ==================================================
+#                  INDICATOR ENGINE
+# ==================================================
+class IndicatorEngine:
+    """
+    Keyed bag of O(1) indicators fed one dated bar at a time.
+
+    Each indicator remembers the last bar date it consumed, so replaying
+    overlapping history is idempotent: only bars newer than the stored state
+    are applied. Bars dated today are treated as provisional (intraday) and
+    are applied to a throwaway copy, never to the persisted state.
+    State is pickled to STATE_DIR between runs.
+    """
+
+    def __init__(self, name, state_dir=STATE_DIR):
+        self.path = os.path.join(state_dir, f"{name}.pkl")
+        self.state = {}     # key -> indicator
+        self.cursor = {}    # key -> last closed bar date applied
+        self._dirty = False
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, "rb") as f:
+                self.state, self.cursor = pickle.load(f)
+        except Exception:
+            pass
+
+    def is_warm(self, keys):
+        return all(k in self.cursor for k in keys)
+
+    def covers(self, key, bars):
+        """ True when `bars` starts at or before the key's cursor (no gap to fill). """
+        last = self.cursor.get(key)
+        return last is not None and (bars.empty or bars.index[0] <= last)
+
+    def covers_all(self, keys, first_dates):
+        """
+        Vectorized covers(): first_dates[i] is the earliest bar on hand for
+        keys[i] (NaT when there are none).
+        """
+        nat = np.datetime64('NaT', 'ns')
+        last = np.array([np.datetime64(self.cursor.get(k, nat), 'ns') for k in keys], dtype='datetime64[ns]')
+        first = np.asarray(first_dates, dtype='datetime64[ns]')
+        return bool(np.all(~np.isnat(last) & (np.isnat(first) | (first <= last))))
+
+    def seed(self, key, indicator, last_date):
+        with self._lock:
+            self.state[key] = indicator
+            self.cursor[key] = last_date
+            self._dirty = True
+
+    def feed(self, key, factory, bars, apply, today=None):
+        """
+        Applies apply(indicator, row) for every row of `bars` (date-indexed)
+        newer than the key's cursor. Returns the indicator as of the last row.
+        """
+        return self.feed_values(key, factory, bars.index.values, list(bars.itertuples(index=False)), apply, today)
+
+    def feed_values(self, key, factory, dates, values, apply, today=None):
+        """
+        Array form of feed(): dates (datetime64, ascending) aligned with values.
+        Skips the pandas machinery, which dominates when thousands of keys each
+        receive one new bar.
+        """
+        today = np.datetime64(today or pd.Timestamp(datetime.now().date()), 'ns')
+        with self._lock:
+            if key not in self.state:
+                self.state[key] = factory()
+            ind = self.state[key]
+            last = self.cursor.get(key)
+            start = 0 if last is None else int(np.searchsorted(dates, np.datetime64(last, 'ns'), side='right'))
+            split = max(start, int(np.searchsorted(dates, today, side='left')))
+            for i in range(start, split):
+                apply(ind, values[i])
+            if split > start:
+                self.cursor[key] = pd.Timestamp(dates[split - 1])
+                self._dirty = True
+            if split < len(dates):
+                ind = copy.deepcopy(ind)
+                for i in range(split, len(dates)):
+                    apply(ind, values[i])
+            return ind
+
+    def save(self):
+        """ Persists state if any closed bar was applied since the last save. """
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp = None
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                # A private temp file per writer: pool workers and replicas save the same engine
+                fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    pickle.dump((self.state, self.cursor), f)
+                os.replace(tmp, self.path)
+                self._dirty = False
+            except Exception:
+                if tmp is not None and os.path.exists(tmp):
+                    os.remove(tmp)
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(name):
+    """ Process-wide IndicatorEngine per name (loaded from disk on first use). """
+    with _engines_lock:
+        if name not in _engines:
+            _engines[name] = IndicatorEngine(name)
+        return _engines[name]
+
+
+def feed_closes(engine, key, closes, factory, apply, today=None):
+    """ feed() for a single Close series: apply(indicator, close). """
+    s = closes.dropna()
+    return engine.feed(key, factory, pd.DataFrame({'c': s}), lambda ind, row: apply(ind, row.c), today)
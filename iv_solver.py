@@ -0,0 +1,103 @@
+import numpy as np
+
+from pricing_kernels import bsm
+
+# --- CONFIGURATION ---
+IV_TOL = 1e-6        # Absolute price error (per share) treated as converged
+IV_MAX_ITER = 50     # Newton/bisection steps before giving up on a contract
+IV_LOWER, IV_UPPER = 1e-4, 5.0   # Search bracket (0.01% .. 500% vol)
+MIN_VEGA = 1e-8      # Below this a Newton step is unreliable; bisect instead
+
+
+class IVResult:
+    """ Output of implied_vol(). iv is NaN wherever converged is False. """
+
+    def __init__(self, iv, converged, iterations):
+        self.iv = iv
+        self.converged = converged
+        self.iterations = iterations
+
+    @property
+    def n_converged(self):
+        return int(self.converged.sum())
+
+    @property
+    def n_total(self):
+        return int(self.converged.size)
+
+    def __repr__(self):
+        return f"IVResult({self.n_converged}/{self.n_total} converged in {self.iterations} iters)"
+
+
+def market_price(df):
+    """
+    Price to invert for each contract: bid/ask mid when both sides are quoted,
+    otherwise lastPrice. NaN where neither is usable. df: DataFrame or ChainSide.
+    """
+    n = len(df)
+    bid = np.asarray(df['bid'], dtype=float) if 'bid' in df else np.full(n, np.nan)
+    ask = np.asarray(df['ask'], dtype=float) if 'ask' in df else np.full(n, np.nan)
+    last = np.asarray(df['lastPrice'], dtype=float) if 'lastPrice' in df else np.full(n, np.nan)
+    quoted = (bid > 0) & (ask > 0) & (ask >= bid)
+    px = np.where(quoted, 0.5 * (bid + ask), last)
+    return np.where(px > 0, px, np.nan)
+
+
+def implied_vol(price, S, K, T, r, is_call=True, tol=IV_TOL, max_iter=IV_MAX_ITER):
+    """
+    Batched BSM inversion for whole chains/surfaces.
+
+    Newton on vega with a per-contract [lo, hi] bracket; any step that leaves the
+    bracket (or has vanishing vega) falls back to bisection, so every contract with
+    a price inside the no-arbitrage bounds converges. Only still-active contracts
+    are re-priced each iteration.
+    Returns IVResult (iv, converged mask, iterations used).
+    """
+    price, S, K, T, r, is_call = np.broadcast_arrays(
+        np.asarray(price, dtype=float), np.asarray(S, dtype=float), np.asarray(K, dtype=float),
+        np.asarray(T, dtype=float), np.asarray(r, dtype=float), np.asarray(is_call, dtype=bool)
+    )
+    shape = price.shape
+    price, S, K, T, r, is_call = (a.ravel() for a in (price, S, K, T, r, is_call))
+    T = np.maximum(T, 0.001)
+
+    # NO-ARBITRAGE BOUNDS: outside them no vol reproduces the price
+    disc_k = K * np.exp(-r * T)
+    lower = np.where(is_call, np.maximum(S - disc_k, 0), np.maximum(disc_k - S, 0))
+    upper = np.where(is_call, S, disc_k)
+    valid = np.isfinite(price) & (price > lower) & (price < upper)
+
+    iv = np.full(price.shape, np.nan)
+    converged = np.zeros(price.shape, dtype=bool)
+
+    # Brenner-Subrahmanyam seed, clipped into the bracket
+    seed = np.sqrt(2 * np.pi / T) * price / S
+    sig = np.clip(np.where(np.isfinite(seed), seed, 0.3), 0.05, 3.0)
+    lo = np.full(price.shape, IV_LOWER)
+    hi = np.full(price.shape, IV_UPPER)
+
+    active = np.flatnonzero(valid)
+    it = 0
+    while active.size and it < max_iter:
+        it += 1
+        res = bsm(S[active], K[active], T[active], r[active], sig[active], is_call[active])
+        diff = res['price'] - price[active]
+        vega = res['vega'] * 100   # kernel vega is per vol point
+
+        done = np.abs(diff) < tol
+        iv[active[done]] = sig[active[done]]
+        converged[active[done]] = True
+
+        # Price is increasing in vol: tighten the bracket around the root
+        over = diff > 0
+        hi[active] = np.where(over, sig[active], hi[active])
+        lo[active] = np.where(over, lo[active], sig[active])
+
+        with np.errstate(all='ignore'):
+            step = sig[active] - diff / vega
+        bad = (vega < MIN_VEGA) | ~np.isfinite(step) | (step <= lo[active]) | (step >= hi[active])
+        sig[active] = np.where(bad, 0.5 * (lo[active] + hi[active]), step)
+
+        active = active[~done]
+
+    return IVResult(iv.reshape(shape), converged.reshape(shape), it)
@@ -1,23 +1,32 @@
-import yfinance as yf
+import warnings
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 
+import data_provider
+import indicators
+import telemetry
+
 # --- CONFIGURATION ---
 LIQUID_WATCHLIST = [
     'SPY', 'QQQ', 'IWM', 'NVDA', 'TSLA', 'AMD', 
     'AAPL', 'MSFT', 'GOOGL', 'AMZN', 'META', 
     'NFLX', 'COIN', 'MSTR', 'PLTR'
 ]
+PULSE_TICKERS = ['^VIX', '^TNX', 'DX-Y.NYB']
+REGIME_TICKERS = ['^VIX9D', '^VIX', 'XLY', 'XLP', 'SPY']
+
+def war_room_requests(universe=None):
+    """Every (symbols, period) the War Room reads, for fetch_orchestrator.prefetch()."""
+    return [(PULSE_TICKERS, "5d"), (REGIME_TICKERS, "1y"), (universe or LIQUID_WATCHLIST, "1y")]
 
+@telemetry.traced("war_room.macro_pulse")
 def get_macro_pulse():
     """Fetches key macro indicators: VIX, 10Y Yield, Dollar."""
-    tickers = ['^VIX', '^TNX', 'DX-Y.NYB']
+    tickers = PULSE_TICKERS
     try:
-        data = yf.download(tickers, period="5d", progress=False)['Close']
-        if isinstance(data.columns, pd.MultiIndex):
-            data.columns = data.columns.get_level_values(0)
-            
+        data = data_provider.get_closes(tickers, period="5d")
+
         pulse = {}
         # VIX
         if '^VIX' in data:
@@ -41,6 +50,7 @@ def get_macro_pulse():
     except Exception as e:
         return None
 
+@telemetry.traced("war_room.regime")
 def get_market_regime():
     """
     Calculates institutional regime indicators.
@@ -52,72 +62,184 @@ def get_market_regime():
         # VIX9D is 9-day vol, VIX is 30-day. 
         # If 9D > 30D, we are in BACKWARDATION (Panic).
         # XLY (Discretionary) / XLP (Staples) > Rising means Risk On.
-        tickers = ['^VIX9D', '^VIX', 'XLY', 'XLP', 'SPY']
-        data = yf.download(tickers, period="1y", progress=False)['Close']
-        
-        if isinstance(data.columns, pd.MultiIndex):
-            data.columns = data.columns.get_level_values(0)
+        tickers = REGIME_TICKERS
+        # Warm state only needs the newest bars; cold state backfills a year once
+        eng = indicators.get_engine("regime")
+        warm = eng.is_warm(['XLY/XLP', 'SPY'])
+        data = data_provider.get_closes(tickers, period="5d" if warm else "1y")
+        if warm and not (eng.covers('SPY', data['SPY'].dropna()) and eng.covers('XLY/XLP', data[['XLY', 'XLP']].dropna())):
+            data = data_provider.get_closes(tickers, period="1y")
 
         regime = {}
 
         # 1. Term Structure
         if '^VIX9D' in data and '^VIX' in data:
-            v9 = data['^VIX9D'].iloc[-1]
-            v30 = data['^VIX'].iloc[-1]
+            v9 = data['^VIX9D'].dropna().iloc[-1]
+            v30 = data['^VIX'].dropna().iloc[-1]
             ratio = v9 / v30
             state = "Backwardation (PANIC)" if ratio > 1.05 else "Contango (Normal)"
             regime['Term_Structure'] = {"ratio": ratio, "state": state, "v9": v9, "v30": v30}
 
-        # 2. Risk Gauge
+        # 2. Risk Gauge (O(1) ratio state, 1 week = 4 bars back)
         if 'XLY' in data and 'XLP' in data:
-            curr = data['XLY'].iloc[-1] / data['XLP'].iloc[-1]
-            prev = data['XLY'].iloc[-5] / data['XLP'].iloc[-5] # 1 week ago
+            rg = eng.feed('XLY/XLP', lambda: indicators.Ratio(lag=4), data[['XLY', 'XLP']].dropna(),
+                          lambda ind, row: ind.update(row.XLY, row.XLP))
+            curr, prev = rg.value, rg.lagged
             trend = "Risk ON" if curr > prev else "Risk OFF"
             regime['Risk_Gauge'] = {"val": curr, "trend": trend}
 
-        # 3. SPY 200 SMA
+        # 3. SPY 200 SMA (O(1) rolling mean state)
         if 'SPY' in data:
-            spy_price = data['SPY'].iloc[-1]
-            sma_200 = data['SPY'].rolling(window=200).mean().iloc[-1]
+            spy = data['SPY'].dropna()
+            sma = indicators.feed_closes(eng, 'SPY', spy, lambda: indicators.RollingMeanStd(200),
+                                         lambda ind, c: ind.update(c))
+            spy_price = spy.iloc[-1]
+            sma_200 = sma.value
             dist = (spy_price - sma_200) / sma_200 * 100
             regime['SPY_Trend'] = {"price": spy_price, "sma200": sma_200, "dist": dist}
 
+        eng.save()
         return regime
     except:
         return None
 
-def scan_volatility_opportunities():
-    """Scans Liquid Watchlist for High IV Rank."""
-    results = []
+def load_universe(path):
+    """
+    Reads a scan universe: a CSV with a Ticker/Symbol column, or plain text
+    with one symbol per line ('#' comments allowed).
+    """
+    if path.lower().endswith(".csv"):
+        df = pd.read_csv(path)
+        col = next((c for c in df.columns if c.lower() in ("ticker", "symbol")), df.columns[0])
+        return df[col].dropna().astype(str).str.strip().str.upper().unique().tolist()
+    with open(path) as f:
+        syms = [line.split("#")[0].strip().upper() for line in f]
+    return list(dict.fromkeys(s for s in syms if s))
+
+def _ffill_2d(px):
+    """Forward-fills interior gaps down each column; leading NaNs stay NaN."""
+    idx = np.where(np.isfinite(px), np.arange(px.shape[0])[:, None], 0)
+    np.maximum.accumulate(idx, axis=0, out=idx)
+    return px[idx, np.arange(px.shape[1])]
+
+def realized_vol_panel(closes, window=30):
+    """
+    Rolling annualized realized vol (%) for a dates x tickers close array in one pass.
+    Rolling sums come from cumulative sums of returns and squared returns, so the cost
+    is O(dates x tickers) regardless of the window. NaN until a full window exists.
+    """
+    px = _ffill_2d(np.asarray(closes, dtype=float))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret = np.log(px[1:] / px[:-1])
+    valid = np.isfinite(ret)
+    # De-mean per column first so the sum-of-squares identity doesn't lose precision
+    x = np.where(valid, ret, 0.0)
+    with np.errstate(invalid='ignore'):
+        x -= np.where(valid, np.nanmean(np.where(valid, ret, np.nan), axis=0), 0.0)
+
+    zero = np.zeros((1, px.shape[1]))
+    c1 = np.concatenate([zero, np.cumsum(x, axis=0)])
+    c2 = np.concatenate([zero, np.cumsum(x * x, axis=0)])
+    cn = np.concatenate([zero, np.cumsum(valid, axis=0)])
+    s1 = c1[window:] - c1[:-window]
+    s2 = c2[window:] - c2[:-window]
+    n = cn[window:] - cn[:-window]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        var = (s2 - s1 * s1 / window) / (window - 1)
+    vol = np.where(n == window, np.sqrt(np.maximum(var, 0)) * np.sqrt(252) * 100, np.nan)
+
+    out = np.full(px.shape, np.nan)
+    out[window:] = vol
+    return out
+
+def _scan_panel(data, window):
+    """Cold path: whole-panel vectorized scan. Returns (results, ffilled closes, vol panel)."""
+    px = _ffill_2d(data.to_numpy(dtype=float))
+    vol = realized_vol_panel(px, window)
+
+    # 52-WEEK RANGE of the vol series, every ticker in one reduction
+    with np.errstate(invalid='ignore'), warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        min_vol, max_vol = np.nanmin(vol, axis=0), np.nanmax(vol, axis=0)
+    current_vol = vol[-1]
+    rng = max_vol - min_vol
+    with np.errstate(divide='ignore', invalid='ignore'):
+        iv_rank = np.where(rng > 0, (current_vol - min_vol) / rng * 100, 0.0)
+
+    ok = np.isfinite(current_vol)
+    results = pd.DataFrame({
+        "Ticker": data.columns[ok],
+        "Price": px[-1, ok],
+        "IV Rank": iv_rank[ok],
+        "Current IV": current_vol[ok]
+    })
+    return results, px, vol
+
+def _seed_scanner(eng, data, px, vol, window):
+    """Hands the cold scan's arrays to per-ticker O(1) state (closed bars only)."""
+    today = pd.Timestamp(datetime.now().date())
+    k = int((data.index < today).sum())
+    if k < 2: return
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ret = np.log(px[1:k] / px[:k - 1])
+    for j, ticker in enumerate(data.columns):
+        if not np.isfinite(px[k - 1, j]): continue
+        ind = indicators.RealizedVol(window)
+        ind.seed(px[k - 1, j], ret[-window:, j], vol[:k, j])
+        eng.seed(ticker, ind, data.index[k - 1])
+
+def _scan_incremental(eng, dates, tickers, px, window):
+    """Warm path: apply only the newest bars to each ticker's O(1) state."""
+    today = np.datetime64(pd.Timestamp(datetime.now().date()), 'ns')
+    closed = dates < today
+    factory = lambda: indicators.RealizedVol(window)
+    update = lambda ind, c: ind.update(c)
+    rows = []
+    for j, ticker in enumerate(tickers):
+        col = px[:, j]
+        ok = np.isfinite(col)
+        if not ok.any(): continue
+        keep = ok & closed
+        ind = eng.feed_values(ticker, factory, dates[keep], col[keep], update)
+        last = np.flatnonzero(ok)[-1]
+        vol, rank = ind.peek(col[last]) if not closed[last] else (ind.vol, ind.iv_rank)
+        if not np.isfinite(vol): continue
+        rows.append({"Ticker": ticker, "Price": col[last], "IV Rank": rank, "Current IV": vol})
+    return pd.DataFrame(rows)
+
+def _first_dates(dates, px):
+    """Earliest finite bar date per column of a dates x tickers array (NaT if none)."""
+    ok = np.isfinite(px)
+    first = dates[np.argmax(ok, axis=0)] if len(dates) else np.empty(px.shape[1], dtype=dates.dtype)
+    return np.where(ok.any(axis=0), first, np.datetime64('NaT', 'ns'))
+
+@telemetry.traced("war_room.vol_scan")
+def scan_volatility_opportunities(universe=None, window=30):
+    """
+    Scans a universe for High IV Rank (realized-vol proxy).
+    universe: list of symbols or a path for load_universe(); defaults to LIQUID_WATCHLIST.
+    Cold: one vectorized pass over a year of closes, which also seeds per-ticker
+    indicator state. Warm: only the last few bars are read and applied.
+    """
+    if universe is None: universe = LIQUID_WATCHLIST
+    elif isinstance(universe, str): universe = load_universe(universe)
     try:
-        data = yf.download(LIQUID_WATCHLIST, period="1y", group_by='ticker', progress=False)
-        
-        for ticker in LIQUID_WATCHLIST:
-            try:
-                df = data[ticker]
-                if df.empty: continue
-                
-                df['Log_Ret'] = np.log(df['Close'] / df['Close'].shift(1))
-                df['Vol'] = df['Log_Ret'].rolling(window=30).std() * np.sqrt(252) * 100
-                
-                vol_clean = df['Vol'].dropna()
-                if vol_clean.empty: continue
-                
-                current_vol = vol_clean.iloc[-1]
-                min_vol, max_vol = vol_clean.min(), vol_clean.max()
-                
-                iv_rank = 0
-                if max_vol != min_vol:
-                    iv_rank = (current_vol - min_vol) / (max_vol - min_vol) * 100
-                
-                results.append({
-                    "Ticker": ticker,
-                    "Price": df['Close'].iloc[-1],
-                    "IV Rank": iv_rank,
-                    "Current IV": current_vol
-                })
-            except: continue
-                
-        return pd.DataFrame(results).sort_values("IV Rank", ascending=False)
+        eng = indicators.get_engine(f"scanner_{window}")
+        warm = eng.is_warm(universe)
+        if warm:
+            dates, tickers, px = data_provider.tail_closes(universe, 5)
+            if not tickers: return pd.DataFrame()
+            warm = eng.covers_all(tickers, _first_dates(dates, px))
+        if warm:
+            results = _scan_incremental(eng, dates, tickers, px, window)
+        else:
+            data = data_provider.get_closes(universe, period="1y")
+            if data.empty: return pd.DataFrame()
+            results, px, vol = _scan_panel(data, window)
+            _seed_scanner(eng, data, px, vol, window)
+        eng.save()
+        if results.empty: return results
+        return results.sort_values("IV Rank", ascending=False).reset_index(drop=True)
     except:
         return pd.DataFrame()
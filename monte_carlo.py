@@ -0,0 +1,157 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+import telemetry
+
+# --- CONFIGURATION ---
+DEFAULT_PATHS = 200_000
+CHUNK_PATHS = 50_000          # Paths simulated per task; memory is O(chunk), not O(paths x steps)
+PARALLEL_MIN_PATHS = 400_000  # Below this a process pool costs more than it saves
+MAX_WORKERS = 4               # Shared Streamlit hosts: don't grab every core
+TAIL_PCTS = (1, 5, 50, 95, 99)
+Z_95 = 1.959964
+
+# Model parameters (per-year units)
+JUMP_DEFAULTS = {"lam": 1.0, "mu_j": -0.05, "sig_j": 0.10}                               # Merton
+HESTON_DEFAULTS = {"kappa": 2.0, "theta": None, "xi": 0.5, "rho": -0.7}                  # theta=None -> vol**2
+
+
+def _payoff(ST, strike, is_call, qty, cost):
+    """ P&L at expiry per 1 lot (x100) for every terminal price in ST """
+    intrinsic = np.where(is_call[:, None], ST[None, :] - strike[:, None], strike[:, None] - ST[None, :])
+    return (qty[:, None] * np.maximum(intrinsic, 0)).sum(axis=0) * 100 - cost * 100
+
+
+def _simulate_chunk(args):
+    """
+    One fixed-size batch of antithetic paths. Steps are walked in place so
+    memory stays at a few arrays of length n regardless of the horizon.
+    Returns sufficient statistics only (never the paths).
+    """
+    (n, seed, S0, T, n_steps, r, vol, model, params,
+     strike, is_call, qty, cost, touch_levels) = args
+    rng = np.random.default_rng(seed)
+    half = (n + 1) // 2
+    dt = T / n_steps
+
+    logS = np.full(2 * half, np.log(S0), dtype=float)
+    v = np.full(2 * half, vol ** 2, dtype=float)
+    lo = np.full(2 * half, S0, dtype=float)
+    hi = np.full(2 * half, S0, dtype=float)
+
+    if model == "jump":
+        lam, mu_j, sig_j = params["lam"], params["mu_j"], params["sig_j"]
+        comp = lam * (np.exp(mu_j + 0.5 * sig_j ** 2) - 1)   # keeps E[S_T] on the drift
+    if model == "heston":
+        kappa, xi, rho = params["kappa"], params["xi"], params["rho"]
+        theta = params["theta"] if params["theta"] is not None else vol ** 2
+
+    for _ in range(n_steps):
+        z = rng.standard_normal(half)
+        z = np.concatenate([z, -z])   # ANTITHETIC PAIRS
+        if model == "heston":
+            w = rng.standard_normal(half)
+            w = rho * z + np.sqrt(1 - rho ** 2) * np.concatenate([w, -w])
+            vp = np.maximum(v, 0)     # Full truncation Euler
+            logS += (r - 0.5 * vp) * dt + np.sqrt(vp * dt) * z
+            v += kappa * (theta - vp) * dt + xi * np.sqrt(vp * dt) * w
+        else:
+            logS += (r - 0.5 * vol ** 2) * dt + vol * np.sqrt(dt) * z
+            if model == "jump":
+                k = rng.poisson(lam * dt, 2 * half)
+                hit = k > 0
+                logS[hit] += k[hit] * mu_j + np.sqrt(k[hit]) * sig_j * rng.standard_normal(hit.sum())
+                logS -= comp * dt
+        S = np.exp(logS)
+        np.minimum(lo, S, out=lo)
+        np.maximum(hi, S, out=hi)
+
+    ST = np.exp(logS[:n])
+    pnl = _payoff(ST, strike, is_call, qty, cost)
+    touched = np.zeros(n, dtype=bool)
+    for level in touch_levels:
+        touched |= (lo[:n] <= level) & (hi[:n] >= level)
+
+    return {
+        "n": n,
+        "wins": int((pnl > 0).sum()),
+        "sum": float(pnl.sum()),
+        "sumsq": float((pnl ** 2).sum()),
+        "touch": int(touched.sum()),
+        "pcts": np.percentile(pnl, TAIL_PCTS),
+    }
+
+
+def _ci(chunk_vals, weights, iid_se):
+    """ Batch-means 95% half-width across chunks, i.i.d. fallback with few chunks """
+    if len(chunk_vals) >= 4:
+        vals = np.asarray(chunk_vals)
+        mean = np.average(vals, weights=weights)
+        se = np.sqrt(np.average((vals - mean) ** 2, weights=weights) / (len(vals) - 1))
+        return float(Z_95 * se)
+    return float(Z_95 * iid_se)
+
+
+@telemetry.traced("monte_carlo.simulate_trade")
+def simulate_trade(legs, spot, dte, cost, vol, r, n_paths=DEFAULT_PATHS, model="gbm",
+                   params=None, n_steps=None, chunk=CHUNK_PATHS, workers=None, seed=None):
+    """
+    Monte Carlo POP engine for any multi-leg trade (same expiry).
+
+    legs: trade legs with strike / type ('call'|'put') / side ('BUY'|'SELL')
+    cost: net debit (+) / credit (-) per share, as shown on the trade ticket
+    model: 'gbm', 'jump' (Merton) or 'heston' (stochastic vol); params override the defaults
+    workers: process count (None = auto, 1 = inline)
+
+    Returns a dict with POP, expected P&L, touch probability (any short strike
+    touched before expiry) and P&L percentiles, each with a 95% CI.
+    """
+    strike = np.array([float(l['strike']) for l in legs])
+    is_call = np.array([l['type'] == 'call' for l in legs])
+    qty = np.array([1.0 if l['side'] == "BUY" else -1.0 for l in legs])
+    short = strike[qty < 0]
+    touch_levels = tuple(short if short.size else strike)
+
+    T = max(dte, 1) / 365.0
+    n_steps = n_steps or max(1, int(dte))
+    defaults = {"jump": JUMP_DEFAULTS, "heston": HESTON_DEFAULTS}.get(model, {})
+    params = {**defaults, **(params or {})}
+
+    sizes = [chunk] * (n_paths // chunk) + ([n_paths % chunk] if n_paths % chunk else [])
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(n, s, spot, T, n_steps, r, vol, model, params, strike, is_call, qty, cost, touch_levels)
+             for n, s in zip(sizes, seeds)]
+
+    if workers is None:
+        workers = min(MAX_WORKERS, os.cpu_count() or 1) if n_paths >= PARALLEL_MIN_PATHS else 1
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(_simulate_chunk, tasks))
+    else:
+        parts = [_simulate_chunk(t) for t in tasks]
+
+    # --- REDUCE ---
+    N = sum(p["n"] for p in parts)
+    w = [p["n"] for p in parts]
+    pop = sum(p["wins"] for p in parts) / N
+    touch = sum(p["touch"] for p in parts) / N
+    mean = sum(p["sum"] for p in parts) / N
+    var = max(sum(p["sumsq"] for p in parts) / N - mean ** 2, 0)
+
+    # Batch quantiles: weighted mean of per-chunk percentiles, CI from the standard
+    # error of that mean (unknown, NaN, from a single chunk)
+    pct = {}
+    for i, q in enumerate(TAIL_PCTS):
+        per_chunk = [p["pcts"][i] for p in parts]
+        se = np.std(per_chunk, ddof=1) / np.sqrt(len(per_chunk)) if len(per_chunk) > 1 else np.nan
+        pct[f"p{q}"] = {"val": float(np.average(per_chunk, weights=w)), "ci": _ci(per_chunk, w, se)}
+
+    return {
+        "paths": N,
+        "model": model,
+        "pop": {"val": pop * 100, "ci": 100 * _ci([p["wins"] / p["n"] for p in parts], w, np.sqrt(pop * (1 - pop) / N))},
+        "expected_pnl": {"val": mean, "ci": _ci([p["sum"] / p["n"] for p in parts], w, np.sqrt(var / N))},
+        "touch_prob": {"val": touch * 100, "ci": 100 * _ci([p["touch"] / p["n"] for p in parts], w, np.sqrt(touch * (1 - touch) / N))},
+        "percentiles": pct,
+    }
@@ -0,0 +1,184 @@
+import sys
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURATION ---
+# Columns kept from the vendor frame; everything else (contractSymbol, lastTradeDate,
+# currency, contractSize, change...) is dropped or derived on demand.
+FLOAT_COLS = ('strike', 'lastPrice', 'bid', 'ask', 'impliedVolatility')
+INT_COLS = ('volume', 'openInterest')
+ENGINE_COLS = ('iv', 'theo_price', 'delta', 'gamma', 'theta', 'vega', 'rho', 'vanna', 'charm', 'early_premium')
+
+
+class OptionChain:
+    """
+    Compact option chain for one underlying: one contiguous float32/int32
+    array per field, rows sorted by (expiry, call/put, strike) so every
+    expiry/side is a zero-copy slice. The ticker and expiries are interned
+    strings shared by all sessions; contract symbols are rebuilt on demand.
+
+        chain = OptionChain.from_frames("SPY", {"2026-11-20": (calls, puts)})
+        engine.calculate_surface_greeks(chain.surface(), spot)   # writes in place
+        leg = chain.calls("2026-11-20").leg(i, "BUY")
+    """
+    __slots__ = ('ticker', 'expiries', 'bounds', 'cols', 'n')
+
+    def __init__(self, ticker, expiries, bounds, cols):
+        self.ticker = sys.intern(ticker)
+        self.expiries = tuple(sys.intern(e) for e in expiries)
+        self.bounds = bounds            # int32 [n_expiries, 3]: calls start, puts start, end
+        self.cols = cols
+        self.n = len(cols['strike'])
+
+    @classmethod
+    def from_frames(cls, ticker, chains):
+        """ chains: {expiry 'YYYY-MM-DD': (calls_df, puts_df)} (yfinance frames, priced or not) """
+        parts, bounds, row = [], [], 0
+        expiries = sorted(chains)
+        for e in expiries:
+            starts = []
+            for df in chains[e]:
+                starts.append(row)
+                df = df.sort_values('strike') if df is not None and len(df) else pd.DataFrame({'strike': []})
+                parts.append(df)
+                row += len(df)
+            bounds.append(starts + [row])
+        cols = {}
+        present = set().union(*(p.columns for p in parts))
+        for name in INT_COLS:
+            if name in present:
+                vals = [np.nan_to_num(p[name].to_numpy(dtype=float)) if name in p else np.zeros(len(p)) for p in parts]
+                cols[name] = np.concatenate(vals).astype(np.int32)
+        for name in FLOAT_COLS + ENGINE_COLS:
+            if name in present:
+                vals = [p[name].to_numpy(dtype=float) if name in p else np.full(len(p), np.nan) for p in parts]
+                cols[name] = np.concatenate(vals).astype(np.float32)
+        cols.setdefault('strike', np.empty(0, np.float32))
+        is_call = np.zeros(row, bool)
+        for c0, p0, _ in bounds:
+            is_call[c0:p0] = True
+        cols['is_call'] = is_call
+        return cls(ticker, expiries, np.asarray(bounds, dtype=np.int32).reshape(-1, 3), cols)
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in self.cols.values()) + self.bounds.nbytes
+
+    # ==================================================
+    #                  INDEX
+    # ==================================================
+    def _slice(self, expiry, is_call):
+        j = self.expiries.index(expiry)
+        c0, p0, end = self.bounds[j]
+        return slice(int(c0), int(p0)) if is_call else slice(int(p0), int(end))
+
+    def calls(self, expiry=None):
+        return ChainSide(self, self._slice(expiry or self.expiries[0], True))
+
+    def puts(self, expiry=None):
+        return ChainSide(self, self._slice(expiry or self.expiries[0], False))
+
+    def surface(self):
+        """ {expiry: (calls, puts)} views, the input shape of calculate_surface_greeks / optimize """
+        return {e: (self.calls(e), self.puts(e)) for e in self.expiries}
+
+    def find(self, expiry, type, strike):
+        """ Row of an exact (expiry, type, strike) contract, or None (binary search). """
+        sl = self._slice(expiry, type == 'call')
+        k = self.cols['strike'][sl]
+        i = int(np.searchsorted(k, np.float32(strike)))
+        return sl.start + i if i < len(k) and k[i] == np.float32(strike) else None
+
+    def expiry_of(self, row):
+        return self.expiries[int(np.searchsorted(self.bounds[:, 2], row, side='right'))]
+
+    def contract_symbol(self, row):
+        """ OCC symbol, e.g. SPY261120C00450000 """
+        e = self.expiry_of(row)
+        cp = 'C' if self.cols['is_call'][row] else 'P'
+        return f"{self.ticker}{e[2:4]}{e[5:7]}{e[8:10]}{cp}{int(round(float(self.cols['strike'][row]) * 1000)):08d}"
+
+
+class ChainSide:
+    """
+    Zero-copy view of one expiry/side. Supports the subset of the DataFrame
+    interface the engine, IV solver and optimizer use: col in side,
+    side[col] (array view), side[col] = values (written into the chain as
+    float32; a read-only column is copied first), len(side), .index and .attrs.
+    """
+    __slots__ = ('chain', 'sl', 'attrs')
+
+    def __init__(self, chain, sl):
+        self.chain, self.sl, self.attrs = chain, sl, {}
+
+    def __len__(self):
+        return self.sl.stop - self.sl.start
+
+    def __contains__(self, name):
+        return name in self.chain.cols
+
+    def __getitem__(self, name):
+        return self.chain.cols[name][self.sl]
+
+    def __setitem__(self, name, values):
+        cols = self.chain.cols
+        if name not in cols:
+            cols[name] = np.full(self.chain.n, np.nan, dtype=np.float32)
+        elif not cols[name].flags.writeable:
+            cols[name] = np.array(cols[name])   # Copy-on-write: replayed chains are read-only memmaps
+        cols[name][self.sl] = values
+
+    @property
+    def index(self):
+        return np.arange(len(self))
+
+    def leg(self, i, side):
+        """ Leg record for position i of this view """
+        return Leg(self.chain, self.sl.start + int(i), side)
+
+    def to_frame(self):
+        """ pandas copy for display/export only """
+        rows = range(self.sl.start, self.sl.stop)
+        out = pd.DataFrame({k: v[self.sl] for k, v in self.chain.cols.items() if k != 'is_call'})
+        out.insert(0, 'contractSymbol', [self.chain.contract_symbol(r) for r in rows])
+        return out
+
+
+class Leg:
+    """
+    One trade leg: a row pointer into an OptionChain plus BUY/SELL. Reads
+    like the pandas row it replaces (leg['strike'], leg.get('lastPrice'),
+    'iv' in leg) without copying the row.
+    """
+    __slots__ = ('chain', 'row', 'side')
+
+    def __init__(self, chain, row, side):
+        self.chain, self.row, self.side = chain, row, side
+
+    @property
+    def type(self):
+        return 'call' if self.chain.cols['is_call'][self.row] else 'put'
+
+    def __getitem__(self, name):
+        if name == 'side': return self.side
+        if name == 'type': return self.type
+        if name == 'expiry': return self.chain.expiry_of(self.row)
+        if name == 'contractSymbol': return self.chain.contract_symbol(self.row)
+        v = self.chain.cols[name][self.row]
+        # float32 -> shortest decimal, so 2.4 reads back as 2.4 rather than 2.4000000953674316
+        return int(v) if v.dtype.kind == 'i' else float(str(v)) if v.dtype.kind == 'f' else v
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return name in self.chain.cols or name in ('side', 'type', 'expiry', 'contractSymbol')
+
+    def __repr__(self):
+        return f"Leg({self.side} {self.chain.ticker} {self['expiry']} {self['strike']:g} {self.type})"
@@ -0,0 +1,219 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+
+from quant_engine import VectorizedQuantEngine
+import data_provider
+import telemetry
+
+# --- CONFIGURATION ---
+BENCHMARK = "SPY"                       # Beta-weighting reference
+MULTIPLIER = 100
+STRESS_SPOT = np.arange(-20, 21, 2)     # % spot shocks (21 points)
+STRESS_VOL = np.arange(-50, 51, 5)      # % relative vol shocks (21 points)
+STRESS_CHUNK = 1 << 21                  # Max leg x grid cells priced per kernel call
+BETA_PERIOD = "1y"
+
+
+class Book:
+    """
+    Option positions as struct-of-arrays: one contiguous array per field and
+    an int32 code per leg into `symbols`. Every risk call prices all legs in
+    a single batched kernel call and nets per underlying with bincount.
+
+    qty is signed contracts (+ long / - short); price is the entry premium per share.
+    """
+    FIELDS = {'sym': np.int32, 'strike': np.float64, 'is_call': np.bool_, 'qty': np.float64,
+              'expiry': 'datetime64[D]', 'iv': np.float64, 'price': np.float64, 'mult': np.float64}
+
+    def __init__(self, capacity=64):
+        self.symbols = []
+        self._codes = {}
+        self.n = 0
+        self._a = {k: np.empty(capacity, dtype=t) for k, t in self.FIELDS.items()}
+
+    def __len__(self):
+        return self.n
+
+    def __getattr__(self, name):
+        # Live views over the filled part of each column: book.strike, book.qty, ...
+        if name in Book.FIELDS:
+            return self.__dict__['_a'][name][:self.n]
+        raise AttributeError(name)
+
+    def _code(self, symbol):
+        symbol = symbol.upper()
+        if symbol not in self._codes:
+            self._codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return self._codes[symbol]
+
+    def _reserve(self, extra):
+        need = self.n + extra
+        cap = len(self._a['sym'])
+        if need <= cap:
+            return
+        cap = max(need, cap * 2)
+        for k, arr in self._a.items():
+            grown = np.empty(cap, dtype=arr.dtype)
+            grown[:self.n] = arr[:self.n]
+            self._a[k] = grown
+
+    def add(self, underlying, type, strike, expiry, qty, iv, price=0.0, multiplier=MULTIPLIER):
+        """ One leg; expiry as 'YYYY-MM-DD' or date. """
+        self._reserve(1)
+        i = self.n
+        row = {'sym': self._code(underlying), 'strike': strike, 'is_call': type == 'call', 'qty': qty,
+               'expiry': np.datetime64(expiry, 'D'), 'iv': iv, 'price': price, 'mult': multiplier}
+        for k, v in row.items():
+            self._a[k][i] = v
+        self.n += 1
+        return i
+
+    def add_trade(self, underlying, expiry, legs, lots=1):
+        """ Terminal trade legs ({'strike','type','side','iv'/'impliedVolatility', premium}) x lots """
+        for l in legs:
+            price = l.get('lastPrice', l.get('theo_price', 0.0))
+            iv = l['iv'] if 'iv' in l else l['impliedVolatility']
+            self.add(underlying, l['type'], float(l['strike']), expiry,
+                     lots if l['side'] == "BUY" else -lots, float(iv), float(price))
+
+    def extend(self, df):
+        """ Bulk append from a frame with to_frame() columns. """
+        m = len(df)
+        self._reserve(m)
+        sl = slice(self.n, self.n + m)
+        self._a['sym'][sl] = [self._code(s) for s in df['underlying']]
+        self._a['strike'][sl] = df['strike'].to_numpy(dtype=float)
+        self._a['is_call'][sl] = df['type'].to_numpy() == 'call'
+        self._a['qty'][sl] = df['qty'].to_numpy(dtype=float)
+        self._a['expiry'][sl] = pd.to_datetime(df['expiry']).to_numpy().astype('datetime64[D]')
+        self._a['iv'][sl] = df['iv'].to_numpy(dtype=float)
+        self._a['price'][sl] = df['price'].to_numpy(dtype=float) if 'price' in df else 0.0
+        self._a['mult'][sl] = df['mult'].to_numpy(dtype=float) if 'mult' in df else MULTIPLIER
+        self.n += m
+        return self
+
+    def remove(self, idx):
+        """ Drops legs by position (int, list or boolean mask). """
+        keep = np.ones(self.n, bool)
+        keep[idx] = False
+        m = int(keep.sum())
+        for k, arr in self._a.items():
+            arr[:m] = arr[:self.n][keep]
+        self.n = m
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(capacity=max(64, len(df))).extend(df)
+
+    def to_frame(self):
+        return pd.DataFrame({
+            'underlying': np.asarray(self.symbols, dtype=object)[self.sym] if self.n else [],
+            'type': np.where(self.is_call, 'call', 'put'),
+            'strike': self.strike, 'expiry': self.expiry.astype(str), 'qty': self.qty,
+            'iv': self.iv, 'price': self.price, 'mult': self.mult,
+        })
+
+    # ==================================================
+    #                  RISK
+    # ==================================================
+    def years(self, now=None):
+        """ Time to expiry per leg (years, floored at 0 for expired legs) """
+        now = np.datetime64(now or datetime.now(), 's')
+        return np.maximum((self.expiry.astype('datetime64[s]') - now) / np.timedelta64(365 * 86400, 's'), 0.0)
+
+    def _per_leg(self, mapping, default=np.nan):
+        """ {symbol: value} -> array aligned to legs """
+        by_code = np.array([mapping.get(s, default) for s in self.symbols], dtype=float)
+        return by_code[self.sym] if self.n else np.empty(0)
+
+    @telemetry.traced("book.reprice")
+    def reprice(self, spots, now=None, engine=None):
+        """
+        Marks and position Greeks for every leg in one kernel call.
+        Position units: delta/gamma in shares, vega $ per vol point, theta $ per day.
+        """
+        engine = engine or VectorizedQuantEngine()
+        S = self._per_leg(spots)
+        res = engine.price_legs(S, self.strike, self.years(now), self.iv, self.is_call)
+        w = self.qty * self.mult
+        return pd.DataFrame({
+            'underlying': np.asarray(self.symbols, dtype=object)[self.sym] if self.n else [],
+            'spot': S, 'mark': res['price'], 'value': w * res['price'],
+            'pnl': w * (res['price'] - self.price),
+            'delta': w * res['delta'], 'gamma': w * res['gamma'],
+            'vega': w * res['vega'], 'theta': w * res['theta'],
+        })
+
+    def net_greeks(self, spots, betas=None, bench_spot=None, now=None, engine=None):
+        """
+        Net risk per underlying, plus beta-weighted delta/gamma in benchmark
+        shares when betas and the benchmark spot are given.
+        """
+        legs = self.reprice(spots, now, engine)
+        n_sym = len(self.symbols)
+        agg = {c: np.bincount(self.sym, weights=legs[c].to_numpy(), minlength=n_sym)
+               for c in ('value', 'pnl', 'delta', 'gamma', 'vega', 'theta')}
+        spot = np.array([spots.get(s, np.nan) for s in self.symbols], dtype=float)
+        out = pd.DataFrame({'underlying': self.symbols, 'spot': spot, 'legs': np.bincount(self.sym, minlength=n_sym), **agg})
+        out['delta_$'] = out['delta'] * spot
+        out['gamma_$1%'] = out['gamma'] * spot * spot / 100   # $ delta change per 1% move
+        if betas is not None and bench_spot:
+            beta = np.array([betas.get(s, 1.0) for s in self.symbols], dtype=float)
+            ratio = beta * spot / bench_spot
+            out['beta'] = beta
+            out['bw_delta'] = out['delta'] * ratio
+            out['bw_gamma'] = out['gamma'] * ratio * ratio
+        return out
+
+    @telemetry.traced("book.stress")
+    def stress(self, spots, spot_shocks=STRESS_SPOT, vol_shocks=STRESS_VOL, betas=None,
+               days=0, now=None, engine=None):
+        """
+        Whole-book P&L vs the current mark over a spot-shock x vol-shock grid.
+        Spot shocks are % moves applied to every underlying (scaled by beta
+        when betas are given, i.e. benchmark moves); vol shocks are relative %.
+        days rolls every leg forward before shocking.
+        """
+        engine = engine or VectorizedQuantEngine(dtype=np.float32)
+        spot_shocks = np.asarray(spot_shocks, dtype=float)
+        vol_shocks = np.asarray(vol_shocks, dtype=float)
+        S = self._per_leg(spots)
+        beta = self._per_leg(betas, 1.0) if betas is not None else np.ones(self.n)
+        T = self.years(now)
+        w = self.qty * self.mult
+        base = engine.price_legs(S, self.strike, T, self.iv, self.is_call, greeks=False)['price']
+        T_fwd = np.maximum(T - days / 365.0, 0.0)
+
+        # AXES: [leg, spot shock, vol shock]; legs chunked to bound memory
+        pnl = np.zeros((len(spot_shocks), len(vol_shocks)))
+        step = max(1, STRESS_CHUNK // (len(spot_shocks) * len(vol_shocks)))
+        for lo in range(0, self.n, step):
+            sl = slice(lo, lo + step)
+            S_sh = S[sl, None] * np.maximum(1 + beta[sl, None] * spot_shocks[None, :] / 100, 0.01)
+            sig = np.maximum(0.01, self.iv[sl, None] * (1 + vol_shocks[None, :] / 100))
+            px = engine.price_legs(S_sh[:, :, None], self.strike[sl, None, None], T_fwd[sl, None, None],
+                                   sig[:, None, :], self.is_call[sl, None, None], greeks=False)['price']
+            pnl += np.tensordot(w[sl], px - base[sl, None, None], axes=1)
+        return pd.DataFrame(pnl, index=pd.Index(spot_shocks, name='spot %'), columns=pd.Index(vol_shocks, name='vol %'))
+
+
+def market_inputs(symbols, bench=BENCHMARK, period=BETA_PERIOD):
+    """
+    Last close and beta vs the benchmark per symbol from one bar-store panel.
+    Symbols without history are left out of spots; missing betas default to 1.
+    """
+    symbols = list(dict.fromkeys(list(symbols) + [bench]))
+    closes = data_provider.get_closes(symbols, period)
+    if closes.empty:
+        return {}, {}
+    spots = {s: float(v) for s, v in closes.ffill().iloc[-1].items() if np.isfinite(v)}
+    rets = np.log(closes / closes.shift(1))
+    betas = {}
+    if bench in rets:
+        for s in rets:
+            cov = pd.concat([rets[s], rets[bench]], axis=1).dropna().to_numpy()
+            c = np.cov(cov.T) if len(cov) > 20 else None
+            betas[s] = float(c[0, 1] / c[1, 1]) if c is not None and c[1, 1] > 0 else 1.0
+    return spots, betas
@@ -0,0 +1,463 @@
+"""
+Background prefetch: keeps the watchlist and recently viewed symbols warm so
+page loads are cache hits instead of upstream round trips.
+
+    python prefetch.py                        # run the scheduler in the foreground
+    python prefetch.py --once                 # one pass over every due job, then exit
+    python prefetch.py --plan                 # print the job queue and exit
+    python prefetch.py --tickers SPY,QQQ --budget 30
+
+Jobs: one batched bar refresh (watchlist, hot symbols, macro/regime and
+curve tickers), the rate curve, the War Room indicator state, and per hot
+symbol its expiry list and nearest chains. A job is due once its cache
+entry is older than the cadence for the current US market phase (regular
+session, extended hours, closed; NYSE holidays and half days included);
+entries written off-session get a TTL stretched to that cadence so they
+stay hits overnight, and the bar refresh passes it as the store's ttl. Due jobs run most
+urgent first (how overdue x recent access frequency) until the per-minute
+request budget, a share of one process's Yahoo rate, is spent; the rest
+wait for the next tick. Jobs are charged the upstream calls they will
+make (bar refreshes per fetch group). Due-ness, job leases and the spent
+budget all live in the shared cache tier, so replicas each running a
+scheduler split the work and one budget (with OPSTRUCT_CACHE=memory the
+budget is per process).
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import functools
+from datetime import date, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import telemetry
+import cache_backend
+import upstream
+
+# --- CONFIGURATION ---
+ENABLED = os.environ.get("OPSTRUCT_PREFETCH", "1") != "0"
+BUDGET_SHARE = float(os.environ.get("OPSTRUCT_PREFETCH_SHARE", 0.5))   # Of the Yahoo rate; the rest stays with users
+BUDGET_KEY = "opstruct:prefetch:budget"   # + minute: requests spent by every scheduler on the tier
+TICK = 5.0                  # Seconds between scheduling passes
+HOT_EXPIRIES = 2            # Nearest expiries kept warm per hot symbol
+MAX_HOT = 20                # Recently viewed symbols kept warm beyond the watchlist
+HALF_LIFE = 1800.0          # Seconds for one access to lose half its weight
+MIN_EXPIRY_HEAT = 0.5       # A viewed non-front expiry stays warm about one half-life
+MARKET_TZ = ZoneInfo("America/New_York")
+SESSION = (9 * 60 + 30, 16 * 60)    # Regular session, minutes after midnight ET
+EXTENDED = (4 * 60, 20 * 60)        # Pre-market open to after-hours close
+EARLY_CLOSE = 13 * 60               # Session close on half days (after-hours then runs to 17:00)
+# Seconds between refreshes per job kind and market phase; bars are passed to
+# BarStore.refresh as its ttl, open-session bars under data_provider.REFRESH_TTL
+CADENCE = {
+    "bars":     {"open": 240, "extended": 900, "closed": 4 * 3600},
+    "rates":    {"open": 720, "extended": 1800, "closed": 4 * 3600},
+    "war_room": {"open": 240, "extended": 600, "closed": 1800},
+    "expiries": {"open": 3000, "extended": 3000, "closed": 4 * 3600},
+    "chain":    {"open": 240, "extended": 900, "closed": 4 * 3600},
+}
+# Base priority, scaled by how overdue a job is and its symbol's access heat
+WEIGHT = {"bars": 5.0, "rates": 4.0, "war_room": 3.0, "expiries": 3.0, "chain": 1.0}
+MAX_OVERDUE = 4.0           # Overdue factor cap, so a long-cold job cannot starve hot ones
+
+
+def _nth_weekday(year, month, weekday, n):
+    """ n-th (1-based; -1 = last) weekday (Mon=0) of a month. """
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = date(year + month // 12, month % 12 + 1, 1) - timedelta(days=1)
+    return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(d):
+    """ NYSE rule: a Saturday holiday is taken Friday, a Sunday one Monday. """
+    return d - timedelta(days=1) if d.weekday() == 5 else d + timedelta(days=1) if d.weekday() == 6 else d
+
+
+def _easter(year):
+    """ Gregorian Easter Sunday (anonymous algorithm). """
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 19 * l) // 433
+    month = (h + l - 7 * m + 90) // 25
+    return date(year, month, (h + l - 7 * m + 33 * month + 19) % 32)
+
+
+@functools.lru_cache(maxsize=8)
+def market_holidays(year):
+    """
+    (holidays, early closes) for the NYSE in a year, by the exchange's
+    standing rules. One-off closures (national days of mourning) are not known.
+    """
+    new_year = date(year, 1, 1)
+    holidays = {
+        new_year + timedelta(days=1) if new_year.weekday() == 6 else new_year,   # Saturday: not observed
+        _nth_weekday(year, 1, 0, 3),            # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),            # Washington's Birthday
+        _easter(year) - timedelta(days=2),      # Good Friday
+        _nth_weekday(year, 5, 0, -1),           # Memorial Day
+        _observed(date(year, 7, 4)),
+        _nth_weekday(year, 9, 0, 1),            # Labor Day
+        _nth_weekday(year, 11, 3, 4),           # Thanksgiving
+        _observed(date(year, 12, 25)),
+    }
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))   # Juneteenth
+    early = {_nth_weekday(year, 11, 3, 4) + timedelta(days=1), date(year, 7, 3), date(year, 12, 24)}
+    return holidays, {d for d in early if d.weekday() < 5 and d not in holidays}
+
+
+def market_phase(now=None):
+    """ 'open', 'extended' or 'closed' for the US equity session at `now` (epoch seconds). """
+    t = datetime.fromtimestamp(now if now is not None else time.time(), MARKET_TZ)
+    holidays, early = market_holidays(t.year)
+    if t.weekday() >= 5 or t.date() in holidays:
+        return "closed"
+    minute = t.hour * 60 + t.minute
+    close = EARLY_CLOSE if t.date() in early else SESSION[1]
+    if SESSION[0] <= minute < close:
+        return "open"
+    if EXTENDED[0] <= minute < (close + 4 * 60 if t.date() in early else EXTENDED[1]):
+        return "extended"
+    return "closed"
+
+
+class Scheduler:
+    """
+    Market-hours-aware refresher for the hot symbols' data.
+
+        s = Scheduler()
+        s.touch("NVDA", "2026-11-20")     # page views raise a symbol's (and expiry's) priority
+        s.run_once()                      # due jobs, most urgent first, within the budget
+        s.start()                         # or every TICK seconds on a daemon thread
+    """
+
+    def __init__(self, watchlist=None, budget=None, cache=None):
+        self.watchlist = [s.upper() for s in watchlist] if watchlist is not None else None
+        # Requests per minute all schedulers on the cache tier may spend together
+        self.budget = budget if budget is not None else upstream.UPSTREAMS["yahoo"]["rate"] * 60 * BUDGET_SHARE
+        self.cache = cache
+        self.heat = {}        # symbol or (symbol, expiry) -> (weight, stamp)
+        self.spent = {}       # minute -> requests, when there is no shared tier
+        self.ran = {}         # In-process last run of jobs without a cache entry
+        self.stop = threading.Event()
+        self._lock = threading.Lock()
+
+    # --- access frequency ---
+    def touch(self, symbol, expiry=None):
+        """ Records one access (cheap; called on every page view). """
+        now = time.time()
+        symbol = symbol.upper()
+        with self._lock:
+            for key in (symbol,) if expiry is None else (symbol, (symbol, expiry)):
+                self.heat[key] = (self._decayed(key, now) + 1.0, now)
+            if len(self.heat) > 20 * MAX_HOT:
+                for key in sorted(self.heat, key=lambda k: self._decayed(k, now))[:len(self.heat) // 2]:
+                    del self.heat[key]
+
+    def _decayed(self, key, now):
+        w, stamp = self.heat.get(key, (0.0, now))
+        return w * 0.5 ** ((now - stamp) / HALF_LIFE)
+
+    def hot(self, now=None):
+        """
+        ({symbol: heat}, {(symbol, expiry): heat}): the watchlist plus the
+        MAX_HOT most accessed other symbols, and the viewed expiries.
+        """
+        import market_utils
+        now = now or time.time()
+        with self._lock:
+            heat = {k: self._decayed(k, now) for k in self.heat}
+        base = self.watchlist if self.watchlist is not None else market_utils.LIQUID_WATCHLIST
+        hot = {s: heat.get(s, 0.0) for s in base}
+        extra = sorted((s for s in heat if isinstance(s, str) and s not in hot), key=lambda s: -heat[s])[:MAX_HOT]
+        hot.update((s, heat[s]) for s in extra)
+        return hot, {k: w for k, w in heat.items() if isinstance(k, tuple)}
+
+    # --- jobs ---
+    def _cache(self):
+        return self.cache or cache_backend.get_cache()
+
+    def _key(self, kind, args):
+        import service
+        import rate_curve
+        if kind == "rates":
+            return rate_curve.CURVE_KEY
+        if kind == "expiries":
+            return service.list_expiries.key(*args)
+        if kind == "chain":
+            return service.terminal_chain.key(*args)
+        return None
+
+    def _age(self, kind, args, now):
+        key = self._key(kind, args)
+        if key is None:
+            stamp = self.ran.get((kind,) + args)
+        else:
+            hit = self._cache().peek(key)
+            stamp = hit[1] if hit is not None else None
+        return now - stamp if stamp is not None else float("inf")
+
+    def plan(self, now=None, phase=None):
+        """
+        Every job as (priority, kind, args, cost, age, due), most urgent first.
+        Chains are planned only for symbols whose expiry list is already cached.
+        """
+        import service
+        import market_utils
+        import rate_curve
+        now = now or time.time()
+        phase = phase or market_phase(now)
+        hot, expiry_heat = self.hot(now)
+        # Everything the store-backed jobs read rides on the one bars job
+        symbols = sorted(set(hot) | set(rate_curve.CURVE_TICKERS)
+                         | {s for group, _ in market_utils.war_room_requests() for s in group})
+        jobs = [("bars", (tuple(symbols),), 0.0), ("rates", (), 0.0), ("war_room", (), 0.0)]
+        for s, h in hot.items():
+            jobs.append(("expiries", (s,), h))
+            hit = self._cache().peek(service.list_expiries.key(s))
+            listed = hit[0] if hit is not None and hit[0] else []
+            viewed = [e for (t, e), w in expiry_heat.items() if t == s and w >= MIN_EXPIRY_HEAT and e in listed]
+            for e in dict.fromkeys(list(listed[:HOT_EXPIRIES]) + viewed):
+                jobs.append(("chain", (s, e), h + expiry_heat.get((s, e), 0.0)))
+        out = []
+        for kind, args, h in jobs:
+            cadence = CADENCE[kind][phase]
+            # The bars job is tracked as one entry whatever its symbol list
+            age = self._age(kind, () if kind == "bars" else args, now)
+            priority = WEIGHT[kind] * min(age / cadence, MAX_OVERDUE) * (1.0 + h)
+            out.append((priority, kind, args, self.cost(kind, args, cadence), age, age >= cadence))
+        out.sort(key=lambda j: -j[0])
+        return out
+
+    def cost(self, kind, args, cadence):
+        """ Upstream calls one run would make right now. """
+        import service
+        import data_provider
+        import market_utils
+        import rate_curve
+        store = data_provider.get_store()
+        if kind == "bars":
+            return len(store.pending(list(args[0]), "1y", ttl=cadence))
+        if kind == "rates":
+            return len(store.pending(list(rate_curve.CURVE_TICKERS), "5d"))
+        if kind == "war_room":
+            return sum(len(store.pending(list(group), period)) for group, period in market_utils.war_room_requests())
+        if kind == "chain":
+            # The chain itself, plus the dividend history when it has dropped out of the cache
+            return 1 + (self._cache().peek(service.dividend_history.key(args[0])) is None)
+        return 1
+
+    def _run(self, kind, args, phase):
+        import service
+        import data_provider
+        import market_utils
+        import rate_curve
+        cache = self._cache()
+        cadence = CADENCE[kind][phase]
+        if kind == "bars":
+            data_provider.get_store().refresh(list(args[0]), period="1y", ttl=cadence)
+        elif kind == "rates":
+            cache.put(rate_curve.CURVE_KEY, rate_curve.build_rate_curve(),
+                      max(rate_curve.RATE_TTL, cadence * 1.25), rate_curve.RATE_STALE)
+        elif kind == "war_room":
+            # Feeds the indicator engines so the page's calls take the warm, few-bar path
+            market_utils.get_market_regime()
+            market_utils.get_macro_pulse()
+            market_utils.scan_volatility_opportunities()
+        else:
+            fn = service.list_expiries if kind == "expiries" else service.terminal_chain
+            value = fn.uncached(*args)
+            ok = bool(value) if kind == "expiries" else value[0] is not None
+            if ok:   # Failures are not cached; readers fall back to their own load
+                cache.put(fn.key(*args), value, max(fn.ttl, cadence * 1.25), fn.stale)
+        if self._key(kind, args) is None:
+            self.ran[(kind,)] = time.time()
+
+    def _lease(self, kind, args):
+        """ Cross-replica lock for one job (True without a shared tier). """
+        shared = self._cache().shared
+        if shared is None:
+            return True
+        try:
+            return shared.lease(f"opstruct:prefetch:{kind}:{args!r}"[:200], cache_backend.LEASE_SECONDS)
+        except Exception:
+            return True
+
+    def _release(self, kind, args):
+        shared = self._cache().shared
+        if shared is not None:
+            try: shared.release(f"opstruct:prefetch:{kind}:{args!r}"[:200])
+            except Exception: pass
+
+    def remaining(self, now=None):
+        """ Requests left in this minute's budget (all schedulers on the shared tier). """
+        now = now or time.time()
+        shared = self._cache().shared
+        if shared is not None:
+            try:
+                hit = shared.get(f"{BUDGET_KEY}:{int(now // 60)}")
+                return self.budget - (hit[0] if hit is not None else 0)
+            except Exception:
+                pass
+        with self._lock:
+            return self.budget - self.spent.get(int(now // 60), 0)
+
+    def charge(self, cost, now=None):
+        """
+        Reserves `cost` requests in this minute's budget; False if they do not fit.
+        The shared counter is read-modify-written under a lease on its key.
+        """
+        now = now or time.time()
+        minute = int(now // 60)
+        shared = self._cache().shared
+        if shared is not None:
+            key = f"{BUDGET_KEY}:{minute}"
+            try:
+                for _ in range(20):
+                    if shared.lease(key, 5):
+                        break
+                    time.sleep(0.01)
+                else:
+                    return False   # Another scheduler is charging; try on the next tick
+                try:
+                    hit = shared.get(key)
+                    spent = hit[0] if hit is not None else 0
+                    if spent + cost > self.budget:
+                        return False
+                    shared.set(key, spent + cost, now, now + 120)
+                    return True
+                finally:
+                    shared.release(key)
+            except Exception:
+                pass   # Shared tier unavailable: fall back to this process's count
+        with self._lock:
+            self.spent = {minute: self.spent.get(minute, 0)}
+            if self.spent[minute] + cost > self.budget:
+                return False
+            self.spent[minute] += cost
+            return True
+
+    def run_once(self, now=None):
+        """ Runs the due jobs that fit the budget, most urgent first; returns [(kind, args, status)]. """
+        now = now or time.time()
+        phase = market_phase(now)
+        done = []
+        with telemetry.span("prefetch.pass", phase=phase):
+            for priority, kind, args, cost, age, due in self.plan(now, phase):
+                if not due or self.stop.is_set():
+                    continue
+                if cost and upstream.get("yahoo").breaker.state != "closed":
+                    telemetry.count("prefetch_deferred", kind=kind)
+                    continue
+                if not self._lease(kind, args):
+                    continue   # Another replica is on it
+                try:
+                    # Re-checked under the lease: another replica may have just finished it
+                    if self._age(kind, () if kind == "bars" else args, time.time()) < CADENCE[kind][phase]:
+                        continue
+                    # Charged what it will make now (jobs ahead of it may have fetched its bars)
+                    cost = self.cost(kind, args, CADENCE[kind][phase])
+                    if cost and not self.charge(cost):
+                        telemetry.count("prefetch_deferred", kind=kind)
+                        continue
+                    with telemetry.span(f"prefetch.{kind}"):
+                        self._run(kind, args, phase)
+                    telemetry.count("prefetch_runs", kind=kind)
+                    done.append((kind, args, "ok"))
+                except Exception as e:
+                    telemetry.count("prefetch_errors", kind=kind, error=type(e).__name__)
+                    done.append((kind, args, f"failed ({type(e).__name__})"))
+                finally:
+                    self._release(kind, args)
+        return done
+
+    def run(self):
+        """ Blocks; one scheduling pass every TICK seconds until stop is set. """
+        while not self.stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                telemetry.count("prefetch_errors", kind="pass")
+            self.stop.wait(TICK)
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True, name="prefetch").start()
+        return self
+
+
+# --- PROCESS-WIDE SCHEDULER ---
+_scheduler = None
+_started = False
+_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    with _lock:
+        if _scheduler is None:
+            _scheduler = Scheduler()
+            telemetry.gauge("prefetch_budget_remaining", lambda: _scheduler.remaining())
+        return _scheduler
+
+
+def set_scheduler(scheduler):
+    global _scheduler
+    with _lock:
+        _scheduler = scheduler
+
+
+def touch(symbol, expiry=None):
+    """ Records a page view for the process-wide scheduler. """
+    if symbol:
+        get_scheduler().touch(symbol, expiry)
+
+
+def start():
+    """ Starts the process-wide scheduler once (no-op when disabled or already running). """
+    global _started
+    sched = get_scheduler()
+    with _lock:
+        if _started or not ENABLED:
+            return False
+        _started = True
+    sched.start()
+    return True
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="OpStruct background prefetch")
+    ap.add_argument("--tickers", help="comma-separated watchlist (default: market_utils.LIQUID_WATCHLIST)")
+    ap.add_argument("--budget", type=float, default=None, help="upstream requests per minute")
+    ap.add_argument("--once", action="store_true", help="one pass over the due jobs, then exit")
+    ap.add_argument("--plan", action="store_true", help="print the job queue and exit")
+    args = ap.parse_args(argv)
+
+    watchlist = [t.strip() for t in args.tickers.split(",") if t.strip()] if args.tickers else None
+    sched = Scheduler(watchlist, args.budget)
+    if args.plan:
+        print(f"phase {market_phase()}  budget {sched.budget:.0f} req/min")
+        for priority, kind, jargs, cost, age, due in sched.plan():
+            label = f"{len(jargs[0])} symbols" if kind == "bars" else ",".join(map(str, jargs))
+            seen = "never" if age == float("inf") else f"{age:.0f}s"
+            print(f"{priority:8.2f}  {kind:<9} {label:<28} cost {cost}  age {seen:>8}  {'due' if due else ''}")
+        return 0
+    if args.once:
+        for kind, jargs, status in sched.run_once():
+            print(f"{kind:<9} {','.join(map(str, jargs)) if kind != 'bars' else ''}  {status}")
+        return 0
+    try:
+        sched.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
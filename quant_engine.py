@@ -1,62 +1,101 @@
 import numpy as np
-from scipy.stats import norm
-import yfinance as yf
 import pandas as pd
 from datetime import datetime
 
+from rate_curve import RateCurve, get_rate_curve
+from pricing_kernels import bsm, bsm_price
+from iv_solver import implied_vol, market_price
+from vol_surface import SVISurface
+import american
+import telemetry
+
+IV_FALLBACK = 0.40  # Last resort when neither the solver, a fitted surface nor the vendor has a vol
+
+
+def _vendor_iv(df, col):
+    """ Vendor IV column as floats with 0 treated as missing (DataFrame or ChainSide) """
+    v = np.asarray(df[col], dtype=float)
+    return np.where(v == 0, np.nan, v)
+
 class VectorizedQuantEngine:
-    def __init__(self):
-        # DYNAMIC RISK FREE RATE: Fetch 13-Week Treasury Bill Yield
-        try:
-            tnx = yf.Ticker("^IRX")
-            hist = tnx.history(period="1d")
-            if not hist.empty:
-                self.r = hist['Close'].iloc[-1] / 100
-            else:
-                self.r = 0.045 # Fallback
-        except:
-            self.r = 0.045
-
-    def calculate_greeks_vectorized(self, df, S, T, sigma_col='impliedVolatility', type='call'):
+    def __init__(self, curve=None, dtype=np.float64):
+        # RISK FREE TERM STRUCTURE: shared process-wide curve (^IRX/^FVX/^TNX), resolved
+        # on first use so constructing an engine never waits on the network
+        self._curve = curve
+        # np.float32 for large scenario grids; float64 for chain display
+        self.dtype = dtype
+
+    @property
+    def curve(self):
+        if self._curve is None:
+            self._curve = get_rate_curve()
+        return self._curve
+
+    @curve.setter
+    def curve(self, value):
+        self._curve = value
+
+    @property
+    def r(self):
+        """ Short rate (13-Week T-Bill) for display and flat-rate callers """
+        return self.curve.short_rate
+
+    @r.setter
+    def r(self, value):
+        self.curve = RateCurve.flat(value)
+
+    def rate_for(self, T):
+        """ Risk-free rate interpolated to maturity T (years) """
+        return self.curve.rate(T)
+
+    @telemetry.traced("engine.greeks_vectorized")
+    def calculate_greeks_vectorized(self, df, S, T, sigma_col='impliedVolatility', type='call', solve_iv=True,
+                                    exercise='european', dividends=None, steps=None, vol_surface=None):
         """
         Vectorized Black-Scholes-Merton.
         Calculates Delta, Theta, Vega, and Theoretical Price instantly for whole chains.
+        With solve_iv, vol is implied from each contract's mid/last price (on the
+        lattice for exercise='american'); contracts the
+        solver could not invert read vol_surface (a fitted SVISurface) at their strike,
+        then the vendor column. The vol actually used
+        lands in df['iv'] and the solver hit count in df.attrs['iv_converged'].
+        exercise='american' prices on the dividend-aware lattice (american.price) at
+        that vol, with `steps` as the speed/accuracy knob, and adds df['early_premium'].
         """
-        # Handle missing IVs
-        sigma = df[sigma_col].replace(0, np.nan).fillna(0.40) 
-        K = df['strike']
+        K = np.asarray(df['strike'], dtype=float)
         
         # Prevent divide by zero for 0DTE
         T = np.maximum(T, 0.001) 
+        r = self.rate_for(T)
 
-        d1 = (np.log(S / K) + (self.r + 0.5 * sigma ** 2) * T) / (sigma * np.sqrt(T))
-        d2 = d1 - sigma * np.sqrt(T)
-
-        pdf_d1 = norm.pdf(d1)
-        cdf_d1 = norm.cdf(d1)
-        cdf_d2 = norm.cdf(d2)
-        cdf_neg_d1 = norm.cdf(-d1)
-        cdf_neg_d2 = norm.cdf(-d2)
-
-        if type == 'call':
-            df['theo_price'] = S * cdf_d1 - K * np.exp(-self.r * T) * cdf_d2
-            df['delta'] = cdf_d1
-            
-            # THETA CALCULATION
-            term1 = -(S * sigma * pdf_d1) / (2 * np.sqrt(T))
-            term2 = self.r * K * np.exp(-self.r * T) * cdf_d2
-            df['theta'] = (term1 - term2) / 365.0
-            
-        else: # PUT
-            df['theo_price'] = K * np.exp(-self.r * T) * cdf_neg_d2 - S * cdf_neg_d1
-            df['delta'] = cdf_d1 - 1
-            
-            # THETA CALCULATION
-            term1 = -(S * sigma * pdf_d1) / (2 * np.sqrt(T))
-            term2 = self.r * K * np.exp(-self.r * T) * cdf_neg_d2
-            df['theta'] = (term1 + term2) / 365.0
-
-        df['vega'] = (S * pdf_d1 * np.sqrt(T)) / 100 
+        # Handle missing IVs
+        sigma = _vendor_iv(df, sigma_col)
+        if vol_surface is not None:
+            fitted = vol_surface.iv(K, T, spot=S)
+            sigma = np.where(np.isfinite(fitted), fitted, sigma)
+        if solve_iv:
+            mkt = market_price(df)
+            iv = implied_vol(mkt, S, K, T, r, is_call=(type == 'call'))
+            if exercise == 'american':
+                # American quotes invert on the lattice they are repriced with (European IV seeds it)
+                iv = american.implied_vol(mkt, S, K, T, r, is_call=(type == 'call'), dividends=dividends,
+                                          steps=steps or american.DEFAULT_STEPS, seed=iv.iv)
+            sigma = np.where(iv.converged, iv.iv, sigma)
+            df.attrs['iv_converged'], df.attrs['iv_total'] = iv.n_converged, iv.n_total
+        sigma = np.where(np.isfinite(sigma), sigma, IV_FALLBACK)
+        df['iv'] = sigma
+
+        # Fused kernel: price + Greeks in one pass, no intermediate Series
+        if exercise == 'american':
+            res = american.price(S, K, T, r, sigma, is_call=(type == 'call'), dividends=dividends,
+                                 steps=steps or american.DEFAULT_STEPS)
+            df['early_premium'] = res['early_premium']
+        else:
+            res = bsm(S, K, T, r, sigma, is_call=(type == 'call'), dtype=self.dtype)
+        df['theo_price'] = res['price']
+        df['delta'] = res['delta']
+        df['theta'] = res['theta']
+        df['vega'] = res['vega']
         
         return df
 
@@ -69,10 +108,133 @@ class VectorizedQuantEngine:
     def black_scholes_single(self, S, K, T, sigma, type="call"):
         """ Helper for P&L Simulator Loop """
         T = np.maximum(T, 0.001)
-        d1 = (np.log(S / K) + (self.r + 0.5 * sigma ** 2) * T) / (sigma * np.sqrt(T))
-        d2 = d1 - sigma * np.sqrt(T)
-        
-        if type == "call": 
-            return S * norm.cdf(d1) - K * np.exp(-self.r * T) * norm.cdf(d2)
-        else: 
-            return K * np.exp(-self.r * T) * norm.cdf(-d2) - S * norm.cdf(-d1)
+        r = self.rate_for(T)
+        price = bsm_price(S, K, T, r, sigma, is_call=(type == "call"), dtype=self.dtype)
+        return float(price) if price.ndim == 0 else price
+
+    @telemetry.traced("engine.price_legs")
+    def price_legs(self, S, K, T, sigma, is_call, greeks=True):
+        """
+        Batched BSM over flat leg arrays (portfolio books, stress grids).
+        Inputs broadcast; r follows each leg's maturity on the curve.
+        """
+        T = np.maximum(np.asarray(T, dtype=float), 0.001)
+        r = np.asarray(self.rate_for(T), dtype=float)
+        return bsm(S, K, T, r, sigma, is_call=is_call, greeks=greeks, dtype=self.dtype)
+
+    @telemetry.traced("engine.surface_greeks")
+    def calculate_surface_greeks(self, chains, S, sigma_col='impliedVolatility', now=None, annotate=True, solve_iv=True,
+                                 exercise='european', dividends=None, steps=None, fit_surface=True):
+        """
+        Whole-surface BSM in one fused kernel pass.
+        chains: {expiry 'YYYY-MM-DD': (calls_df, puts_df)}; OptionChain.surface() views
+        work too and are written in place.
+        Packs every contract into a (type, strike, expiry) array, solves IV for the
+        whole surface at once (solve_iv), evaluates d1/d2 once and returns a GreekSurface.
+        With annotate=True the Greek columns are also written back onto each chain
+        DataFrame (same columns as calculate_greeks_vectorized).
+        exercise='american' inverts IV on the lattice and replaces price/delta/gamma/theta
+        with the lattice values (dividends: (years, amounts)); the other Greeks stay European.
+        fit_surface calibrates an SVI smile per expiry to the solved vols
+        (surface.vol_surface); contracts the solver missed take their vol from it
+        instead of the vendor column or the flat fallback.
+        """
+        now = now or datetime.now()
+        expiries = sorted(chains)
+        frames = [(chains[e][0], chains[e][1]) for e in expiries]
+        strikes = np.unique(np.concatenate(
+            [np.asarray(f['strike'], dtype=float) for pair in frames for f in pair if f is not None and len(f)] or [np.empty(0)]
+        ))
+        n_k, n_e = len(strikes), len(expiries)
+
+        # PACK: [type, strike, expiry]; unlisted contracts stay NaN / False
+        listed = np.zeros((2, n_k, n_e), dtype=bool)
+        vendor = np.full((2, n_k, n_e), np.nan)
+        mkt = np.full((2, n_k, n_e), np.nan)
+        for j, pair in enumerate(frames):
+            for i, f in enumerate(pair):
+                if f is None or not len(f): continue
+                idx = np.searchsorted(strikes, np.asarray(f['strike'], dtype=float))
+                listed[i, idx, j] = True
+                vendor[i, idx, j] = _vendor_iv(f, sigma_col)
+                mkt[i, idx, j] = market_price(f)
+
+        T = np.array([(datetime.strptime(e, "%Y-%m-%d") - now).days / 365.0 for e in expiries])
+        T = np.maximum(T, 0.001)
+        r = np.asarray(self.rate_for(T), dtype=float).reshape(n_e)
+        is_call = np.array([True, False])[:, None, None]
+
+        iv = fit = None
+        sigma = vendor
+        if solve_iv:
+            iv = implied_vol(mkt, S, strikes[:, None], T, r, is_call=is_call)
+            if exercise == 'american':
+                iv = american.implied_vol(mkt, S, strikes[:, None], T, r, is_call=is_call, dividends=dividends,
+                                          steps=steps or american.DEFAULT_STEPS, seed=iv.iv)
+            if fit_surface:
+                fit = SVISurface.from_quotes(strikes, T, r, np.where(iv.converged, iv.iv, np.nan), S, expiries)
+            fill = vendor if fit is None else fit.iv(strikes[:, None], T)
+            sigma = np.where(iv.converged, iv.iv, fill)
+        sigma = np.where(listed, np.where(np.isfinite(sigma), sigma, IV_FALLBACK), np.nan)
+
+        # ONE FUSED KERNEL PASS FOR THE WHOLE SURFACE (axis 0: call, put)
+        res = bsm(S, strikes[:, None], T, r, sigma, is_call=is_call, dtype=self.dtype)
+        early = None
+        if exercise == 'american':
+            am = american.price(S, strikes[:, None], T, r, sigma, is_call=is_call, dividends=dividends,
+                                steps=steps or american.DEFAULT_STEPS)
+            res.update({k: am[k].astype(self.dtype) for k in ('price', 'delta', 'gamma', 'theta')})
+            early = am['early_premium']
+        surface = GreekSurface(strikes, expiries, T, sigma=sigma, **res)
+        surface.iv_result = iv
+        surface.early_premium = early
+        surface.vol_surface = fit
+
+        if annotate:
+            for j, pair in enumerate(frames):
+                for i, f in enumerate(pair):
+                    if f is None or not len(f): continue
+                    idx = np.searchsorted(strikes, np.asarray(f['strike'], dtype=float))
+                    f['iv'] = sigma[i, idx, j]
+                    f['theo_price'] = surface.price[i, idx, j]
+                    for g in ('delta', 'gamma', 'theta', 'vega', 'rho', 'vanna', 'charm'):
+                        f[g] = getattr(surface, g)[i, idx, j]
+                    if early is not None:
+                        f['early_premium'] = early[i, idx, j]
+                    if iv is not None:
+                        f.attrs['iv_converged'] = int(iv.converged[i, idx, j].sum())
+                        f.attrs['iv_total'] = len(f)
+        return surface
+
+
+class GreekSurface:
+    """
+    Packed Greeks for a whole chain. Every array is shaped (2, n_strikes, n_expiries)
+    with axis 0 = [call, put]; unlisted contracts are NaN.
+    Units: theta/charm per calendar day, vega/rho/vanna per 1 vol/rate point.
+    """
+    FIELDS = ('price', 'delta', 'gamma', 'theta', 'vega', 'rho', 'vanna', 'charm', 'sigma')
+
+    def __init__(self, strikes, expiries, T, **arrays):
+        self.strikes = strikes
+        self.expiries = expiries
+        self.T = T
+        self.iv_result = None
+        self.early_premium = None   # American lattice premium over European, when priced that way
+        self.vol_surface = None     # SVISurface fitted to the solved vols, when calibrated
+        for k in self.FIELDS:
+            setattr(self, k, arrays[k])
+
+    def to_frame(self):
+        """ Long-form DataFrame (one row per listed contract) for display/export """
+        types = np.array(['call', 'put'])
+        t_idx, k_idx, e_idx = np.nonzero(~np.isnan(self.sigma))
+        out = pd.DataFrame({
+            'type': types[t_idx],
+            'strike': self.strikes[k_idx],
+            'expiry': np.asarray(self.expiries)[e_idx],
+            'T': self.T[e_idx],
+        })
+        for k in self.FIELDS:
+            out[k] = getattr(self, k)[t_idx, k_idx, e_idx]
+        return out
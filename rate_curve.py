@@ -0,0 +1,85 @@
+import threading
+import time
+import numpy as np
+
+import data_provider
+import cache_backend
+
+# --- CONFIGURATION ---
+# Treasury yield indices and the tenor (in years) each one represents
+CURVE_TICKERS = {'^IRX': 0.25, '^FVX': 5.0, '^TNX': 10.0}
+FALLBACK_RATE = 0.045
+RATE_TTL = 900  # Seconds a fetched curve is fresh
+RATE_STALE = 3600  # Further seconds a stale curve is served while one process rebuilds it
+CURVE_KEY = "opstruct:rates:curve"
+
+
+class RateCurve:
+    """
+    Risk-free term structure. Linear interpolation in T between the
+    quoted tenors, flat extrapolation outside them.
+    """
+
+    def __init__(self, tenors, rates, as_of=None):
+        order = np.argsort(tenors)
+        self.tenors = np.asarray(tenors, dtype=float)[order]
+        self.rates = np.asarray(rates, dtype=float)[order]
+        self.as_of = as_of if as_of is not None else time.time()
+
+    @classmethod
+    def flat(cls, r):
+        return cls([0.25], [r])
+
+    @property
+    def short_rate(self):
+        return float(self.rates[0])
+
+    def rate(self, T):
+        """Continuously-applied rate for maturity T (years). Scalar or array."""
+        r = np.interp(np.asarray(T, dtype=float), self.tenors, self.rates)
+        return float(r) if np.ndim(r) == 0 else r
+
+    def __repr__(self):
+        pts = ", ".join(f"{t:g}y={r*100:.2f}%" for t, r in zip(self.tenors, self.rates))
+        return f"RateCurve({pts})"
+
+
+def _quote_to_rate(quote):
+    # CBOE yield indices are sometimes quoted x10 (42.50 = 4.25%)
+    return (quote / 10 if quote > 20 else quote) / 100
+
+
+def build_rate_curve():
+    """Fetches ^IRX/^FVX/^TNX and builds a curve. Falls back to a flat curve."""
+    try:
+        closes = data_provider.get_closes(list(CURVE_TICKERS), period="5d")
+        tenors, rates = [], []
+        for sym, tenor in CURVE_TICKERS.items():
+            if sym in closes and closes[sym].dropna().size:
+                tenors.append(tenor)
+                rates.append(_quote_to_rate(closes[sym].dropna().iloc[-1]))
+        if tenors:
+            return RateCurve(tenors, rates)
+    except Exception:
+        pass
+    return RateCurve.flat(FALLBACK_RATE)
+
+
+# --- SHARED SERVICE ---
+_pinned = None
+_curve_lock = threading.Lock()
+
+
+def get_rate_curve(ttl=RATE_TTL):
+    """Shared curve (cache_backend), rebuilt at most once per TTL across sessions and replicas."""
+    with _curve_lock:
+        if _pinned is not None:
+            return _pinned
+    return cache_backend.get_cache().get_or_load(CURVE_KEY, build_rate_curve, ttl, RATE_STALE, cache="rates")
+
+
+def set_rate_curve(curve):
+    """Pin the curve for this process (offline runs, tests, replaying a past date); None unpins."""
+    global _pinned
+    with _curve_lock:
+        _pinned = curve
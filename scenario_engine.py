@@ -0,0 +1,80 @@
+import numpy as np
+
+from quant_engine import VectorizedQuantEngine
+from pricing_kernels import bsm_price
+import telemetry
+
+# --- CONFIGURATION ---
+SPOT_RANGE = (0.8, 1.2)               # Spot axis as a fraction of current price
+N_SPOT = 100
+VOL_SHOCKS = np.arange(-50, 51, 5)    # % shocks; slider values in between are interpolated
+MAX_DAY_POINTS = 121                  # Day axis is exact up to this many days, sampled beyond
+
+
+def leg_arrays(legs):
+    """ strike, is_call, signed qty (+1 BUY / -1 SELL) and vol for a list of trade legs """
+    strike = np.array([float(l['strike']) for l in legs])
+    is_call = np.array([l['type'] == 'call' for l in legs])
+    qty = np.array([1.0 if l['side'] == "BUY" else -1.0 for l in legs])
+    iv = np.array([float(l['iv'] if 'iv' in l else l['impliedVolatility']) for l in legs])
+    return strike, is_call, qty, iv
+
+
+class ScenarioCube:
+    """
+    Trade P&L (per 1 lot, x100 multiplier) pre-priced over a
+    spot x days-forward x vol-shock grid in one kernel call.
+    Slider moves become array lookups instead of re-pricing.
+    With a fitted surface (vol_surface.SVISurface) each leg's vol follows
+    the smile as spot moves (sticky moneyness) and expiry nears, anchored
+    to the leg's own IV today; shocks then scale that vol.
+    """
+
+    @telemetry.traced("scenario.cube_build")
+    def __init__(self, legs, spot, dte, cost, engine=None, spot_range=SPOT_RANGE,
+                 n_spot=N_SPOT, vol_shocks=VOL_SHOCKS, max_days=MAX_DAY_POINTS, surface=None):
+        engine = engine or VectorizedQuantEngine(dtype=np.float32)
+        strike, is_call, qty, iv = leg_arrays(legs)
+        self.dte = int(dte)
+        self.spot = np.linspace(spot * spot_range[0], spot * spot_range[1], n_spot)
+        self.days = np.unique(np.linspace(0, max(1, self.dte), min(max(1, self.dte) + 1, max_days)).round().astype(int))
+        self.vol_shocks = np.asarray(vol_shocks, dtype=float)
+        self.cost = cost
+
+        # AXES: [leg, spot, day, shock]
+        T = np.maximum(0.001, (self.dte - self.days) / 365.0)
+        if surface is None:
+            base = iv[:, None, None]
+        else:
+            smile = surface.iv(strike[:, None, None], T[None, None, :], spot=self.spot[None, :, None])
+            base = iv[:, None, None] + smile - surface.iv(strike, T[0], spot=spot)[:, None, None]   # [leg, spot, day]
+        sigma = np.maximum(0.01, base[..., None] * (1 + self.vol_shocks / 100))
+        r = np.asarray(engine.rate_for(T), dtype=float)
+        prices = bsm_price(
+            self.spot[None, :, None, None], strike[:, None, None, None],
+            T[None, None, :, None], r[None, None, :, None],
+            sigma, is_call[:, None, None, None], dtype=engine.dtype
+        )
+        self.value = np.tensordot(qty.astype(prices.dtype), prices, axes=1) * 100 - cost * 100   # [spot, day, shock]
+
+    def _day_index(self, day):
+        return int(np.abs(self.days - day).argmin())
+
+    def _at_shock(self, arr, shock):
+        """ Linear interpolation along the (last) vol-shock axis """
+        shock = float(np.clip(shock, self.vol_shocks[0], self.vol_shocks[-1]))
+        j = int(np.clip(np.searchsorted(self.vol_shocks, shock) - 1, 0, len(self.vol_shocks) - 2))
+        w = (shock - self.vol_shocks[j]) / (self.vol_shocks[j + 1] - self.vol_shocks[j])
+        return arr[..., j] * (1 - w) + arr[..., j + 1] * w
+
+    def curve(self, day, shock):
+        """ (spot grid, P&L) at a given days-forward and vol shock """
+        return self.spot, self._at_shock(self.value[:, self._day_index(day), :], shock)
+
+    def spot_by_day(self, shock):
+        """ P&L heatmap [spot, day] at a vol shock """
+        return self._at_shock(self.value, shock)
+
+    def spot_by_shock(self, day):
+        """ P&L heatmap [spot, shock] at a days-forward """
+        return self.value[:, self._day_index(day), :]
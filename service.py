@@ -0,0 +1,460 @@
+"""
+Headless service layer: the Terminal and War Room analytics without Streamlit.
+
+    python service.py batch --tickers SPY,QQQ,IWM --expiries 3 --out nightly/
+    python service.py batch --universe universe.csv --workers 16 --out nightly/
+    python service.py serve --port 8080
+
+The batch writes greeks.parquet, picks.parquet, scan.parquet and
+regime.json; tickers are spread over a process pool (one task per ticker,
+all cores by default). The HTTP API is a small asyncio server whose
+handlers run on a thread pool:
+
+    GET /greeks?ticker=SPY&expiry=2026-11-20
+    GET /picks?ticker=SPY[&expiry=...]
+    GET /regime
+    GET /scan[?universe=SPY,QQQ]
+    GET /metrics                 (Prometheus text from telemetry)
+    GET /health
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import threading
+from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import data_provider
+import fetch_orchestrator
+import market_utils
+import strategy_optimizer
+import telemetry
+import cache_backend
+import upstream
+import american
+import prefetch
+import vol_surface
+from quant_engine import VectorizedQuantEngine
+from option_chain import OptionChain, ChainSide
+
+# --- CONFIGURATION ---
+VIEWS = {"bullish": "Call Debit Spread", "bearish": "Put Debit Spread", "neutral": "Short Strangle"}
+DEFAULT_EXPIRIES = 3          # Nearest listed expiries per ticker in a batch
+CHAIN_TTL = 60                # Seconds the API treats a priced chain as fresh
+API_THREADS = 16              # Blocking handler pool for the HTTP server
+MAX_HEADERS = 64
+EXERCISE = os.environ.get("OPSTRUCT_EXERCISE", "american")   # 'european' skips the lattice
+
+
+# ==================================================
+#                  CORE (no UI)
+# ==================================================
+@cache_backend.cached("expiries", ttl=3600, stale=3600)
+def list_expiries(ticker):
+    """ Listed expiries ('YYYY-MM-DD', nearest first); shared-cached for an hour. """
+    with telemetry.span("upstream.yfinance.options", ticker=ticker):
+        return upstream.yahoo(lambda: list(upstream.yf_ticker(ticker).options or []))
+
+
+def spot_price(ticker):
+    bars = data_provider.get_bars(ticker, period="1y")
+    return float(bars['Close'].iloc[-1]) if not bars.empty else None
+
+
+@cache_backend.cached("dividends", ttl=86400, stale=86400)
+def dividend_history(ticker):
+    """ Past cash dividends (Series by ex-date); empty for indices or on failure. """
+    if ticker.startswith("^"):
+        return pd.Series(dtype=float)
+    try:
+        with telemetry.span("upstream.yfinance.dividends", ticker=ticker):
+            return upstream.yahoo(lambda: upstream.yf_ticker(ticker).dividends)
+    except Exception:
+        return pd.Series(dtype=float)
+
+
+def exercise_style(ticker):
+    """ Cash-settled index options ('^SPX'...) are European; listed equity/ETF options American. """
+    return "european" if ticker.startswith("^") else EXERCISE
+
+
+def _raw_chain(ticker, expiry):
+    with telemetry.span("upstream.yfinance.option_chain", ticker=ticker):
+        opt = upstream.yahoo(upstream.yf_ticker(ticker).option_chain, expiry)
+    return opt.calls, opt.puts
+
+
+def _price_surface(engine, ticker, chains, spot, exercise):
+    exercise = exercise or exercise_style(ticker)
+    divs = american.project_dividends(dividend_history(ticker)) if exercise == "american" else None
+    # Calls + puts priced in a single surface pass (writes Greek columns onto both)
+    surface = engine.calculate_surface_greeks(chains, spot, exercise=exercise, dividends=divs)
+    # Fitted smile kept per ticker for the P&L simulator and IV gaps elsewhere
+    vol_surface.put_surface(ticker, surface.vol_surface)
+
+
+def priced_chain(ticker, expiry, spot, engine=None, exercise=None):
+    """ (calls, puts, r) with the engine's Greek columns, or (None, None, None) if the chain is unavailable. """
+    engine = engine or VectorizedQuantEngine()
+    try:
+        calls, puts = _raw_chain(ticker, expiry)
+    except Exception:
+        return None, None, None
+    _price_surface(engine, ticker, {expiry: (calls, puts)}, spot, exercise)
+    return calls, puts, engine.r
+
+
+def compact_chain(ticker, expiry, spot, engine=None, exercise=None):
+    """
+    (OptionChain, r): the same priced chain as float32/int32 arrays with the
+    vendor object columns dropped, priced in place. (None, None) if unavailable.
+    """
+    return compact_surface(ticker, [expiry], spot, engine, exercise)
+
+
+def compact_surface(ticker, expiries, spot, engine=None, exercise=None):
+    """ Several expiries fetched concurrently into one OptionChain, priced in a single surface pass. """
+    engine = engine or VectorizedQuantEngine()
+
+    def fetch(e):
+        try:
+            return e, _raw_chain(ticker, e)
+        except Exception:
+            return e, None
+    got = fetch_orchestrator.run_parallel(*[lambda e=e: fetch(e) for e in expiries]) if expiries else []
+    frames = {e: pair for e, pair in got if pair is not None}
+    if not frames:
+        return None, None
+    chain = OptionChain.from_frames(ticker, frames)
+    _price_surface(engine, ticker, chain.surface(), spot, exercise)
+    return chain, engine.r
+
+
+# Keyed on (ticker, expiry) only, so prefetch.py can fill it ahead of the Terminal.
+# Compact float32 chain: sessions on the same ticker/expiry share one read-only instance.
+@cache_backend.cached("option_chain", ttl=300, stale=300)
+def terminal_chain(ticker, expiry):
+    """ (OptionChain, r) priced at the latest close, or (None, None). """
+    spot = spot_price(ticker)
+    return compact_chain(ticker, expiry, spot) if spot is not None else (None, None)
+
+
+def pick_trade(calls, puts, view):
+    """
+    The Terminal's template picks: bullish = buy 0.50 / sell 0.30 delta calls,
+    bearish = buy -0.50 / sell -0.30 puts, neutral = sell 0.20 call + -0.20 put.
+    Returns {"Legs": [leg, ...], "Type": name}; legs carry side/type. With
+    OptionChain views the legs are option_chain.Leg pointers, else row copies.
+    """
+    ci, pi = strategy_optimizer.DeltaIndex(calls), strategy_optimizer.DeltaIndex(puts)
+
+    def leg(df, k, side, type):
+        if isinstance(df, ChainSide):
+            return df.leg(k if k is not None else 0, side)
+        row = (df.loc[k] if k is not None else df.iloc[0]).copy()
+        row['side'], row['type'] = side, type
+        return row
+
+    view = view.lower()
+    if "bull" in view:
+        kb = ci.nearest(0.50)
+        b = leg(calls, kb, "BUY", "call")
+        ks = ci.nearest(0.30, min_strike=b['strike']) if (np.asarray(calls['strike']) > b['strike']).any() else kb
+        return {"Legs": [b, leg(calls, ks, "SELL", "call")], "Type": "Call Debit Spread"}
+    if "bear" in view:
+        kb = pi.nearest(-0.50)
+        b = leg(puts, kb, "BUY", "put")
+        ks = pi.nearest(-0.30, max_strike=b['strike']) if (np.asarray(puts['strike']) < b['strike']).any() else kb
+        return {"Legs": [b, leg(puts, ks, "SELL", "put")], "Type": "Put Debit Spread"}
+    if "neutral" in view:
+        return {"Legs": [leg(calls, ci.nearest(0.20), "SELL", "call"), leg(puts, pi.nearest(-0.20), "SELL", "put")],
+                "Type": "Short Strangle"}
+    return {}
+
+
+def _long_frame(calls, puts, **cols):
+    """ Calls and puts stacked with a side column. """
+    return pd.concat([calls.assign(side="call"), puts.assign(side="put")], ignore_index=True).assign(**cols)
+
+
+def score_trade(trade, spot, dte, r):
+    """ Exact payoff analytics (strategy_optimizer.evaluate) for one picked trade, per lot. """
+    legs = trade["Legs"]
+    K = np.array([[float(l['strike']) for l in legs]])
+    is_call = np.array([[l['type'] == 'call' for l in legs]])
+    qty = np.array([[1.0 if l['side'] == "BUY" else -1.0 for l in legs]])
+    prem = np.array([[float(l.get('lastPrice', l.get('theo_price', 0))) for l in legs]])
+    vol = float(np.mean([l['iv'] for l in legs]))
+    res = strategy_optimizer.evaluate(K, is_call, qty, prem, spot, max(dte, 1) / 365.0, r, vol)
+    return {k: float(v[0]) for k, v in res.items()}
+
+
+def chain_greeks(ticker, expiry, spot=None):
+    """ One long frame (side column) of a priced chain. """
+    spot = spot if spot is not None else spot_price(ticker)
+    calls, puts, r = priced_chain(ticker, expiry, spot)
+    if calls is None:
+        return pd.DataFrame()
+    return _long_frame(calls, puts, ticker=ticker, expiry=expiry, spot=spot, r=r)
+
+
+def strategy_picks(ticker, expiry, spot=None, calls=None, puts=None, r=None):
+    """ The three Terminal views for one chain, one row each. """
+    spot = spot if spot is not None else spot_price(ticker)
+    if calls is None:
+        calls, puts, r = priced_chain(ticker, expiry, spot)
+        if calls is None:
+            return pd.DataFrame()
+    dte = (datetime.strptime(expiry, '%Y-%m-%d') - datetime.now()).days
+    rows = []
+    for view in VIEWS:
+        trade = pick_trade(calls, puts, view)
+        if not trade: continue
+        row = {"ticker": ticker, "expiry": expiry, "view": view, "type": trade["Type"], "spot": spot, "dte": dte}
+        for i, l in enumerate(trade["Legs"], 1):
+            row.update({f"leg{i}": f"{l['side']} {l['strike']} {l['type'].upper()}", f"leg{i}_delta": float(l['delta'])})
+        row.update(score_trade(trade, spot, dte, r))
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def regime():
+    return market_utils.get_market_regime()
+
+
+def scan(universe=None):
+    return market_utils.scan_volatility_opportunities(universe)
+
+
+# ==================================================
+#                  BATCH
+# ==================================================
+def _process_ticker(args):
+    """ Worker task: every requested expiry of one ticker -> (greeks, picks, errors). """
+    ticker, n_expiries = args
+    greeks, picks = [], []
+    try:
+        spot = spot_price(ticker)
+        if spot is None:
+            return ticker, None, None, "no price history"
+        engine = VectorizedQuantEngine()
+        for expiry in list_expiries(ticker)[:n_expiries]:
+            calls, puts, r = priced_chain(ticker, expiry, spot, engine)
+            if calls is None: continue
+            greeks.append(_long_frame(calls, puts, ticker=ticker, expiry=expiry, spot=spot, r=r))
+            picks.append(strategy_picks(ticker, expiry, spot, calls, puts, r))
+    except Exception as e:
+        return ticker, None, None, f"{type(e).__name__}: {e}"
+    return (ticker, pd.concat(greeks, ignore_index=True) if greeks else None,
+            pd.concat(picks, ignore_index=True) if picks else None, None)
+
+
+def run_batch(tickers, out_dir, n_expiries=DEFAULT_EXPIRIES, workers=None, with_market=True):
+    """
+    Greeks and template picks for every ticker's nearest expiries on a process
+    pool, plus the regime HUD and the vol scan over the same universe.
+    Writes Parquet/JSON into out_dir and returns a summary dict.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    t0 = time.perf_counter()
+    tasks = [(t, n_expiries) for t in tickers]
+    greeks, picks, errors = [], [], {}
+    if workers > 1 and len(tasks) > 1:
+        # Upstream buckets are per process: each worker gets 1/workers of the rate
+        with ProcessPoolExecutor(max_workers=workers, initializer=upstream.share, initargs=(workers,)) as pool:
+            results = list(pool.map(_process_ticker, tasks, chunksize=max(1, len(tasks) // (workers * 8))))
+    else:
+        results = [_process_ticker(t) for t in tasks]
+    for ticker, g, p, err in results:
+        if err: errors[ticker] = err
+        if g is not None: greeks.append(g)
+        if p is not None: picks.append(p)
+
+    written = {}
+    if greeks:
+        df = pd.concat(greeks, ignore_index=True)
+        df.to_parquet(os.path.join(out_dir, "greeks.parquet"), index=False)
+        written["greeks.parquet"] = len(df)
+    if picks:
+        df = pd.concat(picks, ignore_index=True)
+        df.to_parquet(os.path.join(out_dir, "picks.parquet"), index=False)
+        written["picks.parquet"] = len(df)
+    if with_market:
+        vol = scan(list(tickers))
+        if vol is not None and not vol.empty:
+            vol.to_parquet(os.path.join(out_dir, "scan.parquet"), index=False)
+            written["scan.parquet"] = len(vol)
+        with open(os.path.join(out_dir, "regime.json"), "w") as f:
+            json.dump(_jsonable(regime()), f, indent=1)
+        written["regime.json"] = 1
+
+    summary = {"tickers": len(tickers), "ok": len(tickers) - len(errors), "errors": errors,
+               "written": written, "seconds": round(time.perf_counter() - t0, 2)}
+    with open(os.path.join(out_dir, "summary.json"), "w") as f:
+        json.dump(summary, f, indent=1)
+    return summary
+
+
+# ==================================================
+#                  ASYNC HTTP API
+# ==================================================
+def _jsonable(obj):
+    if isinstance(obj, pd.DataFrame):
+        return json.loads(obj.to_json(orient="records", date_format="iso"))
+    if isinstance(obj, dict):
+        return {k: _jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_jsonable(v) for v in obj]
+    if isinstance(obj, (np.floating, np.integer)):
+        obj = obj.item()
+    if isinstance(obj, float) and not np.isfinite(obj):
+        return None   # JSON has no inf/nan
+    return obj
+
+
+@cache_backend.cached("api_chain", ttl=CHAIN_TTL, stale=CHAIN_TTL)
+def _chain(ticker, expiry):
+    spot = spot_price(ticker)
+    calls, puts, r = priced_chain(ticker, expiry, spot) if spot is not None else (None, None, None)
+    return spot, calls, puts, r
+
+
+def _resolve_expiry(ticker, expiry):
+    return expiry or next(iter(list_expiries(ticker)), None)
+
+
+def _api_greeks(q):
+    ticker = q["ticker"].upper()
+    prefetch.touch(ticker)
+    expiry = _resolve_expiry(ticker, q.get("expiry"))
+    spot, calls, puts, r = _chain(ticker, expiry)
+    if calls is None:
+        return 404, {"error": f"no chain for {ticker} {expiry}"}
+    return 200, {"ticker": ticker, "expiry": expiry, "spot": spot, "r": r, "contracts": _long_frame(calls, puts)}
+
+
+def _api_picks(q):
+    ticker = q["ticker"].upper()
+    prefetch.touch(ticker)
+    expiry = _resolve_expiry(ticker, q.get("expiry"))
+    spot, calls, puts, r = _chain(ticker, expiry)
+    if calls is None:
+        return 404, {"error": f"no chain for {ticker} {expiry}"}
+    return 200, {"ticker": ticker, "expiry": expiry, "picks": strategy_picks(ticker, expiry, spot, calls, puts, r)}
+
+
+ROUTES = {
+    "/health": lambda q: (200, {"ok": True}),
+    "/greeks": _api_greeks,
+    "/picks": _api_picks,
+    "/regime": lambda q: (200, regime() or {}),
+    "/scan": lambda q: (200, scan(q["universe"].upper().split(",") if q.get("universe") else None)),
+}
+
+
+def handle(path, query):
+    """ Routes one request to (status, content_type, body bytes). Blocking; run off the event loop. """
+    if path == "/metrics":
+        return 200, "text/plain; version=0.0.4", telemetry.prometheus_text().encode()
+    route = ROUTES.get(path)
+    if route is None:
+        return 404, "application/json", b'{"error": "not found"}'
+    try:
+        with telemetry.span(f"api{path}"):
+            status, body = route(query)
+    except KeyError as e:
+        status, body = 400, {"error": f"missing parameter {e}"}
+    except Exception as e:
+        status, body = 500, {"error": f"{type(e).__name__}: {e}"}
+    return status, "application/json", json.dumps(_jsonable(body), default=str).encode()
+
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+async def _serve_conn(reader, writer, pool):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            method, target, _ = line.decode("latin-1").split(" ", 2)
+            headers = {}
+            for _ in range(MAX_HEADERS):
+                h = await reader.readline()
+                if h in (b"\r\n", b"\n", b""): break
+                k, _, v = h.decode("latin-1").partition(":")
+                headers[k.strip().lower()] = v.strip()
+            if method != "GET":
+                status, ctype, body = 405, "application/json", b'{"error": "GET only"}'
+            else:
+                url = urlsplit(target)
+                query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                status, ctype, body = await loop.run_in_executor(pool, handle, url.path, query)
+            keep = headers.get("connection", "").lower() != "close"
+            writer.write(f"HTTP/1.1 {status} {_REASONS.get(status, '')}\r\nContent-Type: {ctype}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: {'keep-alive' if keep else 'close'}\r\n\r\n"
+                         .encode() + body)
+            await writer.drain()
+            if not keep:
+                break
+    except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(host="0.0.0.0", port=8080, threads=API_THREADS):
+    pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="api")
+    server = await asyncio.start_server(lambda r, w: _serve_conn(r, w, pool), host, port)
+    prefetch.start()   # Keeps the hot symbols' expiries, bars and chains warm
+    print(f"OpStruct API on http://{host}:{port}", flush=True)
+    async with server:
+        await server.serve_forever()
+
+
+# ==================================================
+#                  CLI
+# ==================================================
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="OpStruct headless service")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("batch", help="write Greeks/picks/scan/regime for a batch of tickers")
+    b.add_argument("--tickers", help="comma-separated symbols")
+    b.add_argument("--universe", help="CSV/text universe file (see market_utils.load_universe)")
+    b.add_argument("--expiries", type=int, default=DEFAULT_EXPIRIES, help="nearest N expiries per ticker")
+    b.add_argument("--workers", type=int, default=None, help="processes (default: all cores)")
+    b.add_argument("--out", default="out")
+    b.add_argument("--no-market", action="store_true", help="skip the regime HUD and vol scan")
+    s = sub.add_parser("serve", help="run the HTTP API")
+    s.add_argument("--host", default="0.0.0.0")
+    s.add_argument("--port", type=int, default=8080)
+    s.add_argument("--threads", type=int, default=API_THREADS)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "batch":
+        tickers = market_utils.load_universe(args.universe) if args.universe else \
+            [t.strip().upper() for t in (args.tickers or "").split(",") if t.strip()]
+        if not tickers:
+            ap.error("pass --tickers or --universe")
+        summary = run_batch(tickers, args.out, args.expiries, args.workers, not args.no_market)
+        print(json.dumps(summary, indent=1))
+        return 0 if summary["ok"] else 1
+    try:
+        asyncio.run(serve(args.host, args.port, args.threads))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
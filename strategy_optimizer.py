@@ -0,0 +1,250 @@
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from scipy.special import ndtr
+
+from pricing_kernels import bsm_price
+from iv_solver import market_price
+import telemetry
+
+# --- CONFIGURATION ---
+DEFAULT_KINDS = ("vertical", "strangle", "iron_condor")
+SHORT_DELTA = (0.05, 0.45)   # |delta| band for short strikes of strangles/condors
+CONDOR_WINGS = 5             # Wing widths tried, in strike steps
+DEFAULT_TOP_N = 10
+
+
+class DeltaIndex:
+    """
+    One chain side sorted by delta, built once. Nearest-delta lookups are a
+    binary search instead of a dropna + argmin scan per call.
+    """
+
+    def __init__(self, df):
+        delta = np.asarray(df['delta'], dtype=float)
+        keep = np.flatnonzero(~np.isnan(delta))
+        order = keep[np.argsort(delta[keep], kind='stable')]
+        self.rows = np.asarray(df.index)[order]
+        self.delta = delta[order]
+        self.strike = np.asarray(df['strike'], dtype=float)[order]
+
+    def nearest(self, target_delta, min_strike=None, max_strike=None):
+        """
+        Index label of the contract whose delta is closest to target (None if
+        empty). Strike bounds are exclusive and fall back to a masked scan.
+        """
+        if min_strike is None and max_strike is None:
+            i = int(np.searchsorted(self.delta, target_delta))
+            cand = [k for k in (i - 1, i) if 0 <= k < len(self.delta)]
+            return self.rows[min(cand, key=lambda k: abs(self.delta[k] - target_delta))] if cand else None
+        ok = np.ones(len(self.delta), bool)
+        if min_strike is not None: ok &= self.strike > min_strike
+        if max_strike is not None: ok &= self.strike < max_strike
+        if not ok.any():
+            return None
+        return self.rows[ok][np.abs(self.delta[ok] - target_delta).argmin()]
+
+    def band(self, lo, hi):
+        """ Index labels with lo <= delta <= hi """
+        return self.rows[np.searchsorted(self.delta, lo, 'left'):np.searchsorted(self.delta, hi, 'right')]
+
+
+def _side(df):
+    """ Strike-sorted arrays for one chain side (DataFrame or ChainSide): strike, premium (mid/last/theo), delta, iv """
+    strike = np.asarray(df['strike'], dtype=float)
+    order = np.argsort(strike, kind='stable')
+    prem = market_price(df)
+    if 'theo_price' in df:
+        prem = np.where(np.isfinite(prem), prem, np.asarray(df['theo_price'], dtype=float))
+    iv = df['iv'] if 'iv' in df else df['impliedVolatility']
+    return {
+        'strike': strike[order],
+        'prem': prem[order],
+        'delta': np.asarray(df['delta'], dtype=float)[order] if 'delta' in df else np.full(len(df), np.nan),
+        'iv': np.asarray(iv, dtype=float)[order],
+    }
+
+
+# ==================================================
+#                  CANDIDATE GENERATION
+# ==================================================
+def _verticals(c, p):
+    """ Every strike pair on each side, as both debit and credit spreads. """
+    out = []
+    for side, is_call in ((c, True), (p, False)):
+        n = len(side['strike'])
+        if n < 2: continue
+        i, j = np.triu_indices(n, k=1)        # strike[i] < strike[j]
+        K = np.stack([side['strike'][i], side['strike'][j]], 1)
+        prem = np.stack([side['prem'][i], side['prem'][j]], 1)
+        # Calls: long low / short high = bull debit.  Puts: long high / short low = bear debit.
+        debit_qty = np.array([1.0, -1.0]) if is_call else np.array([-1.0, 1.0])
+        for qty, name in ((debit_qty, "Debit"), (-debit_qty, "Credit")):
+            kind = f"{'Call' if is_call else 'Put'} {name} Spread"
+            out.append((kind, K, np.full(K.shape, is_call), np.broadcast_to(qty, K.shape), prem))
+    return out
+
+
+def _short_band(side, is_call):
+    lo, hi = SHORT_DELTA
+    d = np.abs(side['delta'])
+    return np.flatnonzero((d >= lo) & (d <= hi))
+
+
+def _strangles(c, p):
+    ci, pi = _short_band(c, True), _short_band(p, False)
+    if not len(ci) or not len(pi): return []
+    ii, jj = np.meshgrid(pi, ci, indexing='ij')
+    ii, jj = ii.ravel(), jj.ravel()
+    ok = p['strike'][ii] < c['strike'][jj]
+    ii, jj = ii[ok], jj[ok]
+    K = np.stack([p['strike'][ii], c['strike'][jj]], 1)
+    prem = np.stack([p['prem'][ii], c['prem'][jj]], 1)
+    is_call = np.broadcast_to(np.array([False, True]), K.shape)
+    qty = np.broadcast_to(np.array([-1.0, -1.0]), K.shape)
+    return [("Short Strangle", K, is_call, qty, prem)]
+
+
+def _condors(c, p, wings=CONDOR_WINGS):
+    """ Short strangle body x symmetric wing widths (in strike steps) """
+    ci, pi = _short_band(c, True), _short_band(p, False)
+    if not len(ci) or not len(pi): return []
+    ii, jj = np.meshgrid(pi, ci, indexing='ij')
+    ii, jj = ii.ravel(), jj.ravel()
+    ok = p['strike'][ii] < c['strike'][jj]
+    ii, jj = ii[ok], jj[ok]
+    out_K, out_prem = [], []
+    for w in range(1, wings + 1):
+        pl, cl = ii - w, jj + w
+        ok = (pl >= 0) & (cl < len(c['strike']))
+        a, b, pl_, cl_ = ii[ok], jj[ok], pl[ok], cl[ok]
+        out_K.append(np.stack([p['strike'][pl_], p['strike'][a], c['strike'][b], c['strike'][cl_]], 1))
+        out_prem.append(np.stack([p['prem'][pl_], p['prem'][a], c['prem'][b], c['prem'][cl_]], 1))
+    K = np.concatenate(out_K) if out_K else np.empty((0, 4))
+    prem = np.concatenate(out_prem) if out_prem else np.empty((0, 4))
+    is_call = np.broadcast_to(np.array([False, False, True, True]), K.shape)
+    qty = np.broadcast_to(np.array([1.0, -1.0, -1.0, 1.0]), K.shape)
+    return [("Iron Condor", K, is_call, qty, prem)]
+
+
+# ==================================================
+#                  VECTORIZED SCORING
+# ==================================================
+def _lognormal_cdf(x, S, T, mu, vol):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = (np.log(x / S) - (mu - 0.5 * vol ** 2) * T) / (vol * np.sqrt(T))
+    return np.where(x <= 0, 0.0, ndtr(z))
+
+
+def evaluate(K, is_call, qty, prem, S, T, r, vol, mu=None):
+    """
+    Scores n structures at once. K/is_call/qty/prem are (n, legs) arrays.
+    Payoffs are piecewise linear in S_T, so max profit/loss, breakevens and POP
+    are exact from the payoff at the sorted strikes plus the slope past the last
+    strike; EV uses closed-form lognormal expectations (drift mu, default r).
+    All money per 1 lot (x100).
+    """
+    mu = r if mu is None else mu
+    n, L = K.shape
+    cost = (qty * prem).sum(1)   # per share; debit > 0
+
+    X = np.concatenate([np.zeros((n, 1)), np.sort(K, 1)], 1)                     # (n, L+1) breakpoints
+    intr = np.where(is_call[:, None, :], X[:, :, None] - K[:, None, :], K[:, None, :] - X[:, :, None])
+    f = (qty[:, None, :] * np.maximum(intr, 0)).sum(2) - cost[:, None]          # payoff at breakpoints
+    slope = (qty * is_call).sum(1)                                                # d payoff / dS beyond last strike
+
+    max_profit = np.where(slope > 0, np.inf, f.max(1))
+    max_loss = np.where(slope < 0, np.inf, -f.min(1))
+
+    # Positive region of each linear segment, mapped to lognormal probability
+    a, b = X[:, :-1], X[:, 1:]
+    fa, fb = f[:, :-1], f[:, 1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        root = a + (b - a) * fa / (fa - fb)
+    lo = np.where(fa > 0, a, root)
+    hi = np.where(fb > 0, b, root)
+    seg = (fa > 0) | (fb > 0)
+    pop = np.where(seg, _lognormal_cdf(hi, S, T, mu, vol) - _lognormal_cdf(lo, S, T, mu, vol), 0).sum(1)
+
+    xl, fl = X[:, -1], f[:, -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        tail_root = xl - fl / slope
+    tail_lo = np.where(fl > 0, xl, tail_root)
+    tail_hi = np.where((fl > 0) & (slope < 0), tail_root, np.inf)
+    tail = ((fl > 0) | (slope > 0))
+    cdf_hi = np.where(np.isinf(tail_hi), 1.0, _lognormal_cdf(np.where(np.isinf(tail_hi), 1.0, tail_hi), S, T, mu, vol))
+    pop += np.where(tail, cdf_hi - _lognormal_cdf(tail_lo, S, T, mu, vol), 0)
+
+    crosses = (fa > 0) != (fb > 0)
+    roots = np.where(crosses, root, np.nan)
+    tail_cross = (slope != 0) & ((fl > 0) != (slope > 0))
+    roots = np.concatenate([roots, np.where(tail_cross, tail_root, np.nan)[:, None]], 1)
+    with np.errstate(all='ignore'):
+        be_low, be_high = np.nanmin(np.where(np.isnan(roots), np.inf, roots), 1), np.nanmax(np.where(np.isnan(roots), -np.inf, roots), 1)
+    be_low = np.where(np.isinf(be_low), np.nan, be_low)
+    be_high = np.where(np.isinf(be_high), np.nan, be_high)
+
+    # EV: E[(S_T-K)+] = e^{mu T} * BSM price with rate mu
+    fwd_value = bsm_price(S, K, T, mu, vol, is_call) * np.exp(mu * T)
+    ev = (qty * fwd_value).sum(1) - cost
+
+    return {
+        'cost': cost * 100, 'max_profit': max_profit * 100, 'max_loss': max_loss * 100,
+        'be_low': be_low, 'be_high': be_high, 'pop': np.clip(pop, 0, 1) * 100, 'ev': ev * 100,
+    }
+
+
+@telemetry.traced("optimizer.optimize")
+def optimize(chains, S, r, now=None, kinds=DEFAULT_KINDS, top_n=DEFAULT_TOP_N,
+             objective='ev_per_risk', max_cost=None, max_loss=None, min_pop=None, min_ev=None):
+    """
+    Enumerates every vertical, short strangle and iron condor on each expiry's
+    chain and scores them all as arrays.
+
+    chains: {expiry: (calls_df, puts_df)} with Greek/iv columns from the engine
+    r: flat rate or a callable T -> rate (e.g. engine.rate_for)
+    objective: 'ev_per_risk' (EV / max loss), 'ev' or 'pop'
+    Constraints (per lot, $): max_cost, max_loss, min_pop (%), min_ev.
+    Returns the top_n candidates as a DataFrame.
+    """
+    now = now or datetime.now()
+    frames = []
+    for expiry, (calls, puts) in chains.items():
+        c, p = _side(calls), _side(puts)
+        T = max((datetime.strptime(expiry, "%Y-%m-%d") - now).days, 1) / 365.0
+        rate = r(T) if callable(r) else r
+        # One vol for the terminal distribution: ATM call IV
+        atm = int(np.abs(c['strike'] - S).argmin()) if len(c['strike']) else None
+        vol = float(c['iv'][atm]) if atm is not None and np.isfinite(c['iv'][atm]) else 0.4
+
+        cands = []
+        if "vertical" in kinds: cands += _verticals(c, p)
+        if "strangle" in kinds: cands += _strangles(c, p)
+        if "iron_condor" in kinds: cands += _condors(c, p)
+        for kind, K, is_call, qty, prem in cands:
+            if not len(K): continue
+            ok = np.isfinite(prem).all(1)
+            K, is_call, qty, prem = K[ok], np.asarray(is_call)[ok], np.asarray(qty)[ok], prem[ok]
+            if not len(K): continue
+            res = evaluate(K, is_call, qty, prem, S, T, rate, vol)
+            df = pd.DataFrame(res)
+            df.insert(0, 'expiry', expiry)
+            df.insert(0, 'kind', kind)
+            for i in range(K.shape[1]):
+                df[f'K{i + 1}'] = K[:, i]
+            frames.append(df)
+
+    if not frames:
+        return pd.DataFrame()
+    out = pd.concat(frames, ignore_index=True)
+
+    keep = np.isfinite(out['max_loss']) & (out['max_loss'] > 0) if objective == 'ev_per_risk' else np.ones(len(out), bool)
+    if max_cost is not None: keep &= out['cost'] <= max_cost
+    if max_loss is not None: keep &= out['max_loss'] <= max_loss
+    if min_pop is not None: keep &= out['pop'] >= min_pop
+    if min_ev is not None: keep &= out['ev'] >= min_ev
+    out = out[keep]
+
+    score = {'ev': out['ev'], 'pop': out['pop']}.get(objective)
+    out = out.assign(score=score if score is not None else out['ev'] / out['max_loss'])
+    return out.nlargest(top_n, 'score').reset_index(drop=True)
@@ -0,0 +1,291 @@
+import os
+import re
+import time
+import difflib
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- CONFIGURATION ---
+BUNDLED_MASTER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "symbols.csv")
+INDEX_DIR = os.environ.get(
+    "OPSTRUCT_SYMBOL_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), ".symbol_index")
+)
+REFRESH_TTL = 7 * 86400   # Seconds before the background refresh re-downloads the master
+RETRY_AFTER = 3600        # Seconds between attempts while the download keeps failing
+REFRESH_SOURCES = (       # Nasdaq Trader symbol directories (pipe-delimited)
+    "https://www.nasdaqtrader.com/dynamic/SymDir/nasdaqlisted.txt",
+    "https://www.nasdaqtrader.com/dynamic/SymDir/otherlisted.txt",
+)
+OTHER_EXCHANGES = {"A": "AMEX", "N": "NYSE", "P": "ARCA", "Z": "BATS", "V": "IEX"}
+SYM_WIDTH, NAME_WIDTH, TOKEN_WIDTH = 12, 64, 24
+FIELDS = ("sym", "name", "exch", "opt", "tok", "tokrow")
+_TICKER_SHAPE = re.compile(r"\^?[A-Za-z0-9][A-Za-z0-9.\-=]{0,11}")   # Could be a symbol as typed
+
+
+def _tokens(name):
+    return [t for t in re.split(r"[^a-z0-9]+", name.lower()) if len(t) > 1]
+
+
+def compile_master(master):
+    """
+    Symbol master (symbol, name, exchange, optionable) -> fixed-width sorted
+    arrays: symbols by row, plus (name word, row) pairs sorted by word.
+    """
+    df = master.dropna(subset=["symbol"]).copy()
+    df["symbol"] = df["symbol"].astype(str).str.strip().str.upper()
+    df = df[df["symbol"].str.len().between(1, SYM_WIDTH)].drop_duplicates("symbol").sort_values("symbol")
+    names = df["name"].fillna("").astype(str).tolist()
+
+    arrays = {
+        "sym": df["symbol"].to_numpy(dtype=f"S{SYM_WIDTH}"),
+        "name": np.array([n.encode("utf-8")[:NAME_WIDTH] for n in names], dtype=f"S{NAME_WIDTH}"),
+        "exch": df["exchange"].fillna("").astype(str).to_numpy(dtype="S8"),
+        "opt": df["optionable"].fillna(0).astype(bool).to_numpy(),
+    }
+    pairs = sorted((t[:TOKEN_WIDTH], row) for row, n in enumerate(names) for t in set(_tokens(n)))
+    arrays["tok"] = np.array([t for t, _ in pairs], dtype=f"S{TOKEN_WIDTH}")
+    arrays["tokrow"] = np.array([r for _, r in pairs], dtype=np.int32)
+    return arrays
+
+
+def build_index(master, out_dir=INDEX_DIR):
+    """
+    Compiles the master and saves each array as .npy so every worker process
+    can np.load(..., mmap_mode='r') them and share one copy via the page cache.
+    """
+    arrays = compile_master(master)
+    os.makedirs(out_dir, exist_ok=True)
+    for k, v in arrays.items():
+        tmp = os.path.join(out_dir, f"{k}.tmp.npy")
+        np.save(tmp, v)
+        os.replace(tmp, os.path.join(out_dir, f"{k}.npy"))
+    return arrays
+
+
+def _master_path(index_dir=INDEX_DIR):
+    """ The refreshed master when one has been downloaded, else the bundled file. """
+    refreshed = os.path.join(index_dir, "symbols.csv")
+    return refreshed if os.path.exists(refreshed) else BUNDLED_MASTER
+
+
+class SymbolIndex:
+    """
+    Offline ticker resolution over a compiled symbol master.
+
+    Symbols and name words are sorted byte arrays, so a prefix query is two
+    binary searches; fuzzy matching (difflib) only runs when nothing matches
+    by prefix. Ranking: exact symbol, symbol prefix (shortest first), name-word
+    prefix, fuzzy; optionable names win ties.
+    """
+
+    def __init__(self, arrays):
+        self.__dict__.update({k: arrays[k] for k in FIELDS})
+        self._fuzzy_pool = None
+
+    @classmethod
+    def load(cls, index_dir=INDEX_DIR):
+        """ Memory-maps the compiled index, rebuilding it first if missing or older than the master. """
+        master = _master_path(index_dir)
+        paths = {k: os.path.join(index_dir, f"{k}.npy") for k in FIELDS}
+        try:
+            if min(os.path.getmtime(p) for p in paths.values()) >= os.path.getmtime(master):
+                return cls({k: np.load(p, mmap_mode="r") for k, p in paths.items()})
+        except (OSError, ValueError):
+            pass
+        try:
+            build_index(pd.read_csv(master), index_dir)
+            return cls({k: np.load(p, mmap_mode="r") for k, p in paths.items()})
+        except OSError:
+            return cls(compile_master(pd.read_csv(master)))   # Read-only install: in-memory only
+
+    def __len__(self):
+        return len(self.sym)
+
+    def _prefix_range(self, arr, prefix):
+        key = prefix.encode("utf-8")
+        return int(np.searchsorted(arr, key, "left")), int(np.searchsorted(arr, key + b"\xff", "left"))
+
+    def _row(self, i, score):
+        return {"symbol": self.sym[i].decode(), "name": self.name[i].decode("utf-8", "ignore"),
+                "exchange": self.exch[i].decode(), "optionable": bool(self.opt[i]), "score": score}
+
+    def search(self, query, limit=10):
+        """ Ranked matches for a symbol or company-name query. """
+        q = query.strip()
+        if not q:
+            return []
+        sym_q = q.upper().replace(".", "-")
+        scores = {}
+
+        # Indices are listed as ^VIX etc.; a bare 'VIX' should still find them
+        for key, bonus in ((sym_q, 0.0), ("^" + sym_q.lstrip("^"), -5.0)):
+            lo, hi = self._prefix_range(self.sym, key)
+            for i in range(lo, min(hi, lo + 200)):
+                extra = len(self.sym[i]) - len(key)
+                scores[i] = max(scores.get(i, 0.0), (100.0 if extra == 0 else 80.0 - min(extra, 10)) + bonus)
+
+        words = _tokens(q)
+        if words:
+            # Every query word must prefix-match some word of the name
+            rows = None
+            for w in words:
+                a, b = self._prefix_range(self.tok, w[:TOKEN_WIDTH])
+                hit = set(np.asarray(self.tokrow[a:b]).tolist())
+                rows = hit if rows is None else rows & hit
+            for i in rows or ():
+                scores[i] = max(scores.get(i, 0.0), 60.0)
+
+        if not scores:
+            if self._fuzzy_pool is None:
+                self._fuzzy_pool = {s.decode(): i for i, s in enumerate(np.asarray(self.sym))}
+            for s in difflib.get_close_matches(sym_q, self._fuzzy_pool.keys(), n=limit, cutoff=0.6):
+                i = self._fuzzy_pool[s]
+                scores[i] = 40.0 * difflib.SequenceMatcher(None, sym_q, s).ratio()
+
+        ranked = sorted(scores.items(), key=lambda kv: (-(kv[1] + (1 if self.opt[kv[0]] else 0)), len(self.sym[kv[0]])))
+        return [self._row(i, s) for i, s in ranked[:limit]]
+
+    def _exact(self, arr, key):
+        key = key.encode("utf-8")
+        lo, hi = int(np.searchsorted(arr, key, "left")), int(np.searchsorted(arr, key, "right"))
+        return range(lo, hi)
+
+    def lookup(self, symbol):
+        """ Master row for an exact symbol ('VIX' also finds '^VIX'), or None. """
+        sym_q = symbol.strip().upper().replace(".", "-")
+        for key in (sym_q, "^" + sym_q.lstrip("^")):
+            rows = self._exact(self.sym, key) if sym_q else ()
+            if len(rows):
+                return self._row(rows[0], 100.0)
+        return None
+
+    def resolve(self, query):
+        """
+        Symbol for free-text input. A listed symbol resolves to itself and a
+        company name ('apple inc') to the listing whose name has every word;
+        anything else comes back normalized. Prefix and fuzzy lookalikes are
+        never substituted (search() offers them as suggestions): a valid
+        ticker missing from the master must reach upstream unchanged.
+        """
+        q = query.strip()
+        hit = self.lookup(q)
+        if hit is not None:
+            return hit["symbol"]
+        words = _tokens(q)
+        if words and not _TICKER_SHAPE.fullmatch(q):
+            rows = None
+            for w in words:
+                hit = set(np.asarray(self.tokrow[self._exact(self.tok, w[:TOKEN_WIDTH])]).tolist())
+                rows = hit if rows is None else rows & hit
+            if rows:
+                best = min(rows, key=lambda i: (not self.opt[i], len(self.sym[i])))
+                return self.sym[best].decode()
+        return q.upper().replace(".", "-") if _TICKER_SHAPE.fullmatch(q) else q.upper()
+
+
+# ==================================================
+#                  BACKGROUND REFRESH
+# ==================================================
+def download_master(timeout=10):
+    """
+    Fresh master from the Nasdaq Trader directories (test issues dropped,
+    class shares in Yahoo's BRK-B form). The directories carry no options
+    flag, so it is kept from the current master; new listings default to 0.
+    """
+    import upstream   # Only the refresh touches the network
+    gateway = upstream.get("nasdaqtrader")
+
+    def fetch(url):
+        resp = upstream.session().get(url, timeout=timeout)
+        resp.raise_for_status()
+        return resp.text
+
+    frames = []
+    for url in REFRESH_SOURCES:
+        text = gateway.call(fetch, url)
+        lines = [l for l in text.splitlines() if l and not l.startswith("File Creation Time")]
+        df = pd.DataFrame([l.split("|") for l in lines[1:]], columns=lines[0].split("|"))
+        df = df[df.get("Test Issue", "N") != "Y"]
+        if "ACT Symbol" in df:
+            frames.append(pd.DataFrame({"symbol": df["ACT Symbol"], "name": df["Security Name"],
+                                        "exchange": df["Exchange"].map(OTHER_EXCHANGES).fillna("OTHER")}))
+        else:
+            frames.append(pd.DataFrame({"symbol": df["Symbol"], "name": df["Security Name"], "exchange": "NASDAQ"}))
+    fresh = pd.concat(frames, ignore_index=True)
+    fresh["symbol"] = fresh["symbol"].str.replace(".", "-", regex=False)
+
+    current = pd.read_csv(_master_path())
+    opt = dict(zip(current["symbol"], current["optionable"]))
+    fresh["optionable"] = fresh["symbol"].map(opt).fillna(0).astype(int)
+    # Indices/FX etc. only exist in the bundled master
+    return pd.concat([fresh, current[~current["symbol"].isin(fresh["symbol"])]], ignore_index=True)
+
+
+def refresh(index_dir=INDEX_DIR):
+    """ Downloads and compiles a new master; the live index is swapped on success. """
+    global _index
+    master = download_master()
+    os.makedirs(index_dir, exist_ok=True)
+    tmp = os.path.join(index_dir, "symbols.tmp.csv")
+    master.to_csv(tmp, index=False)
+    os.replace(tmp, os.path.join(index_dir, "symbols.csv"))
+    idx = SymbolIndex.load(index_dir)
+    with _lock:
+        _index = idx
+    return idx
+
+
+def _stale(index_dir=INDEX_DIR):
+    try:
+        return time.time() - os.path.getmtime(os.path.join(index_dir, "symbols.csv")) > REFRESH_TTL
+    except OSError:
+        return True
+
+
+def refresh_async(index_dir=INDEX_DIR):
+    """ Starts one daemon refresh when the master is stale; lookups keep using the current index. """
+    global _refreshing, _last_attempt
+    with _lock:
+        if _refreshing or time.time() - _last_attempt < RETRY_AFTER or not _stale(index_dir):
+            return
+        _refreshing, _last_attempt = True, time.time()
+
+    def run():
+        global _refreshing
+        try: refresh(index_dir)
+        except Exception: pass
+        finally:
+            with _lock: _refreshing = False
+
+    threading.Thread(target=run, daemon=True, name="symbol-refresh").start()
+
+
+_index = None
+_refreshing = False
+_last_attempt = 0.0
+_lock = threading.Lock()
+
+
+def get_index():
+    """ Process-wide SymbolIndex (memory-mapped on first use). """
+    global _index
+    if _index is None:
+        idx = SymbolIndex.load()
+        with _lock:
+            _index = _index or idx
+    return _index
+
+
+def search(query, limit=10):
+    return get_index().search(query, limit)
+
+
+def resolve(query):
+    return get_index().resolve(query)
+
+
+def lookup(symbol):
+    return get_index().lookup(symbol)
@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import bisect
+import functools
+import threading
+from collections import deque
+
+import numpy as np
+
+# --- CONFIGURATION ---
+ENABLED = os.environ.get("OPSTRUCT_TRACE", "1") != "0"
+TRACE_FILE = os.environ.get("OPSTRUCT_TRACE_FILE")          # JSON lines sink for finished spans
+METRICS_PORT = os.environ.get("OPSTRUCT_METRICS_PORT")      # Serves /metrics (Prometheus) when set
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)   # seconds
+RECENT_SPANS = 500     # Ring buffer behind the debug panel and JSON export
+RESERVOIR = 1000       # Recent durations kept per span name for percentiles
+
+
+class _Stat:
+    """ Per-name latency aggregate: Prometheus buckets plus a recent-sample reservoir. """
+    __slots__ = ("count", "total", "max", "buckets", "recent")
+
+    def __init__(self):
+        self.count, self.total, self.max = 0, 0.0, 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.recent = deque(maxlen=RESERVOIR)
+
+    def add(self, dt):
+        self.count += 1
+        self.total += dt
+        self.max = dt if dt > self.max else self.max
+        self.buckets[bisect.bisect_left(BUCKETS, dt)] += 1
+        self.recent.append(dt)
+
+
+_lock = threading.Lock()
+_stats = {}          # span name -> _Stat
+_counters = {}       # (name, labels tuple) -> float
+_gauges = {}         # name -> zero-arg callable, read at export
+_spans = deque(maxlen=RECENT_SPANS)
+_local = threading.local()
+_sink = None
+
+
+class _NoopSpan:
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def tag(self, **tags): pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Span:
+    """ Timed region. Nested spans on the same thread record their parent. """
+    __slots__ = ("name", "tags", "start", "parent", "depth")
+
+    def __init__(self, name, tags):
+        self.name, self.tags = name, tags
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent = stack[-1].name if stack else None
+        self.depth = len(stack)
+        stack.append(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dt = time.perf_counter() - self.start
+        _local.stack.pop()
+        rec = {"ts": time.time() - dt, "name": self.name, "ms": dt * 1000, "parent": self.parent,
+               "depth": self.depth, "thread": threading.current_thread().name}
+        if exc_type is not None: rec["error"] = exc_type.__name__
+        if self.tags: rec["tags"] = self.tags
+        with _lock:
+            stat = _stats.get(self.name)
+            if stat is None:
+                stat = _stats[self.name] = _Stat()
+            stat.add(dt)
+            _spans.append(rec)
+        if _sink is not None:
+            _sink.write(rec)
+        return False
+
+
+def span(name, **tags):
+    """
+    with telemetry.span("engine.surface_greeks", strikes=n): ...
+    A shared no-op when tracing is off.
+    """
+    return Span(name, tags) if ENABLED else _NOOP
+
+
+def traced(name=None):
+    """ Decorator form of span(); the disabled path is one flag check. """
+    def deco(fn):
+        label = name or f"{fn.__module__}.{fn.__qualname__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return fn(*args, **kwargs)
+            with Span(label, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def count(name, n=1, **labels):
+    """ Monotonic counter, e.g. count("cache_hits", cache="bar_store") """
+    if not ENABLED:
+        return
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+
+def gauge(name, fn):
+    """ Registers a callable sampled at export time (cache sizes, pool depth...). """
+    _gauges[name] = fn
+
+
+def set_enabled(flag):
+    global ENABLED
+    ENABLED = bool(flag)
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _counters.clear()
+        _spans.clear()
+
+
+# ==================================================
+#                  EXPORT
+# ==================================================
+def summary():
+    """ Per-span stats (count, mean, p50, p95, max in ms) sorted by total time. """
+    with _lock:
+        items = [(k, s.count, s.total, s.max, np.array(s.recent)) for k, s in _stats.items()]
+    rows = []
+    for name, n, total, mx, recent in items:
+        p50, p95 = np.percentile(recent, [50, 95]) if recent.size else (np.nan, np.nan)
+        rows.append({"span": name, "count": n, "total_ms": total * 1000, "mean_ms": total / n * 1000,
+                     "p50_ms": float(p50) * 1000, "p95_ms": float(p95) * 1000, "max_ms": mx * 1000})
+    return sorted(rows, key=lambda r: -r["total_ms"])
+
+
+def counters():
+    with _lock:
+        return {(n, labels): v for (n, labels), v in _counters.items()}
+
+
+def recent_spans(n=RECENT_SPANS):
+    with _lock:
+        return list(_spans)[-n:]
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}" if pairs else ""
+
+
+def prometheus_text():
+    """ Prometheus exposition format: span histograms, counters and gauges. """
+    out = ["# TYPE opstruct_span_seconds histogram"]
+    with _lock:
+        stats = [(k, s.count, s.total, list(s.buckets)) for k, s in _stats.items()]
+        ctrs = list(_counters.items())
+    for name, n, total, buckets in sorted(stats):
+        cum = 0
+        for le, b in zip(BUCKETS + ("+Inf",), buckets):
+            cum += b
+            out.append(f'opstruct_span_seconds_bucket{{span="{name}",le="{le}"}} {cum}')
+        out.append(f'opstruct_span_seconds_sum{{span="{name}"}} {total:.6f}')
+        out.append(f'opstruct_span_seconds_count{{span="{name}"}} {n}')
+    for metric in sorted({n for (n, _), _ in ctrs}):
+        out.append(f"# TYPE opstruct_{metric}_total counter")
+        for (n, labels), v in sorted(ctrs):
+            if n == metric:
+                out.append(f"opstruct_{n}_total{_labels(labels)} {v:g}")
+    gauges = sorted(_gauges.items())
+    for metric in sorted({name.split("{")[0] for name, _ in gauges}):
+        samples = []
+        for name, fn in gauges:
+            if name.split("{")[0] != metric:
+                continue
+            try: samples.append(f"opstruct_{name} {float(fn()):g}")
+            except Exception: continue
+        if samples:
+            out.append(f"# TYPE opstruct_{metric} gauge")
+            out.extend(samples)
+    return "\n".join(out) + "\n"
+
+
+def json_lines(n=RECENT_SPANS):
+    """ Recent spans as JSON lines (one span per line). """
+    return "\n".join(json.dumps(r, default=str) for r in recent_spans(n))
+
+
+class _JsonlSink:
+    """ Appends finished spans to a file; writes are batched to keep I/O off the hot path. """
+
+    def __init__(self, path, flush_every=64):
+        self.path, self.flush_every = path, flush_every
+        self.buf, self.lock = [], threading.Lock()
+
+    def write(self, rec):
+        with self.lock:
+            self.buf.append(json.dumps(rec, default=str))
+            if len(self.buf) >= self.flush_every:
+                self.flush_locked()
+
+    def flush_locked(self):
+        try:
+            with open(self.path, "a") as f:
+                f.write("\n".join(self.buf) + "\n")
+        except OSError:
+            pass
+        self.buf = []
+
+    def flush(self):
+        with self.lock:
+            if self.buf: self.flush_locked()
+
+
+_server = None
+
+
+def serve_metrics(port):
+    """ Starts a daemon HTTP server exposing /metrics (Prometheus) and /spans (JSON lines). """
+    global _server
+    if _server is not None:
+        return _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body, ctype = ((prometheus_text(), "text/plain; version=0.0.4") if self.path.startswith("/metrics")
+                           else (json_lines(), "application/x-ndjson") if self.path.startswith("/spans")
+                           else (None, None))
+            if body is None:
+                self.send_error(404); return
+            data = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", ctype)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        _server = ThreadingHTTPServer(("0.0.0.0", int(port)), Handler)
+    except OSError:
+        return None   # Another worker already owns the port
+    threading.Thread(target=_server.serve_forever, daemon=True, name="metrics").start()
+    return _server
+
+
+if TRACE_FILE:
+    _sink = _JsonlSink(TRACE_FILE)
+    import atexit
+    atexit.register(_sink.flush)
+if METRICS_PORT:
+    serve_metrics(METRICS_PORT)
+
+
+# ==================================================
+#                  DEBUG PANEL
+# ==================================================
+def render_debug_panel(st):
+    """ In-app view of span stats, cache counters and the latest spans. """
+    import pandas as pd
+    st.markdown("#### 🛠️ Telemetry")
+    if not ENABLED:
+        st.caption("Tracing is off (OPSTRUCT_TRACE=0)."); return
+    rows = summary()
+    if rows:
+        st.dataframe(pd.DataFrame(rows).round(2), use_container_width=True, hide_index=True)
+    ctrs = counters()
+    if ctrs:
+        st.dataframe(pd.DataFrame([{"counter": n, **dict(l), "value": v} for (n, l), v in ctrs.items()]),
+                     use_container_width=True, hide_index=True)
+    last = recent_spans(40)
+    if last:
+        st.code("\n".join(f"{'  ' * r['depth']}{r['name']:<40} {r['ms']:9.2f} ms" for r in last), language=None)
+    st.download_button("metrics.prom", prometheus_text(), file_name="metrics.prom")
+    st.download_button("spans.jsonl", json_lines(), file_name="spans.jsonl")
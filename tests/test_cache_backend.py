@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_backend import Cache, LRUBackend, SQLiteBackend
+
+TTL, STALE = 0.3, 60
+
+
+def _settle(*caches):
+    """ Waits for background revalidations to finish. """
+    deadline = time.time() + 5
+    while any(c._inflight for c in caches) and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def _replicas(tmp_path):
+    shared = SQLiteBackend(str(tmp_path / "cache.db"))
+    return Cache(shared, LRUBackend()), Cache(shared, LRUBackend())
+
+
+def test_one_load_per_expiry_across_replicas(tmp_path):
+    a, b = _replicas(tmp_path)
+    calls = []
+
+    def loader():
+        calls.append(time.time())
+        return len(calls)
+
+    assert a.get_or_load("opstruct:k", loader, TTL, STALE) == 1
+    assert b.get_or_load("opstruct:k", loader, TTL, STALE) == 1
+    assert len(calls) == 1
+
+    for expiry in range(2, 5):
+        time.sleep(TTL + 0.05)
+        a.get_or_load("opstruct:k", loader, TTL, STALE)   # stale: A revalidates in the background
+        _settle(a)
+        # B's L1 copy is stale too, but A's refresh is already in the shared tier
+        assert b.get_or_load("opstruct:k", loader, TTL, STALE) == expiry
+        _settle(b)
+        assert len(calls) == expiry
+
+
+def test_revalidate_adopts_a_fresher_shared_value(tmp_path):
+    a, b = _replicas(tmp_path)
+    calls = []
+
+    def loader():
+        calls.append(time.time())
+        return len(calls)
+
+    a.get_or_load("opstruct:k", loader, TTL, STALE)
+    b.get_or_load("opstruct:k", loader, TTL, STALE)
+    time.sleep(TTL + 0.05)
+    a._revalidate("opstruct:k", loader, TTL, STALE, "default")
+    _settle(a)
+    # B revalidates from its stale L1 copy after A released the lease
+    b._revalidate("opstruct:k", loader, TTL, STALE, "default")
+    _settle(b)
+    assert len(calls) == 2
+    assert b.local.get("opstruct:k")[0] == 2
@@ -0,0 +1,233 @@
+import os
+import time
+import random
+import threading
+
+import telemetry
+
+# --- CONFIGURATION ---
+# Per-upstream policy: sustained requests/sec, burst, concurrent calls in flight.
+# Buckets are per process: N processes (replicas, `service.py batch` workers) send
+# up to N x rate together, so set OPSTRUCT_YAHOO_RPS to each process's share.
+UPSTREAMS = {
+    "yahoo": {"rate": float(os.environ.get("OPSTRUCT_YAHOO_RPS", 20.0)), "burst": 20, "concurrency": 8},
+    "nasdaqtrader": {"rate": 0.5, "burst": 2, "concurrency": 1},
+}
+RETRIES = 4               # Attempts after the first one for retryable failures
+BACKOFF_BASE = 0.5        # Seconds; full jitter over base * 2**attempt
+BACKOFF_MAX = 20.0
+BREAKER_FAILURES = 5      # Consecutive retryable failures that open the circuit
+BREAKER_RESET = 60.0      # Seconds open before a single half-open probe is allowed
+ACQUIRE_TIMEOUT = 30.0    # Longest a caller queues for a token/slot before giving up
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailable(Exception):
+    """ Circuit open or queueing timed out; callers degrade instead of hammering upstream. """
+
+
+class TokenBucket:
+    """ Blocking token bucket: `rate` tokens/sec, at most `burst` banked. """
+
+    def __init__(self, rate, burst):
+        self.rate, self.burst = rate, burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout=ACQUIRE_TIMEOUT):
+        """ Returns seconds waited; raises UpstreamUnavailable past timeout. """
+        deadline = time.monotonic() + timeout
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                need = (1 - self.tokens) / self.rate
+            if now + need > deadline:
+                raise UpstreamUnavailable("rate limit queue timeout")
+            time.sleep(need)
+            waited += need
+
+
+class CircuitBreaker:
+    """ closed -> open after N consecutive failures -> half-open probe after `reset` seconds. """
+
+    def __init__(self, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.threshold, self.reset = failures, reset
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset else "open"
+
+    def allow(self):
+        with self.lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def abandon(self):
+        """ A let-through call that never reached upstream: frees the half-open probe slot. """
+        with self.lock:
+            self.probing = False
+
+    def success(self):
+        with self.lock:
+            self.failures, self.opened_at, self.probing = 0, None, False
+
+    def failure(self):
+        """ Returns True if this failure opened the circuit. """
+        with self.lock:
+            self.failures += 1
+            reopen = self.probing or (self.opened_at is None and self.failures >= self.threshold)
+            self.probing = False
+            if reopen:
+                self.opened_at = time.monotonic()
+            return reopen
+
+
+def retryable(exc):
+    """ Throttling, transport errors and 5xx are retried; bad symbols, missing chains etc. are not. """
+    if isinstance(exc, (ConnectionError, TimeoutError)):
+        return True
+    name = type(exc).__name__
+    if "RateLimit" in name or "Timeout" in name or "ConnectionError" in name:
+        return True
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status in RETRY_STATUS:
+        return True
+    msg = str(exc)
+    return "Too Many Requests" in msg or "429" in msg
+
+
+class Upstream:
+    """
+    Outbound gateway for one service: token bucket, bounded concurrency,
+    jittered exponential backoff and a circuit breaker, with telemetry.
+
+        upstream.get("yahoo").call(yf.Ticker("SPY").option_chain, "2026-11-20")
+    """
+
+    def __init__(self, name, rate, burst, concurrency, retries=RETRIES):
+        self.name = name
+        self.bucket = TokenBucket(rate, burst)
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.breaker = CircuitBreaker()
+        self.retries = retries
+        telemetry.gauge(f'upstream_circuit_open{{upstream="{name}"}}', lambda: self.breaker.state != "closed")
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            if not self.breaker.allow():
+                telemetry.count("upstream_rejected", upstream=self.name)
+                raise UpstreamUnavailable(f"{self.name} circuit open")
+            settled = False   # Every exit after allow() must settle the breaker (or free the probe)
+            try:
+                waited = self.bucket.acquire()
+                if waited > 0:
+                    telemetry.count("upstream_throttled", upstream=self.name)
+                    telemetry.count("upstream_throttle_seconds", waited, upstream=self.name)
+                if not self.slots.acquire(timeout=ACQUIRE_TIMEOUT):
+                    raise UpstreamUnavailable(f"{self.name} concurrency queue timeout")
+                try:
+                    with telemetry.span(f"upstream.{self.name}.call", attempt=attempt):
+                        result = fn(*args, **kwargs)
+                except Exception as e:
+                    settled = True
+                    if not retryable(e):
+                        self.breaker.success()   # Upstream answered; the request itself was bad
+                        raise
+                    telemetry.count("upstream_failures", upstream=self.name, error=type(e).__name__)
+                    if self.breaker.failure():
+                        telemetry.count("upstream_breaker_opened", upstream=self.name)
+                    if attempt == self.retries:
+                        raise
+                else:
+                    settled = True
+                    self.breaker.success()
+                    return result
+                finally:
+                    self.slots.release()
+            finally:
+                if not settled:
+                    self.breaker.abandon()
+            telemetry.count("upstream_retries", upstream=self.name)
+            time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)))
+
+
+_upstreams = {}
+_lock = threading.Lock()
+_session = None
+
+
+def get(name):
+    """ Process-wide Upstream per name (policy from UPSTREAMS). """
+    with _lock:
+        if name not in _upstreams:
+            _upstreams[name] = Upstream(name, **UPSTREAMS[name])
+        return _upstreams[name]
+
+
+def share(n):
+    """
+    Makes this process one of n splitting the configured rates (e.g. a
+    process-pool initializer), so the pool as a whole keeps to UPSTREAMS.
+    """
+    with _lock:
+        for name, policy in UPSTREAMS.items():
+            policy["rate"] = policy["rate"] / n
+            policy["burst"] = max(1, policy["burst"] // n)
+            if name in _upstreams:   # Inherited across fork
+                _upstreams[name].bucket.rate = policy["rate"]
+                _upstreams[name].bucket.burst = policy["burst"]
+
+
+def session():
+    """
+    One pooled keep-alive HTTP session for all outbound calls. Prefers
+    curl_cffi (what current yfinance requires for Yahoo), else requests
+    with a sized connection pool.
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            try:
+                from curl_cffi import requests as curl_requests
+                _session = curl_requests.Session(impersonate="chrome")
+            except ImportError:
+                import requests
+                from requests.adapters import HTTPAdapter
+                _session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=0)
+                _session.mount("https://", adapter)
+                _session.mount("http://", adapter)
+                _session.headers["User-Agent"] = "Mozilla/5.0"
+        return _session
+
+
+def yf_ticker(symbol):
+    """ yf.Ticker on the shared session (older yfinance builds may reject it; then its own). """
+    import yfinance as yf
+    try:
+        return yf.Ticker(symbol, session=session())
+    except Exception:
+        return yf.Ticker(symbol)
+
+
+def yahoo(fn, *args, **kwargs):
+    """ Shorthand: fn(*args, **kwargs) through the Yahoo gateway. """
+    return get("yahoo").call(fn, *args, **kwargs)
@@ -0,0 +1,288 @@
+import os
+import time
+import numpy as np
+
+import cache_backend
+import telemetry
+
+# --- CONFIGURATION ---
+MIN_POINTS = 5                           # Quotes needed to calibrate an expiry
+M_STEPS, S_STEPS = 15, 14                # Coarse (m, sigma) grid per expiry; (a, b, rho) are solved exactly
+SIGMA_RANGE = (0.005, 1.0)
+REFINE_STEPS, REFINE_ROUNDS = 7, 3       # Finer grids around the running optimum
+MAX_WING = 2.0                           # Roger Lee bound on the total-variance wing slope b(1+|rho|)
+K_GRID = np.linspace(-1.5, 1.5, 61)      # Log-moneyness grid for the arbitrage checks
+SURFACE_TTL = int(os.environ.get("OPSTRUCT_SURFACE_TTL", 900))   # Seconds a ticker's fit is reused
+
+
+def svi(params, k):
+    """ Raw SVI total variance w(k) = a + b(rho(k - m) + sqrt((k - m)^2 + sigma^2)); params [..., 5] """
+    a, b, rho, m, s = (params[..., i] for i in range(5))
+    x = k - m
+    return a + b * (rho * x + np.sqrt(x * x + s * s))
+
+
+def _butterfly(params, k):
+    """ Gatheral's density condition g(k) (>= 0 means no butterfly arbitrage); params [..., 5] -> [..., len(k)] """
+    a, b, rho, m, s = (params[..., i, None] for i in range(5))
+    x = k - m
+    root = np.sqrt(x * x + s * s)
+    w = a + b * (rho * x + root)
+    w1 = b * (rho + x / root)
+    w2 = b * s * s / root ** 3
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (1 - k * w1 / (2 * w)) ** 2 - w1 * w1 / 4 * (1 / w + 0.25) + w2 / 2
+
+
+# ==================================================
+#                  CALIBRATION
+# ==================================================
+def _solve(k, w, wt, m, s):
+    """
+    Quasi-explicit SVI step for every (expiry, candidate): with (m, sigma)
+    fixed, w is linear in (a, b*rho, b), so each candidate is one weighted
+    3x3 normal-equation solve, projected onto b >= 0, |rho| < 1, the Lee
+    wing bound and non-negative minimum variance. Candidates with butterfly
+    arbitrage on K_GRID are ranked behind every arbitrage-free one.
+    k, w, wt: [n_e, n_k]; m, s: [n_e, n_c]. Returns (params [n_e, n_c, 5], sse [n_e, n_c]).
+    """
+    # Every weighted moment is closed form in m except those of the root term,
+    # which come from one batched matmul over the strikes
+    root = np.sqrt((k[:, None, :] - m[..., None]) ** 2 + (s * s)[..., None])
+    Wk = wt[..., None] * np.stack([np.ones_like(k), k, w], axis=-1)          # [n_e, n_k, 3]
+    R = root @ Wk                                                            # [n_e, n_c, 3]
+    M = Wk.sum(1)[:, None, :]                                                # sum W, W k, W w
+    Mk = (Wk * k[..., None]).sum(1)[:, None, :]                              # sum W k, W k^2, W k w
+    S0, Sy, Syy = M[..., 0], M[..., 2], (wt * w * w).sum(1)[:, None]
+    S1 = M[..., 1] - m * S0
+    S11 = Mk[..., 1] - 2 * m * M[..., 1] + m * m * S0
+    S1y = Mk[..., 2] - m * Sy
+    S2, S12, S2y = R[..., 0], R[..., 1] - m * R[..., 0], R[..., 2]
+    S22 = S11 + s * s * S0
+    S0, Sy = np.broadcast_to(S0, m.shape), np.broadcast_to(Sy, m.shape)
+
+    A = np.stack([np.stack([S0, S1, S2], -1), np.stack([S1, S11, S12], -1), np.stack([S2, S12, S22], -1)], -2)
+    rhs = np.stack([Sy, S1y, S2y], -1)
+    A += np.eye(3) * 1e-12
+    beta = np.linalg.solve(A, rhs[..., None])[..., 0]
+
+    b = np.maximum(beta[..., 2], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rho = np.clip(np.where(b > 0, beta[..., 1] / b, 0.0), -0.999, 0.999)
+    b = np.minimum(b, MAX_WING / (1 + np.abs(rho)))
+    # a re-solved for the projected (b, rho), then floored so min variance >= 0
+    a = (Sy - b * rho * S1 - b * S2) / S0
+    a = np.maximum(a, -b * s * np.sqrt(1 - rho * rho))
+    c = b * rho
+    sse = (a * a * S0 + c * c * S11 + b * b * S22 + Syy + 2 * (a * c * S1 + a * b * S2 + c * b * S12)
+           - 2 * (a * Sy + c * S1y + b * S2y))
+    params = np.stack([a, b, rho, m, s], axis=-1)
+    arb = (_butterfly(params, K_GRID) < -1e-9).any(-1)
+    return params, sse + arb * 1e6
+
+
+def _calibrate(k, w, wt):
+    """ Best raw-SVI parameters per expiry row: coarse (m, sigma) grid, then shrinking grids around the optimum. """
+    n_e = len(k)
+    lo = np.where(wt > 0, k, np.inf).min(1)
+    hi = np.where(wt > 0, k, -np.inf).max(1)
+    m_axis = lo[:, None] + (hi - lo)[:, None] * np.linspace(0, 1, M_STEPS)
+    s_axis = np.geomspace(*SIGMA_RANGE, S_STEPS)
+    m = np.repeat(m_axis, S_STEPS, axis=1)
+    s = np.tile(s_axis, (n_e, M_STEPS))
+    params, sse = _solve(k, w, wt, m, s)
+    best = params[np.arange(n_e), sse.argmin(1)]
+
+    dm = (hi - lo) / (M_STEPS - 1)
+    ds = np.log(SIGMA_RANGE[1] / SIGMA_RANGE[0]) / (S_STEPS - 1)
+    u = np.linspace(-1, 1, REFINE_STEPS)
+    for _ in range(REFINE_ROUNDS):
+        m = np.repeat(best[:, 3, None] + dm[:, None] * u, REFINE_STEPS, axis=1)
+        s = np.tile(best[:, 4, None] * np.exp(ds * u), (1, REFINE_STEPS))
+        params, sse = _solve(k, w, wt, m, s)
+        best = params[np.arange(n_e), sse.argmin(1)]
+        dm, ds = dm / 3, ds / 3
+    return best
+
+
+def _repair_butterfly(params, iters=10):
+    """ Shrinks b on slices with negative density, holding ATM total variance fixed. """
+    params = params.copy()
+    for _ in range(iters):
+        bad = (_butterfly(params, K_GRID) < -1e-9).any(1)
+        if not bad.any():
+            break
+        p = params[bad]
+        atm = svi(p, 0.0)
+        p[:, 1] *= 0.8
+        p[:, 0] += atm - svi(p, 0.0)
+        params[bad] = p
+    return params
+
+
+def _repair_calendar(params, span):
+    """
+    Lifts each slice (sorted by T) so total variance never decreases with
+    maturity across the quoted log-moneyness of it and its predecessor
+    (span [n_e, 2]); far-wing extrapolations are not allowed to shift the fit.
+    """
+    params = params.copy()
+    for j in range(1, len(params)):
+        k = np.linspace(min(span[j - 1, 0], span[j, 0]), max(span[j - 1, 1], span[j, 1]), 41)
+        lift = np.max(svi(params[j - 1], k) - svi(params[j], k))
+        if lift > 0:
+            params[j, 0] += lift
+    return params
+
+
+# ==================================================
+#                  SURFACE
+# ==================================================
+class SVISurface:
+    """
+    Arbitrage-checked implied-vol surface for one underlying: a raw-SVI
+    smile per expiry in forward log-moneyness, total variance interpolated
+    linearly in T between expiries (flat vol outside). iv() costs a
+    searchsorted plus two closed-form smiles per point.
+
+        surf = SVISurface.from_quotes(strikes, T, r, iv, spot, expiries)
+        surf.iv(K, T)                  # any strike / maturity, vectorized
+        surf.iv(K, T, spot=S * 0.9)    # sticky-moneyness under a spot move
+    """
+
+    def __init__(self, expiries, T, rT, params, spot, span):
+        self.expiries = tuple(expiries)
+        self.T = np.asarray(T, dtype=float)          # Years, ascending
+        self.rT = np.asarray(rT, dtype=float)        # r(T) * T: log forward drift per expiry
+        self.span = np.asarray(span, dtype=float)    # Quoted log-moneyness range per expiry
+        self.params = _repair_calendar(_repair_butterfly(np.asarray(params, dtype=float)), self.span)
+        self.spot = float(spot)
+
+    def __len__(self):
+        return len(self.T)
+
+    @property
+    def nbytes(self):
+        return self.T.nbytes + self.rT.nbytes + self.params.nbytes + self.span.nbytes
+
+    @property
+    def butterfly_ok(self):
+        return (_butterfly(self.params, K_GRID) >= -1e-9).all(1)
+
+    @classmethod
+    @telemetry.traced("vol_surface.fit")
+    def fit(cls, strikes, T, iv, spot, r, expiries=None, weights=None, min_points=MIN_POINTS):
+        """
+        Calibrates one smile per expiry column. strikes [n_k]; T, r [n_e];
+        iv [n_k, n_e] with NaN where there is no usable quote (OTM side only is
+        best). Weights default to forward vega, so wings count less than ATM.
+        None if no expiry has min_points quotes.
+        """
+        strikes, T = np.asarray(strikes, dtype=float), np.asarray(T, dtype=float)
+        r = np.broadcast_to(np.asarray(r, dtype=float), T.shape)
+        iv = np.asarray(iv, dtype=float).reshape(len(strikes), len(T))
+        k = np.log(strikes[None, :] / (spot * np.exp(r * T)[:, None]))       # [n_e, n_k]
+        ok = np.isfinite(iv.T) & (iv.T > 0)
+        w = np.where(ok, iv.T, 0.0) ** 2 * T[:, None]
+        if weights is None:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                d1 = (-k + 0.5 * w) / np.sqrt(w)
+            weights = np.exp(-0.5 * d1 * d1) * np.sqrt(T)[:, None]
+        else:
+            weights = np.asarray(weights, dtype=float).reshape(len(strikes), len(T)).T
+        wt = np.where(ok, np.nan_to_num(weights), 0.0)
+        keep = (ok.sum(1) >= min_points) & (wt.sum(1) > 0)
+        if not keep.any():
+            return None
+        wt = wt[keep] / wt[keep].sum(1, keepdims=True)
+        k, ok = np.where(ok[keep], k[keep], 0.0), ok[keep]
+        params = _calibrate(k, w[keep], wt)
+        # Calendar checks cover the strikes that carry weight, not stray far-wing prints
+        live = wt > 0.01 * wt.max(1, keepdims=True)
+        span = np.c_[np.where(live, k, np.inf).min(1), np.where(live, k, -np.inf).max(1)]
+        order = np.argsort(T[keep])
+        labels = np.asarray(expiries if expiries is not None else T, dtype=object)[keep][order]
+        return cls(labels, T[keep][order], (r * T)[keep][order], params[order], spot, span[order])
+
+    @classmethod
+    def from_quotes(cls, strikes, T, r, iv, spot, expiries=None):
+        """
+        Fit from packed call/put vols iv [2, n_k, n_e] (axis 0 = call, put; NaN
+        where the solver did not converge): the OTM side per strike (puts below
+        the forward, calls above), the other side where that one is missing.
+        """
+        T = np.asarray(T, dtype=float)
+        r = np.broadcast_to(np.asarray(r, dtype=float), T.shape)
+        otm_put = np.asarray(strikes, dtype=float)[:, None] < spot * np.exp(r * T)[None, :]
+        first = np.where(otm_put, iv[1], iv[0])
+        other = np.where(otm_put, iv[0], iv[1])
+        return cls.fit(strikes, T, np.where(np.isfinite(first), first, other), spot, r, expiries=expiries)
+
+    def total_variance(self, K, T, spot=None):
+        """ w(K, T); spot moves the forward (sticky moneyness). """
+        K, T = np.broadcast_arrays(np.asarray(K, dtype=float), np.maximum(np.asarray(T, dtype=float), 1e-4))
+        spot = self.spot if spot is None else np.asarray(spot, dtype=float)
+        drift = np.interp(T, self.T, self.rT / self.T) * T
+        k = np.log(K / spot) - drift
+        n = len(self.T)
+        hi = np.clip(np.searchsorted(self.T, T), 0, n - 1)
+        lo = np.where(T > self.T[-1], n - 1, np.maximum(hi - 1, 0))
+        hi = np.where(T <= self.T[0], 0, hi)
+        w_lo, w_hi = svi(self.params[lo], k), svi(self.params[hi], k)
+        t_lo, t_hi = self.T[lo], self.T[hi]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            alpha = np.where(hi > lo, (T - t_lo) / (t_hi - t_lo), 0.0)
+        # Inside: linear in total variance; outside: the end smile at constant vol
+        return np.where(hi > lo, w_lo + alpha * (w_hi - w_lo), w_lo * T / t_lo)
+
+    def iv(self, K, T, spot=None):
+        """ Implied vol (decimal) for any strike(s) / maturity(ies), broadcast. """
+        T = np.maximum(np.asarray(T, dtype=float), 1e-4)
+        return np.sqrt(np.maximum(self.total_variance(K, T, spot), 0.0) / T)
+
+    def merge(self, other):
+        """
+        This surface's slices plus other's, other winning on shared expiries.
+        Kept slices are re-expressed against other's forward (m and span shift
+        by log(S_new / S_old)), so their vol at a given strike is unchanged.
+        """
+        mine = {e: i for i, e in enumerate(self.expiries) if e not in set(other.expiries)}
+        idx = list(mine.values())
+        shift = np.log(other.spot / self.spot)
+        params, span = self.params[idx].copy(), self.span[idx] - shift
+        params[:, 3] -= shift
+        T = np.r_[self.T[idx], other.T]
+        order = np.argsort(T, kind='stable')
+        pick = lambda a, b: np.concatenate([a, b])[order]
+        expiries = np.asarray(list(mine) + list(other.expiries), dtype=object)[order]
+        return SVISurface(expiries, T[order], pick(self.rT[idx], other.rT), pick(params, other.params), other.spot,
+                          pick(span, other.span))
+
+    def __repr__(self):
+        return f"SVISurface({len(self)} expiries, spot={self.spot:g})"
+
+
+# ==================================================
+#                  PER-TICKER CACHE
+# ==================================================
+def _key(ticker):
+    return f"opstruct:vol_surface:{ticker.upper()}"
+
+
+def get_surface(ticker, ttl=SURFACE_TTL):
+    """ The last fitted surface for ticker if younger than ttl, else None. """
+    hit = cache_backend.get_cache().peek(_key(ticker))
+    if hit is None or time.time() - hit[1] > ttl:
+        return None
+    return hit[0]
+
+
+def put_surface(ticker, surface, ttl=SURFACE_TTL):
+    """ Caches a fit for ticker, merged over any live fit of other expiries. """
+    if surface is None:
+        return None
+    prev = get_surface(ticker, ttl)
+    if prev is not None:
+        surface = prev.merge(surface)
+    cache_backend.get_cache().put(_key(ticker), surface, ttl)
+    return surface
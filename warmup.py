@@ -0,0 +1,189 @@
+"""
+Replica warm-up: load the heavy modules, compile the JIT kernels and fill
+the shared caches before a process (or host) takes traffic.
+
+    python warmup.py                  # warm, exit 0 when done (container start / readiness gate)
+    python warmup.py --offline        # imports + kernel compilation only, no network
+    python warmup.py --profile        # plus a cold import-time breakdown (python -X importtime)
+
+Run as a separate process it fills what outlives it: numba's on-disk
+kernel cache, the shared cache tier (rate curve, expiries, option chains)
+and the bar store. Inside the app, start() runs the same steps on a daemon
+thread the first time a session loads, so the Terminal's first request
+finds the modules imported and the kernels compiled.
+"""
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+import subprocess
+
+import telemetry
+
+# --- CONFIGURATION ---
+ENABLED = os.environ.get("OPSTRUCT_WARMUP", "1") != "0"          # In-app background warm-up
+WARM_TICKERS = ("SPY", "QQQ")                                     # Expiries + front chain primed
+# The app's analytics stack, heaviest first; what the Terminal/War Room/Book pages import
+HEAVY_MODULES = ("pandas", "scipy.special", "pricing_kernels", "plotly.graph_objects", "yfinance",
+                 "quant_engine", "vol_surface", "scenario_engine", "monte_carlo", "strategy_optimizer",
+                 "market_utils", "portfolio", "chain_store", "symbol_index", "service")
+
+_started = False
+_lock = threading.Lock()
+
+
+def _step(report, name, fn):
+    t = time.perf_counter()
+    try:
+        with telemetry.span(f"warmup.{name}"):
+            fn()
+        status = "ok"
+    except ImportError as e:
+        status = f"missing ({e.name})"
+    except Exception as e:
+        status = f"failed ({type(e).__name__}: {e})"
+    report.append((name, (time.perf_counter() - t) * 1000, status))
+
+
+def _compile_kernels():
+    import numpy as np
+    from pricing_kernels import bsm, JIT_ENABLED, JIT_MIN_SIZE
+    n = JIT_MIN_SIZE
+    for dtype in (np.float64, np.float32):
+        bsm(np.full(n, 100.0), np.linspace(50, 150, n), 0.1, 0.04, 0.2, True, dtype=dtype,
+            backend='numba' if JIT_ENABLED else 'numpy')
+
+
+def _engine_paths():
+    """ One tiny pass through the solver, surface fit and lattice (first-call overheads, no network). """
+    import numpy as np
+    import pandas as pd
+    import american
+    from quant_engine import VectorizedQuantEngine
+    from rate_curve import RateCurve
+    from pricing_kernels import bsm_price
+    eng = VectorizedQuantEngine(curve=RateCurve.flat(0.04))
+    K = np.linspace(80, 120, 21)
+    side = lambda px: pd.DataFrame({"strike": K, "bid": px * 0.99, "ask": px * 1.01, "lastPrice": px,
+                                    "impliedVolatility": 0.25})
+    expiry = time.strftime("%Y-%m-%d", time.localtime(time.time() + 30 * 86400))
+    chains = {expiry: tuple(side(bsm_price(100.0, K, 30 / 365.0, 0.04, 0.25, c)) for c in (True, False))}
+    eng.calculate_surface_greeks(chains, 100.0)
+    american.price(100.0, K, 0.25, 0.04, 0.25, False, steps=10)
+
+
+def _market_caches(tickers):
+    import rate_curve
+    import market_utils
+    import service
+    rate_curve.get_rate_curve()
+    market_utils.get_macro_pulse()
+    market_utils.get_market_regime()
+    for t in tickers:
+        exps = service.list_expiries(t)
+        if exps:
+            service.terminal_chain(t, exps[0])   # Dividends, bars and the fitted smile
+
+
+def run(offline=False, tickers=WARM_TICKERS):
+    """
+    Every warm-up step in order; [(step, ms, status)]. Failures are reported,
+    not raised: a replica with a dead upstream should still come up cold.
+    """
+    import importlib
+    report = []
+    with telemetry.span("warmup"):
+        for mod in HEAVY_MODULES:
+            _step(report, f"import.{mod}", lambda mod=mod: importlib.import_module(mod))
+        _step(report, "jit.bsm", _compile_kernels)
+        _step(report, "engine", _engine_paths)
+        _step(report, "symbol_index", lambda: __import__("symbol_index").get_index())
+        if not offline:
+            _step(report, "market", lambda: _market_caches(tickers))
+    return report
+
+
+def _background(offline, prefetch):
+    if ENABLED:
+        run(offline)
+    if prefetch:
+        import prefetch as scheduler   # Imported here so page loads never pay for it
+        scheduler.start()
+
+
+def start(offline=False, prefetch=False):
+    """
+    Runs the warm-up once per process on a daemon thread (no-op when disabled
+    or already started); prefetch=True then starts prefetch.py's scheduler,
+    which has its own switch (OPSTRUCT_PREFETCH).
+    """
+    global _started
+    with _lock:
+        if _started or not (ENABLED or prefetch):
+            return False
+        _started = True
+    threading.Thread(target=_background, args=(offline, prefetch), daemon=True, name="warmup").start()
+    return True
+
+
+# ==================================================
+#                  IMPORT PROFILE
+# ==================================================
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile(modules=HEAVY_MODULES, min_ms=5.0, max_depth=2):
+    """
+    Cold import cost from a fresh interpreter (python -X importtime) as a tree:
+    [(module, self_ms, cumulative_ms, children)] heaviest first, keeping nodes
+    of at least min_ms down to max_depth, so nested heavyweights (numba under
+    pricing_kernels, scipy under strategy_optimizer) show where the time goes.
+    """
+    # Each module in its own try so a missing optional one does not hide the rest
+    code = "\n".join(f"try:\n    import {m}\nexcept ImportError:\n    pass" for m in modules)
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    # importtime prints children before their parent: collect them per depth until it arrives
+    pending = {}
+    for line in proc.stderr.splitlines():
+        m = _IMPORT_LINE.match(line)
+        if not m:
+            continue
+        depth = (len(m.group(3)) - 1) // 2
+        kids = pending.pop(depth + 1, [])
+        pending.setdefault(depth, []).append((m.group(4), int(m.group(1)) / 1000, int(m.group(2)) / 1000, kids))
+
+    def prune(nodes, depth):
+        keep = [n for n in nodes if n[2] >= min_ms]
+        return sorted(((name, s, c, prune(k, depth + 1) if depth < max_depth else []) for name, s, c, k in keep),
+                      key=lambda n: -n[2])
+    return prune(pending.get(0, []), 0)
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="OpStruct replica warm-up")
+    ap.add_argument("--offline", action="store_true", help="imports and kernel compilation only")
+    ap.add_argument("--tickers", default=",".join(WARM_TICKERS), help="symbols whose expiries/front chain are primed")
+    ap.add_argument("--profile", action="store_true", help="print a cold import-time breakdown first")
+    args = ap.parse_args(argv)
+
+    if args.profile:
+        def show(nodes, depth=0):
+            for mod, self_ms, cum_ms, kids in nodes:
+                print(f"{'  ' * depth + mod:<48} {self_ms:9.1f} {cum_ms:9.1f}")
+                show(kids, depth + 1)
+        print(f"{'module':<48} {'self ms':>9} {'cum ms':>9}")
+        show(import_profile())
+        print()
+    t = time.perf_counter()
+    report = run(args.offline, tuple(s.strip().upper() for s in args.tickers.split(",") if s.strip()))
+    for step, ms, status in report:
+        print(f"{step:<40} {ms:9.1f} ms  {status}")
+    print(f"warm in {(time.perf_counter() - t):.2f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())